@@ -0,0 +1,184 @@
+"""
+Time-bucketed aggregates of okte_data computed inside SQLite.
+
+Only one row per bucket (and metric) ever leaves the database. When the tile
+pyramid is populated its hourly level is used as the source: one row per
+metric and hour, i.e. 3 rows where the raw table has 4 wider ones, and no
+per-row parsing of datum and period.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app import db
+from app.models import METRIC_COLUMNS
+from app.series import PERIOD_MINUTES_SQL, as_date
+from app.stats import get_stats
+from app.tiles import STORED_MIN_LEVEL, bucket_ms
+
+INTERVALS = ('hour', 'day', 'week', 'month')
+STATS = ('sum', 'mean', 'min', 'max', 'count')
+SOURCES = ('auto', 'raw', 'rollup')
+
+_DAY = "substr(datum, 1, 10)"
+
+# Bucket start label per interval, computed from raw okte_data rows
+RAW_BUCKETS = {
+    'hour': f"{_DAY} || printf('T%02d:00', {PERIOD_MINUTES_SQL} / 60)",
+    'day': _DAY,
+    'week': f"date({_DAY}, 'weekday 0', '-6 days')",
+    'month': f"substr(datum, 1, 7) || '-01'",
+}
+
+# The same labels computed from okte_pyramid buckets of the hourly level
+_HOUR_START = f"bucket * {bucket_ms(STORED_MIN_LEVEL) // 1000}, 'unixepoch'"
+ROLLUP_BUCKETS = {
+    'hour': f"strftime('%Y-%m-%dT%H:00', {_HOUR_START})",
+    'day': f"date({_HOUR_START})",
+    'week': f"date({_HOUR_START}, 'weekday 0', '-6 days')",
+    'month': f"strftime('%Y-%m-01', {_HOUR_START})",
+}
+
+
+def rollup_available(start_day=None, end_day=None):
+    """
+    True when the hourly pyramid level spans every stored day of
+    start_day..end_day (inclusive, None for open ends). A database upgraded
+    with rows already in place only has a pyramid for the days ingested
+    since, until `flask edc compact` rebuilds it.
+    """
+    stats = get_stats()
+    if not stats or not stats['days']:
+        return False
+    first, last = as_date(stats['first_day']), as_date(stats['last_day'])
+    if start_day is not None:
+        first = max(first, as_date(start_day))
+    if end_day is not None:
+        last = min(last, as_date(end_day))
+    if first > last:
+        return False
+    # One metric stands for all of them: the pyramid is built for every metric at once
+    low, high = db.session.execute(text(
+        "SELECT MIN(bucket), MAX(bucket) FROM okte_pyramid WHERE level = :level AND metric = :metric"
+    ), {'level': STORED_MIN_LEVEL, 'metric': METRIC_COLUMNS[0]}).fetchone()
+    if low is None:
+        return False
+    width = bucket_ms(STORED_MIN_LEVEL)
+    epoch = date(1970, 1, 1)
+    return (epoch + timedelta(milliseconds=low * width) <= first
+            and epoch + timedelta(milliseconds=high * width) >= last)
+
+
+def _epoch_seconds(value):
+    # Timestamps are naive wall-clock times, encoded as if they were UTC
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def _aggregate_raw(interval, start, end, metrics):
+    clauses, params = [], {}
+    if start is not None:
+        clauses.append("datum >= :start_day")
+        params['start_day'] = start.strftime('%Y-%m-%d')
+    if end is not None:
+        clauses.append("datum < :end_day")
+        params['end_day'] = end.strftime('%Y-%m-%d')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    selects = ', '.join(
+        f"SUM({m}), COUNT({m}), MIN({m}), MAX({m})" for m in metrics
+    )
+    sql = text(
+        f"SELECT {RAW_BUCKETS[interval]} AS bucket, {selects} "
+        f"FROM okte_data {where} GROUP BY bucket ORDER BY bucket"
+    )
+    rows = db.session.execute(sql, params).fetchall()
+
+    result = {'bucket': [row[0] for row in rows]}
+    for i, metric in enumerate(metrics):
+        offset = 1 + i * 4
+        result[metric] = {
+            'sum': [row[offset] for row in rows],
+            'count': [row[offset + 1] for row in rows],
+            'min': [row[offset + 2] for row in rows],
+            'max': [row[offset + 3] for row in rows],
+        }
+    return result
+
+
+def _aggregate_rollup(interval, start, end, metrics):
+    hour_s = bucket_ms(STORED_MIN_LEVEL) // 1000
+    clauses = ["level = :level", f"metric IN ({', '.join(f':m{i}' for i in range(len(metrics)))})"]
+    params = {'level': STORED_MIN_LEVEL}
+    params.update({f'm{i}': m for i, m in enumerate(metrics)})
+    if start is not None:
+        clauses.append("bucket >= :first_bucket")
+        params['first_bucket'] = int(_epoch_seconds(start)) // hour_s
+    if end is not None:
+        clauses.append("bucket < :last_bucket")
+        params['last_bucket'] = int(_epoch_seconds(end)) // hour_s
+    sql = text(
+        f"SELECT {ROLLUP_BUCKETS[interval]} AS label, metric, SUM(sum), SUM(count), MIN(min), MAX(max) "
+        f"FROM okte_pyramid WHERE {' AND '.join(clauses)} GROUP BY label, metric ORDER BY label"
+    )
+    rows = db.session.execute(sql, params).fetchall()
+
+    labels = sorted({row[0] for row in rows})
+    position = {label: i for i, label in enumerate(labels)}
+    result = {'bucket': labels}
+    for metric in metrics:
+        result[metric] = {
+            'sum': [None] * len(labels),
+            'count': [0] * len(labels),
+            'min': [None] * len(labels),
+            'max': [None] * len(labels),
+        }
+    for label, metric, total, count, low, high in rows:
+        i = position[label]
+        columns = result[metric]
+        columns['sum'][i], columns['count'][i], columns['min'][i], columns['max'][i] = total, count, low, high
+    return result
+
+
+def aggregate(interval, start=None, end=None, metrics=None, stats=None, source='auto'):
+    """
+    Aggregate okte_data metrics into hour/day/week/month buckets.
+
+    `start` and `end` are datetimes at day boundaries, end exclusive. Returns a
+    columnar dict: 'bucket' holds the bucket start labels (weeks start on
+    Monday) and each metric maps to one list per requested statistic.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Interval must be one of: {', '.join(INTERVALS)}")
+    if source not in SOURCES:
+        raise ValueError(f"Source must be one of: {', '.join(SOURCES)}")
+    metrics = list(metrics or METRIC_COLUMNS)
+    stats = list(stats or STATS)
+    unknown = [s for s in stats if s not in STATS]
+    if unknown:
+        raise ValueError(f"Unknown statistic(s): {', '.join(unknown)}")
+
+    if source == 'auto':
+        # Hourly buckets map 1:1 onto the rollup, which then saves nothing
+        last = end - timedelta(days=1) if end is not None else None
+        source = 'rollup' if interval != 'hour' and rollup_available(start, last) else 'raw'
+    if source == 'rollup':
+        result = _aggregate_rollup(interval, start, end, metrics)
+    else:
+        result = _aggregate_raw(interval, start, end, metrics)
+
+    for metric in metrics:
+        columns = result[metric]
+        if 'mean' in stats:
+            columns['mean'] = [
+                total / count if count else None
+                for total, count in zip(columns['sum'], columns['count'])
+            ]
+        for key in list(columns):
+            if key not in stats:
+                del columns[key]
+        # SUM() over no values is NULL in SQL; an empty bucket sums to zero
+        if 'sum' in columns:
+            columns['sum'] = [0.0 if v is None else v for v in columns['sum']]
+
+    result['interval'] = interval
+    result['source'] = source
+    return result
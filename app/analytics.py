@@ -0,0 +1,181 @@
+"""
+Vectorised report statistics over the columnar read path.
+
+Rolling statistics, percentiles and load-duration curves are computed with
+NumPy on arrays from load_columns(). Results for closed ranges (see
+series.closed_horizon) are stored in okte_analytics_cache, so repeating a
+report for a past month is a single primary-key lookup.
+"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import db
+from app.models import EDCAnalyticsCache, METRIC_COLUMNS
+from app.series import load_columns, columns_to_json, data_bounds, closed_horizon, as_date
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_WINDOW_MINUTES = 24 * 60
+DEFAULT_CURVE_POINTS = 101
+
+
+def rolling_stats(columns, window_minutes=DEFAULT_WINDOW_MINUTES):
+    """
+    Trailing time-based rolling mean and standard deviation.
+
+    Each sample uses the values in (t - window, t]; gaps in the series shrink
+    the window rather than shifting it. Missing values are ignored.
+    """
+    t = columns['t']
+    lo = np.searchsorted(t, t - window_minutes * 60 * 1000, side='right')
+    hi = np.arange(1, len(t) + 1)
+    result = {'t': t}
+    for name, values in columns.items():
+        if name == 't':
+            continue
+        valid = ~np.isnan(values)
+        # Summing deviations from the series mean keeps E[x^2] - E[x]^2 from
+        # cancelling catastrophically when the values sit far from zero
+        shift = values[valid].mean() if valid.any() else 0.0
+        filled = np.where(valid, values - shift, 0.0)
+        sums = np.r_[0.0, np.cumsum(filled)]
+        squares = np.r_[0.0, np.cumsum(filled * filled)]
+        counts = np.r_[0, np.cumsum(valid)]
+
+        n = counts[hi] - counts[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[hi] - sums[lo]) / n
+            variance = (squares[hi] - squares[lo]) / n - mean * mean
+        result[f'{name}_mean'] = mean + shift
+        result[f'{name}_std'] = np.sqrt(np.maximum(variance, 0.0))
+    return result
+
+
+def percentiles(columns, q=DEFAULT_PERCENTILES):
+    """Percentiles of each metric, ignoring missing values."""
+    result = {'q': list(q)}
+    for name, values in columns.items():
+        if name == 't':
+            continue
+        present = values[~np.isnan(values)]
+        result[name] = np.percentile(present, q).tolist() if len(present) else [None] * len(q)
+    return result
+
+
+def duration_curve(columns, points=DEFAULT_CURVE_POINTS):
+    """
+    Load-duration curve of each metric: the value exceeded for a given share
+    of the periods, sampled at `points` evenly spaced exceedance percentages.
+    """
+    exceedance = np.linspace(0.0, 100.0, points)
+    result = {'exceedance_pct': exceedance.tolist()}
+    for name, values in columns.items():
+        if name == 't':
+            continue
+        ordered = np.sort(values[~np.isnan(values)])[::-1]
+        if not len(ordered):
+            result[name] = [None] * points
+            continue
+        position = np.linspace(0.0, 100.0, len(ordered)) if len(ordered) > 1 else np.zeros(1)
+        result[name] = np.interp(exceedance, position, ordered).tolist()
+    return result
+
+
+def _resolve_range(start_day, end_day):
+    if start_day is None or end_day is None:
+        first, last = data_bounds()
+        start_day = start_day or first
+        end_day = end_day or last
+    if start_day is None:
+        return None, None
+    return as_date(start_day), as_date(end_day)
+
+
+def _cached(kind, start_day, end_day, params, compute):
+    horizon = closed_horizon()
+    closed = horizon is not None and end_day < horizon
+    key = f"{kind}:{start_day}:{end_day}:{json.dumps(params, sort_keys=True)}"
+
+    if closed:
+        entry = db.session.get(EDCAnalyticsCache, key)
+        if entry is not None:
+            result = json.loads(entry.payload)
+            result['cached'] = True
+            return result
+
+    result = compute()
+    result.update({'start': start_day.isoformat(), 'end': end_day.isoformat(), 'closed': closed})
+    if closed:
+        db.session.merge(EDCAnalyticsCache(
+            key=key,
+            start_day=start_day.isoformat(),
+            end_day=end_day.isoformat(),
+            payload=json.dumps(result),
+        ))
+        db.session.commit()
+    result['cached'] = False
+    return result
+
+
+def _load(start_day, end_day, metrics):
+    return load_columns(
+        datetime.combine(start_day, datetime.min.time()),
+        datetime.combine(end_day + timedelta(days=1), datetime.min.time()),
+        metrics,
+    )
+
+
+def run_analysis(kind, start_day=None, end_day=None, metrics=None, **params):
+    """
+    Run one analysis over the inclusive day range, using the cache for
+    closed ranges. `kind` is 'rolling', 'percentiles', 'duration_curve' or
+    'report' (all three combined); extra keyword arguments are passed on.
+    """
+    if kind not in ANALYSES:
+        raise ValueError(f"Analysis must be one of: {', '.join(ANALYSES)}")
+    metrics = list(metrics or METRIC_COLUMNS)
+    start_day, end_day = _resolve_range(start_day, end_day)
+    if start_day is None:
+        return {'message': 'No data found in database'}
+    if end_day < start_day:
+        raise ValueError('End date must be after start date')
+
+    def compute():
+        return ANALYSES[kind](_load(start_day, end_day, metrics), **params)
+
+    params_key = dict(params, metrics=metrics)
+    return _cached(kind, start_day, end_day, params_key, compute)
+
+
+def _rolling(columns, window_minutes=DEFAULT_WINDOW_MINUTES):
+    result = columns_to_json(rolling_stats(columns, window_minutes))
+    result['window_minutes'] = window_minutes
+    return result
+
+
+def _report(columns, window_minutes=DEFAULT_WINDOW_MINUTES, q=DEFAULT_PERCENTILES,
+            points=DEFAULT_CURVE_POINTS):
+    return {
+        'periods': len(columns['t']),
+        'rolling': _rolling(columns, window_minutes),
+        'percentiles': percentiles(columns, q),
+        'duration_curve': duration_curve(columns, points),
+    }
+
+
+ANALYSES = {
+    'rolling': _rolling,
+    'percentiles': percentiles,
+    'duration_curve': duration_curve,
+    'report': _report,
+}
+
+
+def invalidate_cache(start_day, end_day):
+    """Drop cached results whose range overlaps the inclusive day range."""
+    EDCAnalyticsCache.query.filter(
+        EDCAnalyticsCache.start_day <= as_date(end_day).isoformat(),
+        EDCAnalyticsCache.end_day >= as_date(start_day).isoformat(),
+    ).delete(synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,217 @@
+from flask import Blueprint, request, jsonify
+from app.models import METRIC_COLUMNS
+from app.aggregate import aggregate
+from app.analytics import run_analysis
+from app.compare import compare_periods, same_window_in_years
+from app.series import (
+    load_columns, downsample_minmax, columns_to_json, data_bounds,
+    parse_datetime_arg, parse_metrics_arg,
+)
+from app.stats import completeness, get_stats
+from app.tiles import TILE_SIZE, MAX_LEVEL, bucket_ms, tile_span, load_tile, tile_is_closed
+from datetime import date
+import hashlib
+import logging
+
+api = Blueprint('api', __name__, url_prefix='/api')
+logger = logging.getLogger('app.api')
+
+MAX_SERIES_POINTS = 20000
+
+@api.route('/series')
+def series():
+    """
+    Columnar time series for charts.
+
+    Query parameters: start/end (ISO date or datetime, end exclusive unless a
+    bare date), metrics (comma separated column names) and points (maximum
+    number of samples; larger ranges are reduced to a min/max envelope).
+    """
+    try:
+        start = parse_datetime_arg(request.args.get('start'))
+        end = parse_datetime_arg(request.args.get('end'), end=True)
+        metrics = parse_metrics_arg(request.args.get('metrics'))
+        # Fewer than 2 points would disable the min/max reduction altogether
+        points = max(min(int(request.args.get('points', 2000)), MAX_SERIES_POINTS), 2)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+
+    try:
+        columns = load_columns(start, end, metrics)
+        rows = len(columns['t'])
+        columns = downsample_minmax(columns, points)
+        first_day, last_day = data_bounds()
+
+        result = {
+            'rows': rows,
+            'resolution': 'raw' if len(columns['t']) == rows else 'minmax',
+            'bounds': {'start': first_day, 'end': last_day},
+            'metrics': metrics,
+        }
+        result.update(columns_to_json(columns))
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error loading series: {str(e)}")
+        return jsonify({'message': f'Error loading series: {str(e)}'}), 500
+
+@api.route('/tiles')
+def tiles_info():
+    """Describe the tile pyramid so clients can pick a level for their zoom."""
+    first_day, last_day = data_bounds()
+    return jsonify({
+        'tile_size': TILE_SIZE,
+        'max_level': MAX_LEVEL,
+        'bucket_ms': [bucket_ms(level) for level in range(MAX_LEVEL + 1)],
+        'bounds': {'start': first_day, 'end': last_day},
+        'metrics': list(METRIC_COLUMNS),
+    })
+
+@api.route('/tiles/<int:level>/<int:index>')
+def tile(level, index):
+    """
+    One tile of min/max/mean buckets. Tiles of closed periods are cached
+    for an hour and open ones for a minute, then revalidated via ETag: even
+    complete days can be replaced (backfill --force, revisions, duplicates).
+    """
+    try:
+        metrics = parse_metrics_arg(request.args.get('metrics'))
+        data = load_tile(level, index, metrics)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error loading tile {level}/{index}: {str(e)}")
+        return jsonify({'message': f'Error loading tile: {str(e)}'}), 500
+
+    start, end = tile_span(level, index)
+    closed = tile_is_closed(level, index)
+    data.update({
+        'level': level,
+        'index': index,
+        'start': start,
+        'end': end,
+        'bucket_ms': bucket_ms(level),
+        'closed': closed,
+    })
+
+    response = jsonify(data)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600 if closed else 60
+    return response.make_conditional(request)
+
+@api.route('/aggregate')
+def aggregate_endpoint():
+    """
+    Time-bucketed statistics computed in SQL.
+
+    Query parameters: interval (hour|day|week|month), start/end (inclusive
+    YYYY-MM-DD), metrics, stats (comma separated subset of sum, mean, min,
+    max, count) and source (auto|raw|rollup).
+    """
+    try:
+        start = parse_datetime_arg(request.args.get('start'))
+        end = parse_datetime_arg(request.args.get('end'), end=True)
+        metrics = parse_metrics_arg(request.args.get('metrics'))
+        stats = [s for s in request.args.get('stats', '').split(',') if s] or None
+        result = aggregate(
+            request.args.get('interval', 'day'), start, end, metrics, stats,
+            source=request.args.get('source', 'auto'),
+        )
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error computing aggregate: {str(e)}")
+        return jsonify({'message': f'Error computing aggregate: {str(e)}'}), 500
+    return jsonify(result)
+
+@api.route('/analytics/<kind>')
+def analytics(kind):
+    """
+    Rolling statistics, percentiles, duration curves or all of them combined
+    ('report') for an inclusive day range. Closed ranges are served from cache.
+
+    Query parameters: start/end (YYYY-MM-DD), metrics, window (rolling
+    window in minutes), q (comma separated percentiles) and points (number
+    of duration curve samples).
+    """
+    kind = kind.replace('-', '_')
+    try:
+        params = {}
+        if kind in ('rolling', 'report') and request.args.get('window'):
+            params['window_minutes'] = int(request.args['window'])
+        if kind in ('percentiles', 'report') and request.args.get('q'):
+            params['q'] = [float(v) for v in request.args['q'].split(',')]
+        if kind in ('duration_curve', 'report') and request.args.get('points'):
+            params['points'] = max(min(int(request.args['points']), MAX_SERIES_POINTS), 2)
+        result = run_analysis(
+            kind,
+            request.args.get('start') or None,
+            request.args.get('end') or None,
+            parse_metrics_arg(request.args.get('metrics')),
+            **params,
+        )
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error running {kind} analysis: {str(e)}")
+        return jsonify({'message': f'Error running analysis: {str(e)}'}), 500
+    return jsonify(result)
+
+@api.route('/compare')
+def compare():
+    """
+    Overlay several windows on a shared slot axis.
+
+    Windows are given either explicitly as windows=START:END,START:END,...
+    or as start/end plus years=2022,2023 to repeat the same calendar window
+    in other years. Other query parameters: metrics, resolution
+    (period|hour|day) and align (date|weekday).
+    """
+    try:
+        if request.args.get('windows'):
+            windows = []
+            for item in request.args['windows'].split(','):
+                first, _, last = item.partition(':')
+                windows.append((date.fromisoformat(first), date.fromisoformat(last or first)))
+        else:
+            start = date.fromisoformat(request.args['start'])
+            end = date.fromisoformat(request.args['end'])
+            years = [int(y) for y in request.args.get('years', '').split(',') if y]
+            windows = [(start, end)] + same_window_in_years(start, end, years)
+        result = compare_periods(
+            windows,
+            parse_metrics_arg(request.args.get('metrics')),
+            resolution=request.args.get('resolution', 'period'),
+            align=request.args.get('align', 'date'),
+        )
+    except KeyError as e:
+        return jsonify({'message': f'Missing parameter: {e.args[0]}'}), 400
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error comparing periods: {str(e)}")
+        return jsonify({'message': f'Error comparing periods: {str(e)}'}), 500
+    return jsonify(result)
+
+@api.route('/completeness')
+def completeness_endpoint():
+    """
+    Days of an inclusive range that have no rows or lack settlement periods,
+    answered from the completeness index without reading okte_data.
+
+    Query parameters: start/end (YYYY-MM-DD), defaulting to the first and
+    last stored day.
+    """
+    try:
+        stats = get_stats() or {}
+        start = request.args.get('start') or stats.get('first_day')
+        end = request.args.get('end') or stats.get('last_day')
+        if start is None or end is None:
+            return jsonify({'message': 'No data stored; give start and end'}), 400
+        result = completeness(date.fromisoformat(start), date.fromisoformat(end))
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error reading completeness: {str(e)}")
+        return jsonify({'message': f'Error reading completeness: {str(e)}'}), 500
+    return jsonify(result)
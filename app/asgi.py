@@ -0,0 +1,160 @@
+"""
+ASGI deployment: the Flask app behind an event loop.
+
+Every request is dispatched to the Flask app (routes, hooks, metrics and
+events all behave as under WSGI), but only the blocking work runs on a
+thread: the view itself, which is where the database is queried, and the
+production of each chunk of a streamed body. Sending a chunk to the client
+is awaited on the event loop, so a slow download of /export holds a DB
+cursor between batches, not an OS thread. Long requests (/scrape) run on a
+small separate pool; further ones wait on the loop instead of taking
+threads from the read endpoints.
+
+    uvicorn asgi:app --workers 4
+
+Only the Python standard library is needed here; an ASGI server (uvicorn,
+hypercorn) is needed to run it.
+"""
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+_END = object()
+
+
+def _next_chunk(iterator):
+    return next(iterator, _END)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and the complete request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # The body is read completely, also when it came chunked
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))
+    return environ
+
+
+class AsgiApp:
+    """
+    ASGI application serving a Flask app from a thread pool.
+
+    Config keys: ASGI_THREADS (pool for the read endpoints, default 16),
+    ASGI_SLOW_THREADS (pool for long requests, default 2) and
+    ASGI_SLOW_PATHS (path prefixes of long requests, default ('/scrape',)).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        app.config.setdefault('ASGI_THREADS', 16)
+        app.config.setdefault('ASGI_SLOW_THREADS', 2)
+        app.config.setdefault('ASGI_SLOW_PATHS', ('/scrape',))
+        self.slow_paths = tuple(app.config['ASGI_SLOW_PATHS'])
+        self.executor = ThreadPoolExecutor(app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+        self.slow_executor = ThreadPoolExecutor(app.config['ASGI_SLOW_THREADS'], thread_name_prefix='asgi-slow')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.slow_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, executor, func, *args):
+        """Run a blocking call on `executor`, in a copy of the caller's context."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(contextvars.copy_context().run, func, *args))
+
+    async def http(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        executor = self.executor
+        if scope['path'].startswith(self.slow_paths):
+            executor = self.slow_executor
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return response.setdefault('written', []).append
+
+        environ = build_environ(scope, b''.join(body))
+        chunks = await self.run(executor, self.app, environ, start_response)
+
+        # The client may go away in the middle of a long download
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        iterator = iter(chunks)
+        try:
+            await send({'type': 'http.response.start', 'status': response['status'],
+                        'headers': response['headers']})
+            for chunk in response.get('written', []):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            while not disconnected.done():
+                chunk = await self.run(executor, _next_chunk, iterator)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            if hasattr(chunks, 'close'):
+                # Closing a generator releases its connection; do it off the loop
+                await self.run(executor, chunks.close)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+def create_asgi_app(app):
+    """Wrap a Flask app created by create_app() for an ASGI server."""
+    return AsgiApp(app)
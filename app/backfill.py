@@ -0,0 +1,327 @@
+"""
+Bulk maintenance of okte_data: backfill of long date ranges, verification
+and compaction. Used by `flask edc backfill|verify|compact` (see cli.py).
+
+Backfill scrapes with a pool of threads, each with its own HTTP session,
+while the calling thread is the only writer: scraped days are stored chunk
+by chunk with ingest.store_days(), so the tile pyramid, stats and analytics
+cache follow as after any other ingest. Days the completeness index reports
+as complete are skipped unless forced.
+
+With `processes` the range is split into shards of chunk_days days that
+worker processes scrape and parse into columnar batches, so parsing uses
+every core; the calling process stays the single writer and merges each
+batch with ingest.store_batch() as it arrives. Workers have no log files or
+metrics endpoint of their own: the events they emit travel back with the
+batch and are logged and counted by the calling process.
+"""
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app import db
+from app.events import current_job_id, job_context, log_event, stage
+
+logger = logging.getLogger('app.backfill')
+
+CHUNK_DAYS = 31
+
+# Columns of a batch built by a worker process, in insert order
+BATCH_COLUMNS = (
+    'datum',
+    'zuctovacia_perioda',
+    'aktivovana_agregovana_flexibilita_kladna',
+    'aktivovana_agregovana_flexibilita_zaporna',
+    'zdielana_elektrina',
+)
+
+_worker = {}
+
+
+def days_to_backfill(start_day, end_day, force=False):
+    """Dates of start_day..end_day (inclusive) that are missing or incomplete (all with force)."""
+    from app.stats import completeness
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    if force:
+        return days
+    gaps = completeness(start_day, end_day)
+    wanted = set(gaps['missing_days']) | {item['day'] for item in gaps['incomplete_days']}
+    return [day for day in days if day.isoformat() in wanted]
+
+
+class _EventBuffer(logging.Handler):
+    """Collects the structured events of a worker process as (event, fields)."""
+
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def emit(self, record):
+        self.events.append((record.event, record.fields))
+
+
+def _init_worker(config, job_id):
+    """Process pool initializer: a bare Flask app for scrape_day(), no database."""
+    import requests
+    from flask import Flask
+    app = Flask('app.backfill')
+    app.config.update(config)
+    app.logger.setLevel(logging.WARNING)
+    buffer = _EventBuffer()
+    events = logging.getLogger('app.events')
+    events.addHandler(buffer)
+    events.setLevel(logging.INFO)
+    events.propagate = False
+    _worker.update(app=app, session=requests.Session(), events=buffer, job_id=job_id)
+
+
+def _scrape_shard(days):
+    """
+    Scrape and parse `days` in a worker process. Returns a columnar batch
+    for ingest.store_batch(): {'days': [(date, status, periods)],
+    'columns': {column: [values]}}, plus the shard's events as
+    'events': [(event, fields)].
+    """
+    from app.scraper import scrape_day
+
+    shard, columns = [], {name: [] for name in BATCH_COLUMNS}
+    _worker['events'].events = []
+    with _worker['app'].app_context(), job_context(_worker['job_id']):
+        for day in days:
+            status, rows = scrape_day(_worker['session'], datetime.combine(day, datetime.min.time()))
+            rows = rows or []
+            shard.append((day, status, len({row['zuctovacia_perioda'] for row in rows})))
+            columns['datum'].extend(row['datum'].isoformat(sep=' ') for row in rows)
+            for name in BATCH_COLUMNS[1:]:
+                columns[name].extend(row[name] for row in rows)
+    return {'days': shard, 'columns': columns, 'events': _worker['events'].events}
+
+
+def backfill(app, start_day, end_day, workers=4, chunk_days=CHUNK_DAYS, force=False, progress=None,
+             processes=0):
+    """
+    Scrape and store start_day..end_day with `workers` scraping threads, or
+    with `processes` worker processes when given. `progress(n)` is called
+    as days finish. Returns a summary with counts per status and the
+    throughput.
+    """
+    began = time.perf_counter()
+    totals = {'statuses': {}, 'rows': 0, 'write_s': 0.0}
+
+    def store(write, data, days):
+        written = time.perf_counter()
+        with stage('backfill_chunk', days=days) as timing:
+            chunk_statuses, chunk_rows = write(data)
+            timing['rows'] = chunk_rows
+        totals['write_s'] += time.perf_counter() - written
+        totals['statuses'].update(chunk_statuses)
+        totals['rows'] += chunk_rows
+
+    with app.app_context(), job_context():
+        days = days_to_backfill(start_day, end_day, force)
+        chunks = [days[i:i + chunk_days] for i in range(0, len(days), chunk_days)]
+        if processes:
+            _backfill_processes(app, chunks, processes, store, progress)
+        else:
+            _backfill_threads(app, chunks, workers, store, progress)
+
+        statuses, rows = totals['statuses'], totals['rows']
+        elapsed = time.perf_counter() - began
+        counts = {}
+        for status in statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        summary = {
+            'start': start_day.isoformat(),
+            'end': end_day.isoformat(),
+            'days': len(days),
+            'rows': rows,
+            'statuses': counts,
+            'failed': sorted(day.isoformat() for day, status in statuses.items() if status == 'error'),
+            'seconds': round(elapsed, 2),
+            'write_seconds': round(totals['write_s'], 2),
+            'days_per_s': round(len(days) / elapsed, 2) if elapsed else None,
+            'rows_per_s': round(rows / elapsed, 1) if elapsed else None,
+        }
+        log_event('backfill', processes=processes, **{k: v for k, v in summary.items() if k != 'failed'})
+        return summary
+
+
+def _backfill_threads(app, chunks, workers, store, progress):
+    import requests
+    from app.ingest import store_days
+    from app.scraper import scrape_day
+
+    local = threading.local()
+
+    def scrape(day):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        with app.app_context():
+            return (day, *scrape_day(local.session, datetime.combine(day, datetime.min.time())))
+
+    with ThreadPoolExecutor(max(workers, 1), thread_name_prefix='backfill') as pool:
+
+        def submit(chunk):
+            # Scraping threads carry the job id of the backfill
+            return [pool.submit(contextvars.copy_context().run, scrape, day) for day in chunk]
+
+        pending = submit(chunks[0]) if chunks else []
+        for index in range(len(chunks)):
+            current = pending
+            # Keep the scrapers busy with the next chunk while this one is written
+            pending = submit(chunks[index + 1]) if index + 1 < len(chunks) else []
+            results = []
+            for future in current:
+                results.append(future.result())
+                if progress:
+                    progress(1)
+            store(store_days, results, len(results))
+
+
+def _backfill_processes(app, chunks, processes, store, progress):
+    from app.ingest import store_batch
+    from app.metrics import ROWS_PARSED, SCRAPED_DAYS, STAGE_SECONDS
+
+    config = {key: app.config[key] for key in ('OKTE_URL',) if key in app.config}
+    # spawn: forking would copy the open database connections and logging threads
+    with ProcessPoolExecutor(max(processes, 1), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(config, current_job_id())) as pool:
+        futures = {pool.submit(_scrape_shard, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                batch = future.result()
+            except Exception as e:
+                logger.error(f"Backfill shard {chunk[0]} - {chunk[-1]} failed: {str(e)}")
+                batch = {'days': [(day, 'error', 0) for day in chunk],
+                         'columns': {name: [] for name in BATCH_COLUMNS}}
+            # Workers count into their own registries and log nowhere; count
+            # the shard and log its per-day events here, under the backfill's job id
+            for day, status, _ in batch['days']:
+                SCRAPED_DAYS.labels(status).inc()
+            ROWS_PARSED.inc(len(batch['columns']['datum']))
+            for event, fields in batch.get('events', ()):
+                if event == 'stage':
+                    STAGE_SECONDS.labels(fields['stage']).observe(fields['duration_ms'] / 1000)
+                log_event(event, **fields)
+            log_event('backfill_shard', start=chunk[0].isoformat(), end=chunk[-1].isoformat(),
+                      days=len(chunk), rows=len(batch['columns']['datum']))
+            store(store_batch, batch, len(chunk))
+            if progress:
+                progress(len(chunk))
+
+
+def find_duplicates(limit=None):
+    """(day, period, count) for settlement periods stored more than once. Scans okte_data."""
+    sql = ("SELECT substr(datum, 1, 10) AS day, zuctovacia_perioda, COUNT(*) FROM okte_data "
+           "GROUP BY day, zuctovacia_perioda HAVING COUNT(*) > 1 ORDER BY day, zuctovacia_perioda")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return db.session.execute(text(sql)).fetchall()
+
+
+def remove_duplicates():
+    """
+    Keep only the newest row (highest id) of every duplicated period and
+    refresh the stats, tile pyramid and analytics cache of the days that
+    changed. Returns (rows deleted, affected dates).
+    """
+    from app.ingest import after_ingest
+
+    keep = "SELECT MAX(id) FROM okte_data GROUP BY substr(datum, 1, 10), zuctovacia_perioda"
+    days = [date.fromisoformat(day) for day in db.session.execute(text(
+        f"SELECT DISTINCT substr(datum, 1, 10) AS day FROM okte_data WHERE id NOT IN ({keep}) ORDER BY day"
+    )).scalars()]
+    deleted = db.session.execute(text(f"DELETE FROM okte_data WHERE id NOT IN ({keep})")).rowcount
+    db.session.commit()
+    # One refresh per run of consecutive days
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    for first, last in runs:
+        after_ingest(first, last, ingested=False)
+    return deleted, days
+
+
+def verify(start_day=None, end_day=None, exact=False):
+    """
+    Completeness of a range (default: the stored range) from the index,
+    duplicated periods and, with exact, a recount of okte_data compared to
+    the maintained stats. Returns a report dict with 'ok' set when clean.
+    """
+    from app.stats import completeness, get_stats
+    stats = get_stats() or {}
+    if start_day is None and stats.get('first_day'):
+        start_day = date.fromisoformat(stats['first_day'])
+    if end_day is None and stats.get('last_day'):
+        end_day = date.fromisoformat(stats['last_day'])
+    report = {'stats': stats}
+    if start_day and end_day:
+        gaps = completeness(start_day, end_day)
+        report['completeness'] = {
+            'start': gaps['start'],
+            'end': gaps['end'],
+            'days': gaps['days'],
+            'complete_days': gaps['complete_days'],
+            'missing_days': gaps['missing_days'],
+            'incomplete_days': [item['day'] for item in gaps['incomplete_days']],
+        }
+    with stage('verify_duplicates'):
+        duplicates = find_duplicates()
+    report['duplicates'] = {
+        'periods': len(duplicates),
+        'extra_rows': sum(count - 1 for _, _, count in duplicates),
+        'sample': [{'day': day, 'period': period, 'count': count} for day, period, count in duplicates[:20]],
+    }
+    if exact:
+        counted = db.session.execute(text("SELECT COUNT(*) FROM okte_data")).scalar()
+        report['recount'] = {'rows': counted, 'stats_rows': stats.get('rows'),
+                             'matches': counted == stats.get('rows')}
+    completeness_ok = not report.get('completeness') or not (
+        report['completeness']['missing_days'] or report['completeness']['incomplete_days'])
+    report['ok'] = bool(completeness_ok and not duplicates and report.get('recount', {}).get('matches', True))
+    return report
+
+
+def _database_path():
+    url = db.engine.url
+    return url.database if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') else None
+
+
+def compact():
+    """
+    Rebuild the derived tables (tile pyramid and hourly rollup, table stats),
+    then ANALYZE and VACUUM. Returns the timings and the database file size
+    before and after.
+    """
+    from app.stats import rebuild_stats
+    from app.tiles import rebuild_pyramid
+
+    path = _database_path()
+    report = {'size_before': os.path.getsize(path) if path else None}
+    for name, step in (('rebuild_pyramid', rebuild_pyramid), ('rebuild_stats', rebuild_stats)):
+        began = time.perf_counter()
+        with stage(name):
+            step()
+        report[f'{name}_s'] = round(time.perf_counter() - began, 2)
+
+    db.session.remove()
+    # VACUUM cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, statement in (('analyze', 'ANALYZE'), ('vacuum', 'VACUUM')):
+            began = time.perf_counter()
+            with stage(name):
+                conn.execute(text(statement))
+            report[f'{name}_s'] = round(time.perf_counter() - began, 2)
+    report['size_after'] = os.path.getsize(path) if path else None
+    return report
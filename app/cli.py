@@ -0,0 +1,158 @@
+"""
+Command line interface, available as `flask --app run edc <command>`.
+"""
+import json
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+
+from app.analytics import run_analysis, DEFAULT_WINDOW_MINUTES
+from app.models import METRIC_COLUMNS
+
+edc = AppGroup('edc', help='EDC data maintenance and reporting commands.')
+
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+@edc.command('init-db')
+def init_db():
+    """Create missing tables and indexes (run once before starting workers)."""
+    from flask import current_app
+    from app.serving import init_schema
+    init_schema(current_app)
+    click.echo('Database schema is up to date')
+
+
+@edc.command('stats')
+@click.option('--rebuild', is_flag=True, help='Recount okte_data first (after bulk loads).')
+def stats(rebuild):
+    """Row count, day range and completeness of okte_data."""
+    from app.stats import get_stats, rebuild_stats
+    if rebuild:
+        rebuild_stats()
+    click.echo(json.dumps(get_stats(), indent=2))
+
+
+@edc.command('ingest')
+@click.option('--today', help='Day to treat as today (YYYY-MM-DD), for catching up from elsewhere.')
+def ingest(today):
+    """Run one ingestion now: recent days plus gaps, with retries."""
+    from flask import current_app
+    from app.scheduler import run_ingest
+    result = run_ingest(current_app._get_current_object(), _date(today))
+    click.echo(json.dumps(result, indent=2))
+    if result['status'] != 'ok':
+        raise SystemExit(1)
+
+
+@edc.command('scheduler')
+def scheduler():
+    """Ingest new days at INGEST_TIMES until interrupted."""
+    from flask import current_app
+    from app.scheduler import IngestScheduler
+    runner = IngestScheduler(current_app._get_current_object())
+    click.echo(f"Ingesting at {', '.join(t.strftime('%H:%M') for t in runner.times)} (Ctrl+C to stop)")
+    try:
+        runner.run_forever()
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+@edc.command('backfill')
+@click.option('--start', required=True, help='First day (YYYY-MM-DD).')
+@click.option('--end', required=True, help='Last day (YYYY-MM-DD), inclusive.')
+@click.option('--workers', default=4, show_default=True, help='Concurrent scraping threads.')
+@click.option('--processes', default=0, show_default=True,
+              help='Scrape and parse shards in this many worker processes instead of threads.')
+@click.option('--chunk-days', default=31, show_default=True, help='Days written per transaction (shard size).')
+@click.option('--force', is_flag=True, help='Also re-scrape days that are already complete.')
+def backfill_command(start, end, workers, processes, chunk_days, force):
+    """Scrape and store a long date range, skipping complete days."""
+    from flask import current_app
+    from app.backfill import backfill, days_to_backfill
+    app = current_app._get_current_object()
+    start, end = _date(start), _date(end)
+    total = len(days_to_backfill(start, end, force))
+    with click.progressbar(length=total, label=f'Backfill {start} - {end}', show_pos=True) as bar:
+        result = backfill(app, start, end, workers, chunk_days, force, progress=bar.update, processes=processes)
+    click.echo(f"{result['rows']} rows from {result['days']} days in {result['seconds']} s "
+               f"({result['days_per_s']} days/s, {result['rows_per_s']} rows/s, "
+               f"writing {result['write_seconds']} s)")
+    click.echo(f"statuses: {json.dumps(result['statuses'])}")
+    if result['failed']:
+        click.echo(f"failed days: {', '.join(result['failed'])}")
+        raise SystemExit(1)
+
+
+@edc.command('verify')
+@click.option('--start', help='First day (YYYY-MM-DD), defaults to the oldest stored day.')
+@click.option('--end', help='Last day (YYYY-MM-DD), inclusive, defaults to the newest stored day.')
+@click.option('--exact', is_flag=True, help='Also recount okte_data and compare with the stats.')
+@click.option('--fix-duplicates', is_flag=True, help='Delete all but the newest row of duplicated periods.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full report as JSON.')
+def verify_command(start, end, exact, fix_duplicates, as_json):
+    """Check completeness and duplicated periods; exit status 1 on problems."""
+    from app.backfill import remove_duplicates, verify
+    result = verify(_date(start), _date(end), exact)
+    if fix_duplicates and result['duplicates']['extra_rows']:
+        deleted, days = remove_duplicates()
+        click.echo(f"Deleted {deleted} duplicate rows from {len(days)} days")
+        result = verify(_date(start), _date(end), exact)
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+    else:
+        gaps = result.get('completeness')
+        if gaps:
+            click.echo(f"{gaps['start']} - {gaps['end']}: {gaps['complete_days']} of {gaps['days']} days complete, "
+                       f"{len(gaps['missing_days'])} missing, {len(gaps['incomplete_days'])} incomplete")
+            for label, days in (('missing', gaps['missing_days']), ('incomplete', gaps['incomplete_days'])):
+                if days:
+                    click.echo(f"  {label}: {', '.join(days[:10])}{' ...' if len(days) > 10 else ''}")
+        else:
+            click.echo('No data stored')
+        duplicates = result['duplicates']
+        click.echo(f"duplicated periods: {duplicates['periods']} ({duplicates['extra_rows']} extra rows)")
+        if 'recount' in result:
+            recount = result['recount']
+            click.echo(f"recount: {recount['rows']} rows, stats say {recount['stats_rows']}"
+                       f"{'' if recount['matches'] else ' (mismatch, run edc stats --rebuild)'}")
+    if not result['ok']:
+        raise SystemExit(1)
+
+
+@edc.command('compact')
+def compact_command():
+    """Rebuild the tile pyramid and stats, then ANALYZE and VACUUM."""
+    from app.backfill import compact
+    result = compact()
+    for key, value in result.items():
+        click.echo(f"{key:22} {value}")
+
+
+@edc.command('report')
+@click.option('--start', help='First day (YYYY-MM-DD), defaults to the oldest stored day.')
+@click.option('--end', help='Last day (YYYY-MM-DD), inclusive, defaults to the newest stored day.')
+@click.option('--metric', 'metrics', multiple=True, type=click.Choice(METRIC_COLUMNS),
+              help='Metric to include, may be repeated. Defaults to all.')
+@click.option('--window', default=DEFAULT_WINDOW_MINUTES, show_default=True,
+              help='Rolling window in minutes.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full report as JSON.')
+def report(start, end, metrics, window, as_json):
+    """Rolling statistics, percentiles and duration curves for a range."""
+    result = run_analysis('report', _date(start), _date(end), list(metrics) or None,
+                          window_minutes=window)
+    if as_json or 'message' in result:
+        click.echo(json.dumps(result, indent=2))
+        return
+
+    click.echo(f"{result['start']} - {result['end']}: {result['periods']} periods"
+               f"{' (cached)' if result['cached'] else ''}")
+    q = result['percentiles']['q']
+    click.echo(f"{'metric':45} " + ' '.join(f"{'p' + format(v, 'g'):>9}" for v in q))
+    for metric in metrics or METRIC_COLUMNS:
+        values = result['percentiles'][metric]
+        click.echo(f"{metric:45} " + ' '.join(
+            f"{v:>9.3f}" if v is not None else f"{'-':>9}" for v in values))
@@ -0,0 +1,155 @@
+"""
+Overlay several time windows of okte_data on a common axis.
+
+All windows are fetched with a single query and binned in NumPy onto slots of
+equal length counted from each window's start, so e.g. May 2024 and May 2023
+line up slot by slot. With weekday alignment every window is shifted by up
+to three days so that its first day falls on the same weekday as the first
+window's, which lines up weekly load patterns instead of calendar dates.
+Hourly and daily comparisons read the hourly rollup when it is available.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from app import db
+from app.aggregate import rollup_available
+from app.models import METRIC_COLUMNS
+from app.series import PERIOD_MS, load_columns, as_date
+from app.tiles import STORED_MIN_LEVEL, bucket_ms
+
+DAY_MS = 86400000
+RESOLUTIONS = {'period': PERIOD_MS, 'hour': 3600000, 'day': DAY_MS}
+ALIGNMENTS = ('date', 'weekday')
+MAX_WINDOWS = 20
+
+
+def _day_ms(day):
+    return (day - date(1970, 1, 1)).days * DAY_MS
+
+
+def same_window_in_years(start_day, end_day, years):
+    """The inclusive range start_day..end_day moved into each of the given years."""
+    windows = []
+    for year in years:
+        try:
+            start = start_day.replace(year=year)
+        except ValueError:  # 29 February
+            start = start_day.replace(year=year, day=28)
+        windows.append((start, start + (end_day - start_day)))
+    return windows
+
+
+def align_weekdays(windows):
+    """Shift each window by at most three days so it starts on the first window's weekday."""
+    reference = windows[0][0].weekday()
+    aligned = [windows[0]]
+    for start, end in windows[1:]:
+        delta = (reference - start.weekday()) % 7
+        if delta > 3:
+            delta -= 7
+        aligned.append((start + timedelta(days=delta), end + timedelta(days=delta)))
+    return aligned
+
+
+def _load_raw(windows, metrics):
+    """Rows of all windows as (t, sum, count) arrays per metric, from okte_data."""
+    columns = load_columns(metrics=metrics, day_ranges=[
+        (start, end + timedelta(days=1)) for start, end in windows
+    ])
+    t = columns['t']
+    result = {}
+    for metric in metrics:
+        values = columns[metric]
+        present = ~np.isnan(values)
+        result[metric] = (t, np.where(present, values, 0.0), present.astype(np.float64))
+    return result
+
+
+def _load_rollup(windows, metrics):
+    """Hourly (t, sum, count) arrays per metric, from the okte_pyramid rollup."""
+    width = bucket_ms(STORED_MIN_LEVEL)
+    clauses = [f"metric IN ({', '.join(f':m{i}' for i in range(len(metrics)))})"]
+    params = {'level': STORED_MIN_LEVEL}
+    params.update({f'm{i}': m for i, m in enumerate(metrics)})
+    ranges = []
+    for i, (start, end) in enumerate(windows):
+        ranges.append(f"(bucket >= :s{i} AND bucket < :e{i})")
+        params[f's{i}'] = _day_ms(start) // width
+        params[f'e{i}'] = _day_ms(end + timedelta(days=1)) // width
+    clauses.append(f"({' OR '.join(ranges)})")
+    rows = db.session.execute(text(
+        f"SELECT metric, bucket, sum, count FROM okte_pyramid "
+        f"WHERE level = :level AND {' AND '.join(clauses)} ORDER BY metric, bucket"
+    ), params).fetchall()
+
+    result = {m: (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)) for m in metrics}
+    if rows:
+        names, buckets, sums, counts = zip(*rows)
+        names = np.array(names)
+        buckets = np.array(buckets, dtype=np.int64) * width
+        sums = np.array(sums, dtype=np.float64)
+        counts = np.array(counts, dtype=np.float64)
+        for metric in metrics:
+            mask = names == metric
+            result[metric] = (buckets[mask], sums[mask], counts[mask])
+    return result
+
+
+def compare_periods(windows, metrics=None, resolution='period', align='date'):
+    """
+    Bin several inclusive (start_day, end_day) windows onto a shared slot axis.
+
+    Returns a columnar dict with 'offset' (slot index), 'windows' (the
+    possibly shifted ranges) and, for each metric, one list of slot means per
+    window. All windows use the length of the first one.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolution must be one of: {', '.join(RESOLUTIONS)}")
+    if align not in ALIGNMENTS:
+        raise ValueError(f"Alignment must be one of: {', '.join(ALIGNMENTS)}")
+    if not windows:
+        raise ValueError('At least one window is required')
+    if len(windows) > MAX_WINDOWS:
+        raise ValueError(f'At most {MAX_WINDOWS} windows can be compared')
+    metrics = list(metrics or METRIC_COLUMNS)
+
+    windows = [(as_date(start), as_date(end)) for start, end in windows]
+    length = windows[0][1] - windows[0][0]
+    if length.days < 0:
+        raise ValueError('Window end must not be before its start')
+    windows = [(start, start + length) for start, _ in windows]
+    if align == 'weekday':
+        windows = align_weekdays(windows)
+
+    step = RESOLUTIONS[resolution]
+    slots = ((length.days + 1) * DAY_MS) // step
+    if resolution != 'period' and rollup_available(min(s for s, _ in windows), max(e for _, e in windows)):
+        source, source_name = _load_rollup(windows, metrics), 'rollup'
+    else:
+        source, source_name = _load_raw(windows, metrics), 'raw'
+
+    result = {
+        'resolution': resolution,
+        'step_ms': step,
+        'align': align,
+        'source': source_name,
+        'offset': list(range(slots)),
+        # Weekday (Monday=0) of each slot, shared by all windows when aligned
+        'weekday': ((windows[0][0].weekday() + np.arange(slots) * step // DAY_MS) % 7).tolist(),
+        'windows': [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in windows],
+    }
+    for metric in metrics:
+        t, sums, counts = source[metric]
+        series = []
+        for start, _ in windows:
+            slot = (t - _day_ms(start)) // step
+            inside = (slot >= 0) & (slot < slots)
+            total = np.bincount(slot[inside], weights=sums[inside], minlength=slots)
+            count = np.bincount(slot[inside], weights=counts[inside], minlength=slots)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = total / count
+            series.append([None if v != v else v for v in mean.tolist()])
+        result[metric] = series
+    return result
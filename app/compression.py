@@ -0,0 +1,126 @@
+import gzip
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'application/json',
+    'application/javascript',
+)
+
+
+def choose_encoding(app):
+    """
+    Pick the best content encoding the client accepts.
+    Brotli is preferred over gzip when both are acceptable and available.
+    Returns None when the response should be sent uncompressed.
+    """
+    accepted = request.accept_encodings
+    candidates = []
+    if brotli is not None and app.config['COMPRESS_BR_LEVEL'] is not None:
+        candidates.append('br')
+    candidates.append('gzip')
+
+    best, best_quality = None, 0
+    for encoding in candidates:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_body(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _compress_stream(chunks, encoding, level):
+    """
+    Compress an iterable of chunks incrementally.
+    Each chunk is flushed so clients receive data as soon as it is produced.
+    Runs after the request context is gone, so it must not touch current_app.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        flush, finish = compressor.flush, compressor.finish
+        compress = compressor.process
+    else:
+        # wbits=31 produces a gzip container rather than a raw zlib stream
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        compress = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            out = compress(chunk) + flush()
+            if out:
+                yield out
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    app = current_app
+    if not app.config['COMPRESS_ENABLED']:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if not response.is_streamed:
+        length = response.calculate_content_length()
+        if length is not None and length < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+    encoding = choose_encoding(app)
+    if encoding is None:
+        return response
+
+    level = app.config['COMPRESS_BR_LEVEL' if encoding == 'br' else 'COMPRESS_LEVEL']
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(_compress_body(response.get_data(), encoding, level))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """
+    Register negotiated gzip/brotli compression for all responses.
+
+    COMPRESS_LEVEL is the gzip level (1-9), COMPRESS_BR_LEVEL the brotli
+    quality (0-11, None disables brotli) and COMPRESS_MIN_SIZE the smallest
+    buffered body in bytes worth compressing. Streamed responses have no
+    known length and are always compressed.
+    """
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+    app.after_request(compress_response)
@@ -0,0 +1,118 @@
+"""
+Structured log events with a per-request / per-job id and stage timings.
+
+Events go to the 'app.events' logger and end up as one JSON object per line
+in logs/events.jsonl, for example:
+
+    {"ts": "2024-05-01T06:00:01.250", "level": "INFO", "event": "stage",
+     "job_id": "3f2a9c1d04be", "stage": "http_post", "date": "2024-04-30",
+     "duration_ms": 812.4}
+
+so slow days and regressions can be found with jq or pandas.read_json(lines=True).
+"""
+import contextvars
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, request
+
+from app.metrics import STAGE_SECONDS
+
+logger = logging.getLogger('app.events')
+
+_job_id = contextvars.ContextVar('job_id', default=None)
+
+# Client-supplied request ids end up in log lines and profile file names
+_REQUEST_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def current_job_id():
+    return _job_id.get()
+
+
+@contextmanager
+def job_context(job_id=None):
+    """Run a block under a job id so every event inside it carries that id."""
+    token = _job_id.set(job_id or new_job_id())
+    try:
+        yield _job_id.get()
+    finally:
+        _job_id.reset(token)
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Emit one structured event; the fields become top-level JSON keys."""
+    if logger.isEnabledFor(level):
+        # The job id is read here: the listener thread formats the record later
+        fields = {'job_id': _job_id.get(), **fields}
+        logger.log(level, event, extra={'event': event, 'fields': fields})
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a block, emit a 'stage' event with its duration in ms and record it
+    in the edc_stage_duration_seconds histogram.
+    The yielded dict can be filled with extra fields (e.g. row counts) inside
+    the block. Failed stages are logged with error set.
+    """
+    extra = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield extra
+    except Exception as e:
+        extra['error'] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        extra['duration_ms'] = round(elapsed * 1000, 3)
+        log_event('stage', stage=name, **extra)
+
+
+def init_request_events(app):
+    """
+    Give every request an id (taken from X-Request-ID when it is up to 64
+    letters, digits, '-' or '_'), return it in the response and log one
+    'request' event with the route latency.
+    """
+    @app.before_request
+    def start_request_event():
+        request_id = request.headers.get('X-Request-ID', '')
+        if not _REQUEST_ID.fullmatch(request_id):
+            request_id = new_job_id()
+        g.event_token = _job_id.set(request_id)
+        g.event_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request_event(response):
+        start = g.pop('event_start', None)
+        if start is not None:
+            response.headers['X-Request-ID'] = current_job_id()
+            fields = {}
+            queries = g.get('query_stats')
+            if queries is not None:
+                fields = {'queries': queries['count'], 'query_ms': round(queries['seconds'] * 1000, 3)}
+            log_event(
+                'request',
+                method=request.method,
+                path=request.path,
+                endpoint=request.endpoint,
+                status=response.status_code,
+                duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                **fields,
+            )
+        return response
+
+    @app.teardown_request
+    def reset_request_event(exc=None):
+        token = g.pop('event_token', None)
+        if token is not None:
+            _job_id.reset(token)
@@ -0,0 +1,128 @@
+"""
+Streaming export of okte_data as CSV or Parquet.
+
+Rows are read in batches from a server-side cursor ordered by (datum, id) and
+written out batch by batch, so memory use does not depend on the size of the
+range. Every row carries its id; an interrupted export is resumed by passing
+the last received id as `after`.
+"""
+import csv
+import importlib.util
+import io
+
+from sqlalchemy import text
+
+from app.models import METRIC_COLUMNS
+
+BATCH_SIZE = 10000
+
+
+def parquet_available():
+    # Parquet export is optional; pyarrow is imported on first use only
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_columns(metrics):
+    return ['id', 'datum', 'zuctovacia_perioda'] + list(metrics)
+
+
+def _build_query(start, end, metrics, after):
+    clauses, params = [], {}
+    if start is not None:
+        clauses.append("datum >= :start_day")
+        params['start_day'] = start.strftime('%Y-%m-%d')
+    if end is not None:
+        clauses.append("datum < :end_day")
+        params['end_day'] = end.strftime('%Y-%m-%d')
+    if after is not None:
+        # Keyset continuation: strictly after the (datum, id) of the given row
+        clauses.append(
+            "(datum, id) > ((SELECT datum FROM okte_data WHERE id = :after_id), :after_id)"
+        )
+        params['after_id'] = after
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = text(
+        f"SELECT id, substr(datum, 1, 10), zuctovacia_perioda, {', '.join(metrics)} "
+        f"FROM okte_data {where} ORDER BY datum, id"
+    )
+    return sql, params
+
+
+def iter_batches(engine, start=None, end=None, metrics=None, after=None, batch_size=BATCH_SIZE):
+    """
+    Yield lists of row tuples from okte_data in (datum, id) order.
+    `end` is an exclusive date. Opens its own connection so it can run after
+    the request context has been torn down.
+    """
+    sql, params = _build_query(start, end, list(metrics or METRIC_COLUMNS), after)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(sql, params)
+        for partition in result.partitions(batch_size):
+            yield partition
+
+
+def generate_csv(engine, start=None, end=None, metrics=None, after=None):
+    """Yield the export as CSV text chunks, one chunk per batch."""
+    metrics = list(metrics or METRIC_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(export_columns(metrics))
+    for batch in iter_batches(engine, start, end, metrics, after):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(metrics):
+    import pyarrow as pa
+    return pa.schema(
+        [('id', pa.int64()), ('datum', pa.string()), ('zuctovacia_perioda', pa.string())]
+        + [(m, pa.float64()) for m in metrics]
+    )
+
+
+def generate_parquet(engine, start=None, end=None, metrics=None, after=None):
+    """Yield the export as a Parquet file written one row group per batch."""
+    if not parquet_available():
+        raise RuntimeError('Parquet export requires the pyarrow package')
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    metrics = list(metrics or METRIC_COLUMNS)
+    schema = parquet_schema(metrics)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in iter_batches(engine, start, end, metrics, after):
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,158 @@
+"""
+Writing scraped rows to okte_data and the bookkeeping that has to follow
+every write.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from sqlalchemy import delete
+
+from app import db
+from app.analytics import invalidate_cache
+from app.events import stage
+from app.metrics import ROWS_INSERTED
+from app.models import EDCData, EDCDayStats
+from app.querylog import repeats_expected
+from app.stats import refresh_stats
+from app.tiles import rebuild_pyramid
+
+logger = logging.getLogger('app.ingest')
+
+
+def after_ingest(start_day, end_day, ingested=True):
+    """
+    Refresh data derived from okte_data for the days start_day..end_day
+    (inclusive). Failures are logged and do not undo the ingested rows.
+    With ingested=False (a repair rather than new data) the time of the
+    last ingest in the table stats is left alone.
+    """
+    for name, refresh in (
+        ('table stats', partial(refresh_stats, ingested=ingested)),
+        ('tile pyramid', rebuild_pyramid),
+        ('analytics cache', invalidate_cache),
+    ):
+        try:
+            # The pyramid refresh runs the same few statements once per level
+            with repeats_expected():
+                refresh(start_day, end_day)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing {name}: {str(e)}")
+
+
+def write_rows(rows, replace_days=()):
+    """
+    Insert scraped rows into okte_data with one executemany. Stored rows of
+    the dates in `replace_days` are deleted first, in the same transaction.
+    Commits the session.
+    """
+    with stage('db_write', rows=len(rows), replaced=len(replace_days)):
+        for day in replace_days:
+            db.session.execute(delete(EDCData).where(
+                EDCData.datum >= day.isoformat(),
+                EDCData.datum < (day + timedelta(days=1)).isoformat(),
+            ))
+        if rows:
+            db.session.execute(EDCData.__table__.insert(), rows)
+        db.session.commit()
+    ROWS_INSERTED.inc(len(rows))
+
+
+def ingest_days(days, session=None):
+    """
+    Scrape the given dates one after another, then store them with
+    store_days(). Returns ({date: status}, rows written).
+    """
+    import requests
+    from app.scraper import scrape_day
+
+    session = session or requests.Session()
+    return store_days([
+        (day, *scrape_day(session, datetime.combine(day, time.min))) for day in days
+    ])
+
+
+def _stored_periods(first_day, last_day):
+    return dict(db.session.query(EDCDayStats.day, EDCDayStats.periods).filter(
+        EDCDayStats.day >= first_day.isoformat(), EDCDayStats.day <= last_day.isoformat()
+    ).all())
+
+
+def _select_days(days):
+    """
+    Apply the keep-or-replace rule to (date, status, periods) tuples.
+    Returns ({date: status}, dates to write, stored dates to replace).
+    """
+    days = sorted(days)
+    if not days:
+        return {}, [], []
+    stored = _stored_periods(days[0][0], days[-1][0])
+    statuses, written, replace = {}, [], []
+    for day, status, periods in days:
+        if status == 'ok':
+            if day.isoformat() in stored:
+                if periods < stored[day.isoformat()]:
+                    status = 'kept'
+                else:
+                    replace.append(day)
+            if status == 'ok':
+                written.append(day)
+        statuses[day] = status
+    return statuses, written, replace
+
+
+def store_days(results):
+    """
+    Store scraped days, given as (date, status, rows) tuples from
+    scrape_day(), and refresh derived data for the written range.
+
+    A day that is already stored is replaced when the new page has at least
+    as many periods (the current day's page grows during the day) and kept
+    otherwise. Returns ({date: status}, rows written), where status is one of
+    the scraper's ('ok', 'no_table', 'no_rows', 'error') or 'kept'.
+    """
+    statuses, written, replace = _select_days([
+        (day, status, len({row['zuctovacia_perioda'] for row in day_rows or []}))
+        for day, status, day_rows in results
+    ])
+    rows = [row for day, status, day_rows in results if statuses[day] == 'ok' for row in day_rows]
+    if rows:
+        write_rows(rows, replace)
+        with stage('after_ingest'):
+            after_ingest(written[0], written[-1])
+    return statuses, len(rows)
+
+
+def store_batch(batch):
+    """
+    Columnar counterpart of store_days() for batches built away from the
+    app (see backfill.py): batch['days'] holds (date, status, periods)
+    tuples and batch['columns'] one list per okte_data column, with datum
+    as 'YYYY-MM-DD HH:MM:SS' strings. Rows are written with one raw
+    executemany. Returns ({date: status}, rows written).
+    """
+    statuses, written, replace = _select_days(batch['days'])
+    columns = batch['columns']
+    if len(written) < sum(status == 'ok' for _, status, _ in batch['days']):
+        keep = {day.isoformat() for day in written}
+        index = [i for i, datum in enumerate(columns['datum']) if datum[:10] in keep]
+        columns = {name: [values[i] for i in index] for name, values in columns.items()}
+    names = list(columns)
+    count = len(columns['datum']) if names else 0
+    if count:
+        with stage('db_write', rows=count, replaced=len(replace)):
+            for day in replace:
+                db.session.execute(delete(EDCData).where(
+                    EDCData.datum >= day.isoformat(),
+                    EDCData.datum < (day + timedelta(days=1)).isoformat(),
+                ))
+            db.session.connection().exec_driver_sql(
+                f"INSERT INTO okte_data ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+                list(zip(*(columns[name] for name in names))),
+            )
+            db.session.commit()
+        ROWS_INSERTED.inc(count)
+        with stage('after_ingest'):
+            after_ingest(written[0], written[-1])
+    return statuses, count
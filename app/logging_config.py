@@ -0,0 +1,369 @@
+"""
+Logging setup for the application.
+
+Loggers never write to disk or the console themselves: they put records on a
+bounded in-memory queue and a background QueueListener thread hands them to
+the real file and console handlers. When the queue is full records are
+dropped according to LOG_DROP_POLICY instead of blocking the caller, and the
+number of dropped records is reported once space is available again.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+
+from flask.logging import default_handler
+
+DROP_POLICIES = ('drop_new', 'drop_oldest')
+
+# Compresses and prunes rotated log files off the logging thread
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-rotate')
+
+
+class RotatingLogFileHandler(BaseRotatingHandler):
+    """
+    File handler that rotates by size and/or time and compresses old files.
+
+    A rotated file is renamed once to a unique timestamped name
+    (app.log.20240101-120000) instead of shifting app.log.1..N, so one
+    rotation is a single rename however many backups exist. Compression and
+    pruning down to `backup_count` files run on a background thread.
+
+    If the file cannot be renamed because another process holds it open
+    (Windows error 32), the handler copies it and truncates its own stream
+    instead. If that fails too, rotation is retried after `retry_seconds`
+    rather than on every record.
+    """
+
+    def __init__(self, filename, max_bytes=0, when=None, backup_count=10,
+                 compress=True, retry_seconds=60, encoding='utf-8'):
+        super().__init__(filename, 'a', encoding=encoding, delay=False)
+        self.max_bytes = max_bytes
+        self.when = when
+        self.backup_count = backup_count
+        self.compress = compress
+        self.retry_seconds = retry_seconds
+        self.rotations = 0
+        self._retry_at = 0
+        self.rollover_at = self._next_rollover(time.time())
+
+    def _next_rollover(self, now):
+        if not self.when:
+            return None
+        if self.when == 'midnight':
+            tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+            return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+        return now + _interval_seconds(self.when)
+
+    def shouldRollover(self, record):
+        now = time.time()
+        if now < self._retry_at:
+            return False
+        if self.rollover_at is not None and now >= self.rollover_at:
+            return True
+        if self.max_bytes and self.stream is not None:
+            # Only the size matters here, so skip formatting the record
+            return self.stream.tell() + len(record.getMessage()) >= self.max_bytes
+        return False
+
+    def _rotated_name(self):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = f'{self.baseFilename}.{stamp}'
+        counter = 1
+        while os.path.exists(name) or os.path.exists(name + '.gz'):
+            name = f'{self.baseFilename}.{stamp}-{counter}'
+            counter += 1
+        return name
+
+    def doRollover(self):
+        dest = self._rotated_name()
+        self.stream.close()
+        self.stream = None
+        try:
+            os.replace(self.baseFilename, dest)
+        except PermissionError as e:
+            if getattr(e, 'winerror', None) != 32:
+                raise
+            dest = self._copy_truncate(dest, e)
+
+        self.stream = self._open()
+        now = time.time()
+        self.rollover_at = self._next_rollover(now)
+        if dest is None:
+            self._retry_at = now + self.retry_seconds
+            return
+        self.rotations += 1
+        _background.submit(_finish_rotation, self.baseFilename, dest, self.compress, self.backup_count)
+
+    def _copy_truncate(self, dest, error):
+        """Rotate a file another process keeps open: copy it, then truncate it."""
+        try:
+            shutil.copyfile(self.baseFilename, dest)
+            with open(self.baseFilename, 'r+b') as f:
+                f.truncate(0)
+            return dest
+        except OSError:
+            sys.stderr.write(f"Log rotation deferred for {self.baseFilename} due to lock: {error}\n")
+            return None
+
+
+def _interval_seconds(when):
+    units = {'S': 1, 'M': 60, 'H': 3600, 'D': 86400}
+    when = str(when).upper()
+    if when[-1] in units:
+        return int(when[:-1] or 1) * units[when[-1]]
+    return int(when)
+
+
+def _finish_rotation(base, rotated, compress, backup_count):
+    """Compress a rotated log file and delete the oldest backups."""
+    # An earlier task may already have pruned it when rotations pile up
+    if compress and os.path.exists(rotated):
+        with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        # Keep the rotation time, by which backups are pruned
+        shutil.copystat(rotated, rotated + '.gz')
+        os.remove(rotated)
+
+    if backup_count:
+        directory, name = os.path.split(base)
+        backups = sorted(
+            (os.path.join(directory, f) for f in os.listdir(directory or '.')
+             if f.startswith(name + '.') and f[len(name) + 1:len(name) + 2].isdigit()),
+            key=os.path.getmtime,
+        )
+        for old in backups[:-backup_count]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler for a bounded queue that never blocks the logging thread.
+
+    'drop_new' discards the incoming record when the queue is full,
+    'drop_oldest' evicts the oldest queued record to make room for it.
+    """
+
+    def __init__(self, log_queue, policy='drop_new'):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Log drop policy must be one of: {', '.join(DROP_POLICIES)}")
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self.dropped:
+            self._report_dropped()
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.policy == 'drop_oldest':
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def _report_dropped(self):
+        with self._dropped_lock:
+            count, self.dropped = self.dropped, 0
+        if not count:
+            return
+        notice = logging.LogRecord(
+            'app.logging', logging.WARNING, __file__, 0,
+            f'{count} log records dropped because the log queue was full', None, None,
+        )
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += count
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Structured events (see app.events) put their
+    fields at the top level; other records are written with their message.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+            entry.update(record.fields)
+        else:
+            entry['logger'] = record.name
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, default=str)
+
+
+def _is_event(record):
+    return record.name == 'app.events'
+
+
+_listener = None
+_queue_handler = None
+_attached_loggers = []
+_configured_app = None
+
+
+def _log_path(template):
+    """Expand {pid} so that worker processes can write separate files."""
+    path = template.format(pid=os.getpid())
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path
+
+
+def _build_handlers(app):
+    # Set up file handler
+    file_handler = RotatingLogFileHandler(
+        _log_path(app.config['LOG_FILE']),
+        max_bytes=app.config['LOG_MAX_BYTES'],
+        when=app.config['LOG_ROTATE_WHEN'],
+        backup_count=app.config['LOG_BACKUP_COUNT'],
+        compress=app.config['LOG_COMPRESS'],
+    )
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+    ))
+    file_handler.setLevel(logging.INFO)
+
+    # Set up console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s'
+    ))
+    console_handler.setLevel(logging.INFO)
+
+    # werkzeug records used to go to the file only
+    console_handler.addFilter(lambda record: not record.name.startswith('werkzeug'))
+    file_handler.addFilter(lambda record: not _is_event(record))
+    console_handler.addFilter(lambda record: not _is_event(record))
+    handlers = [file_handler, console_handler]
+
+    # Structured events as JSON lines, rotated like app.log
+    if app.config['LOG_EVENTS']:
+        events_handler = RotatingLogFileHandler(
+            _log_path(app.config['LOG_EVENTS_FILE']),
+            max_bytes=app.config['LOG_MAX_BYTES'],
+            when=app.config['LOG_ROTATE_WHEN'],
+            backup_count=app.config['LOG_BACKUP_COUNT'],
+            compress=app.config['LOG_COMPRESS'],
+        )
+        events_handler.setFormatter(JsonFormatter())
+        events_handler.addFilter(_is_event)
+        handlers.append(events_handler)
+    return handlers
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener, _queue_handler
+    for logger in _attached_loggers:
+        logger.removeHandler(_queue_handler)
+    _attached_loggers.clear()
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass  # the listener thread is a daemon and dies with the process
+        for handler in _listener.handlers:
+            handler.close()
+    _listener = _queue_handler = None
+
+
+def _shutdown():
+    stop_logging()
+    _background.shutdown(wait=True)
+
+
+def _after_fork():
+    """
+    Threads do not survive fork(): in a worker forked from a preloaded
+    master, restart the rotation executor and the listener, reopening the
+    log files under the worker's own pid where LOG_FILE asks for it.
+    """
+    global _background
+    _background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-rotate')
+    app = _configured_app() if _configured_app is not None else None
+    if app is not None:
+        configure_logging(app)
+
+
+def configure_logging(app):
+    """
+    Route app.logger (and its 'app.*' children) and werkzeug through a
+    bounded queue drained by a background thread. Safe to call again; the previous listener is stopped.
+
+    LOG_QUEUE_SIZE bounds the number of buffered records and LOG_DROP_POLICY
+    ('drop_new' or 'drop_oldest') decides what is lost when it fills up.
+    LOG_FILE (logs/app.log) rotates at LOG_MAX_BYTES (0 disables) and/or
+    LOG_ROTATE_WHEN ('midnight', or an interval such as '6H' or '1D'),
+    keeping LOG_BACKUP_COUNT old files, gzipped when LOG_COMPRESS is set.
+    Structured events go to LOG_EVENTS_FILE (logs/events.jsonl) unless
+    LOG_EVENTS is off. Both paths may contain {pid} for per-worker files.
+    """
+    global _listener, _queue_handler, _configured_app
+    app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('LOG_DROP_POLICY', 'drop_new')
+    app.config.setdefault('LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('LOG_ROTATE_WHEN', None)
+    app.config.setdefault('LOG_BACKUP_COUNT', 10)
+    app.config.setdefault('LOG_COMPRESS', True)
+    app.config.setdefault('LOG_EVENTS', True)
+    app.config.setdefault('LOG_FILE', os.path.join('logs', 'app.log'))
+    app.config.setdefault('LOG_EVENTS_FILE', os.path.join('logs', 'events.jsonl'))
+
+    stop_logging()
+
+    _configured_app = weakref.ref(app)
+    log_queue = queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE'])
+    _queue_handler = DroppingQueueHandler(log_queue, app.config['LOG_DROP_POLICY'])
+    _listener = QueueListener(log_queue, *_build_handlers(app), respect_handler_level=True)
+    _listener.start()
+
+    # Flask's own stderr handler would write synchronously; the console
+    # handler behind the queue replaces it
+    app.logger.removeHandler(default_handler)
+
+    # Configure app logger and werkzeug. Modules log through children of
+    # app.logger ('app.routes', ...); nothing reaches the root logger, whose
+    # handlers would write synchronously on the calling thread.
+    for logger in (app.logger, logging.getLogger('werkzeug')):
+        logger.addHandler(_queue_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _attached_loggers.append(logger)
+
+    # Structured events only go to the queue, never to the root logger
+    events = logging.getLogger('app.events')
+    events.addHandler(_queue_handler)
+    events.propagate = False
+    _attached_loggers.append(events)
+
+
+atexit.register(_shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,9 +1,20 @@
 from app import db
 from datetime import datetime
+from sqlalchemy import func
 from sqlalchemy.ext.hybrid import hybrid_property
 
+# Numeric columns of okte_data, in the order they appear on the OKTE page
+METRIC_COLUMNS = (
+    'aktivovana_agregovana_flexibilita_kladna',
+    'aktivovana_agregovana_flexibilita_zaporna',
+    'zdielana_elektrina',
+)
+
 class EDCData(db.Model):
     __tablename__ = 'okte_data'
+    __table_args__ = (
+        db.Index('ix_okte_data_datum', 'datum'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     datum = db.Column(db.String, nullable=False)  # TEXT in database
@@ -14,7 +25,78 @@ class EDCData(db.Model):
     
     @hybrid_property
     def date(self):
-        return datetime.strptime(self.datum, '%Y-%m-%d').date()
+        return datetime.strptime(self.datum[:10], '%Y-%m-%d').date()
+    
+    @date.expression
+    def date(cls):
+        # datum may carry a time part; compare on the day only
+        return func.substr(cls.datum, 1, 10, type_=db.Date)
+    
+    def __repr__(self):
+        return f'<EDCData {self.datum} {self.zuctovacia_perioda}>'
+
+class EDCPyramid(db.Model):
+    """
+    Precomputed min/max/sum/count of one metric per time bucket.
+    Bucket `b` at `level` covers [b * w, (b + 1) * w) epoch milliseconds,
+    where w is 2**level settlement periods.
+    """
+    __tablename__ = 'okte_pyramid'
+    
+    level = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+    sum = db.Column(db.Float)
+    count = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<EDCPyramid {self.level} {self.metric} {self.bucket}>'
+
+class EDCAnalyticsCache(db.Model):
+    """Cached analytics result (JSON) for a closed range of days."""
+    __tablename__ = 'okte_analytics_cache'
+    
+    key = db.Column(db.String, primary_key=True)
+    start_day = db.Column(db.String, nullable=False)
+    end_day = db.Column(db.String, nullable=False)  # inclusive
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EDCAnalyticsCache {self.key}>'
+
+class EDCDayStats(db.Model):
+    """
+    Rows and distinct settlement periods stored per day, maintained on ingest.
+    `missing` is a bitmap of the absent periods: bit p - 1 (little-endian
+    over the bytes) is set when period p of the `expected` ones is missing.
+    """
+    __tablename__ = 'okte_day_stats'
+    
+    day = db.Column(db.String, primary_key=True)  # YYYY-MM-DD
+    rows = db.Column(db.Integer, nullable=False)
+    periods = db.Column(db.Integer, nullable=False)
+    expected = db.Column(db.Integer, nullable=False)  # 92, 96 or 100 (DST)
+    missing = db.Column(db.LargeBinary)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EDCDayStats {self.day} {self.periods}/{self.expected}>'
+
+class EDCStats(db.Model):
+    """Summary of a table (one row per table), read by /health and /debug."""
+    __tablename__ = 'okte_stats'
+    
+    name = db.Column(db.String, primary_key=True)
+    rows = db.Column(db.Integer, nullable=False)
+    days = db.Column(db.Integer, nullable=False)
+    incomplete_days = db.Column(db.Integer, nullable=False)
+    first_day = db.Column(db.String)
+    last_day = db.Column(db.String)
+    last_ingest_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<EDCData {self.datum} {self.zuctovacia_perioda}>' 
\ No newline at end of file
+        return f'<EDCStats {self.name} {self.rows}>'
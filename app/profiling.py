@@ -0,0 +1,134 @@
+"""
+On-demand profiling of single requests.
+
+With PROFILING_ENABLED set, a request carrying an X-Profile header (or a
+profile query parameter) is profiled and the result written to PROFILE_DIR:
+
+- 'sample' (default): a sampling profiler reads the request thread's stack
+  every PROFILE_INTERVAL_MS and writes collapsed stacks (.folded), the input
+  format of flamegraph.pl, speedscope and inferno.
+- 'cprofile': cProfile statistics (.pstats) for snakeviz or pstats.
+
+If PROFILE_TOKEN is set the header or parameter value must be
+'<mode>:<token>'. The file name is returned in X-Profile-File. Only the view
+function is profiled; the body of a streamed response is produced later.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+from app.events import current_job_id, log_event
+
+MODES = ('sample', 'cprofile')
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """One 'frame;frame;frame count' line per distinct stack."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _requested_mode():
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    if not value:
+        return None
+    mode, _, token = value.partition(':')
+    expected = current_app.config['PROFILE_TOKEN']
+    if expected and token != expected:
+        return None
+    return mode if mode in MODES else 'sample'
+
+
+def _stop(mode, profiler):
+    if mode == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def init_profiling(app):
+    """Profile requests that ask for it, when PROFILING_ENABLED is set."""
+    app.config.setdefault('PROFILING_ENABLED', False)
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_DIR', os.path.join('logs', 'profiles'))
+    app.config.setdefault('PROFILE_INTERVAL_MS', 1)
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    @app.before_request
+    def start_profile():
+        mode = _requested_mode()
+        if mode is None:
+            return
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL_MS'] / 1000)
+            profiler.start()
+        g.profile = (mode, profiler, time.perf_counter())
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        mode, profiler, start = profile
+        _stop(mode, profiler)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        directory = current_app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = f"{stamp}-{request.endpoint or 'unmatched'}-{current_job_id()}"
+        if mode == 'cprofile':
+            name += '.pstats'
+            profiler.dump_stats(os.path.join(directory, name))
+        else:
+            name += '.folded'
+            with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+                f.write(profiler.collapsed())
+
+        response.headers['X-Profile-File'] = name
+        log_event('profile', mode=mode, endpoint=request.endpoint, file=name, duration_ms=elapsed_ms)
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc=None):
+        # after_request is skipped when the view raised
+        profile = g.pop('profile', None)
+        if profile is not None:
+            _stop(*profile[:2])
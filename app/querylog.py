@@ -0,0 +1,155 @@
+"""
+Per-request SQL instrumentation.
+
+Every statement run through SQLAlchemy is counted and timed against the
+current request. Statements slower than SLOW_QUERY_MS are logged with their
+EXPLAIN QUERY PLAN. With QUERY_CHECK_SCANS (on by default in debug mode)
+every SELECT is explained once and full table scans are reported, and a
+statement repeated QUERY_REPEAT_WARN times in one request is reported as a
+likely N+1 pattern, except inside repeats_expected() blocks such as the
+level-by-level tile pyramid refresh.
+
+QUERY_BUDGET caps the number of statements per request; individual views can
+override it with @query_budget(n). Over budget a warning is logged, or
+QueryBudgetExceeded is raised when QUERY_BUDGET_STRICT is set. The request
+then answers 500 even if the view caught the exception, so the offending
+route fails under the test client.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('app.queries')
+
+_scans_reported = set()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(limit):
+    """Set the statement budget of one view function."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+@contextmanager
+def repeats_expected():
+    """Statements run in this block are not reported as possible N+1 patterns."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('query_repeats_expected', False)
+    g.query_repeats_expected = True
+    try:
+        yield
+    finally:
+        g.query_repeats_expected = previous
+
+
+def _budget():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'query_budget', current_app.config['QUERY_BUDGET'])
+
+
+def _explain(conn, statement, parameters):
+    """EXPLAIN QUERY PLAN of a SELECT on a raw cursor, so it is not instrumented itself."""
+    if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+
+def _full_scans(plan):
+    return [step for step in plan if step.startswith('SCAN ') and ' USING ' not in step
+            and step != 'SCAN CONSTANT ROW']
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['querylog_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('querylog_start', None)
+    if start is None or not has_app_context():
+        return
+    elapsed = time.perf_counter() - start
+    in_request = has_request_context()
+    config = current_app.config
+
+    if in_request:
+        stats = g.setdefault('query_stats', {'count': 0, 'seconds': 0.0, 'statements': Counter()})
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        stats['statements'][statement] += 1
+        if stats['statements'][statement] == config['QUERY_REPEAT_WARN'] and not g.get('query_repeats_expected'):
+            logger.warning(f"Possible N+1: statement ran {config['QUERY_REPEAT_WARN']} times "
+                           f"in {request.endpoint}: {statement}")
+
+    threshold = config['SLOW_QUERY_MS']
+    if threshold is not None and elapsed * 1000 >= threshold and not executemany:
+        plan = _explain(conn, statement, parameters)
+        where = f" in {request.endpoint}" if in_request else ''
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms){where}: {statement} "
+                       f"params={parameters!r} plan={plan}")
+
+    check_scans = config['QUERY_CHECK_SCANS']
+    if check_scans is None:
+        check_scans = current_app.debug
+    if check_scans and not executemany and statement not in _scans_reported:
+        plan = _explain(conn, statement, parameters)
+        scans = _full_scans(plan or [])
+        _scans_reported.add(statement)
+        if scans:
+            where = f" in {request.endpoint}" if in_request else ''
+            logger.warning(f"Full table scan ({', '.join(scans)}){where}: {statement}")
+
+    if in_request:
+        budget = _budget()
+        if budget is not None and stats['count'] == budget + 1:
+            message = f"{request.endpoint} exceeded its query budget of {budget}"
+            if config['QUERY_BUDGET_STRICT']:
+                # Remembered for report_queries() in case the view swallows the exception
+                g.query_budget_exceeded = message
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+def init_querylog(app, engine):
+    """
+    Instrument the engine and report per-request totals in the response
+    (X-Query-Count and X-Query-Time headers).
+    """
+    app.config.setdefault('SLOW_QUERY_MS', 250)
+    # None follows app.debug, which run.py only sets after create_app
+    app.config.setdefault('QUERY_CHECK_SCANS', None)
+    app.config.setdefault('QUERY_REPEAT_WARN', 10)
+    app.config.setdefault('QUERY_BUDGET', None)
+    app.config.setdefault('QUERY_BUDGET_STRICT', False)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.after_request
+    def report_queries(response):
+        exceeded = g.get('query_budget_exceeded')
+        if exceeded is not None:
+            response = app.response_class(exceeded, status=500, mimetype='text/plain')
+        stats = g.get('query_stats')
+        if stats is not None:
+            response.headers['X-Query-Count'] = str(stats['count'])
+            response.headers['X-Query-Time'] = f"{stats['seconds'] * 1000:.1f}ms"
+        return response
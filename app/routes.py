@@ -1,14 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify, flash
+from flask import Blueprint, Response, render_template, request, jsonify, flash
 from app.models import EDCData
 from app import db
-from app.scraper import scrape_edc_data
+from app.ingest import after_ingest, write_rows
+from app.events import log_event, stage
+from app.export import generate_csv, generate_parquet, parquet_available
+from app.series import parse_metrics_arg
+from app.stats import get_stats, stored_days
+from sqlalchemy import text
 from datetime import datetime, timedelta
-import plotly.express as px
-import pandas as pd
 import logging
-import sqlite3
 
 main = Blueprint('main', __name__)
+logger = logging.getLogger('app.routes')
 
 @main.route('/')
 def index():
@@ -28,107 +31,106 @@ def scrape():
         if end_date > datetime.now():
             return jsonify({'message': 'Cannot scrape data for future dates'}), 400
         
-        # Check if data already exists for this date range
-        existing_data = EDCData.query.filter(
-            EDCData.date >= start_date.date(),
-            EDCData.date <= end_date.date()
-        ).first()
+        # Check if data already exists for this date range (completeness index)
+        existing_days = stored_days(start_date, end_date)
         
-        if existing_data:
-            return jsonify({'message': 'Data for this date range already exists in the database'}), 409
+        if existing_days:
+            return jsonify({
+                'message': 'Data for this date range already exists in the database',
+                'days': existing_days,
+            }), 409
         
-        # Scrape data
-        logging.info(f"Starting scrape for date range: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}")
+        # Scrape data (requests and BeautifulSoup are only loaded when needed)
+        from app.scraper import scrape_edc_data
+        logger.info(f"Starting scrape for date range: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}")
         data = scrape_edc_data(start_date, end_date)
         
         if not data:
-            logging.warning("No data was returned from the scraper")
+            logger.warning("No data was returned from the scraper")
             return jsonify({
                 'message': 'No data found for the selected date range. Please check the date range and try again.'
             }), 404
         
         # Save to database
         try:
-            for item in data:
-                edc_data = EDCData(**item)
-                db.session.add(edc_data)
+            write_rows(data)
+            logger.info(f"Successfully saved {len(data)} records to database")
             
-            db.session.commit()
-            logging.info(f"Successfully saved {len(data)} records to database")
+            with stage('after_ingest'):
+                after_ingest(start_date, end_date)
+            log_event('scrape_job', start=start_date.date().isoformat(),
+                      end=end_date.date().isoformat(), rows=len(data))
             
             return jsonify({
                 'message': f'Successfully scraped and stored {len(data)} records for the period {start_date.strftime("%d.%m.%Y")} - {end_date.strftime("%d.%m.%Y")}'
             })
         except Exception as e:
             db.session.rollback()
-            logging.error(f"Database error: {str(e)}")
+            logger.error(f"Database error: {str(e)}")
             return jsonify({'message': f'Error saving data to database: {str(e)}'}), 500
             
     except ValueError as e:
-        logging.error(f"Invalid date format: {str(e)}")
+        logger.error(f"Invalid date format: {str(e)}")
         return jsonify({'message': f'Invalid date format: {str(e)}'}), 400
     except Exception as e:
-        logging.error(f"Unexpected error during scraping: {str(e)}")
+        logger.error(f"Unexpected error during scraping: {str(e)}")
         return jsonify({'message': f'Error during scraping: {str(e)}'}), 500
 
 @main.route('/graph')
 def graph():
+    # Client-side mode: the page fetches columnar data from /api/series itself
+    if request.args.get('mode') == 'webgl':
+        return render_template('graph.html', mode='webgl')
+    
     try:
-        # First try direct SQL query to verify data exists
-        conn = sqlite3.connect('okte_data.db')
-        cursor = conn.cursor()
-        
-        # Get count
-        cursor.execute("SELECT COUNT(*) FROM okte_data")
-        count = cursor.fetchone()[0]
-        logging.info(f"Direct SQL count: {count}")
-        print(f"Direct SQL count: {count}")
+        # First try direct SQL query (on the configured database) to verify data exists
+        count = db.session.execute(text("SELECT COUNT(*) FROM okte_data")).scalar()
+        logger.info(f"Direct SQL count: {count}")
         
         # Get sample data
-        cursor.execute("SELECT * FROM okte_data LIMIT 5")
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-        print(f"Direct SQL sample data rows: {rows}")
-        logging.info(f"Direct SQL sample data columns: {columns}")
-        logging.info(f"Direct SQL sample data rows: {rows}")
+        sample = db.session.execute(text("SELECT * FROM okte_data LIMIT 5"))
+        columns = list(sample.keys())
+        rows = sample.fetchall()
+        logger.info(f"Direct SQL sample data columns: {columns}")
+        logger.info(f"Direct SQL sample data rows: {rows}")
         
         # Now try SQLAlchemy query with detailed debugging
-        logging.info("\nAttempting SQLAlchemy query...")
+        logger.info("\nAttempting SQLAlchemy query...")
         
         # Debug session state
-        logging.info(f"Session is active: {db.session.is_active}")
-        logging.info(f"Session is modified: {db.session.is_modified()}")
+        logger.info(f"Session is active: {db.session.is_active}")
+        logger.info(f"Session has pending changes: {bool(db.session.dirty or db.session.new)}")
         
         # Try different query approaches
         query1 = EDCData.query
         query2 = db.session.query(EDCData)
         
-        logging.info(f"Query1 SQL: {query1.statement}")
-        logging.info(f"Query2 SQL: {query2.statement}")
+        logger.info(f"Query1 SQL: {query1.statement}")
+        logger.info(f"Query2 SQL: {query2.statement}")
         
         # Try to get first record with both queries
         first_record1 = query1.first()
         first_record2 = query2.first()
         
-        logging.info(f"Query1 first record: {first_record1}")
-        logging.info(f"Query2 first record: {first_record2}")
+        logger.info(f"Query1 first record: {first_record1}")
+        logger.info(f"Query2 first record: {first_record2}")
         
         # Try to get all records
         data1 = query1.all()
         data2 = query2.all()
         
-        logging.info(f"Query1 retrieved {len(data1)} records")
-        logging.info(f"Query2 retrieved {len(data2)} records")
+        logger.info(f"Query1 retrieved {len(data1)} records")
+        logger.info(f"Query2 retrieved {len(data2)} records")
         
         # Try to get data with raw SQL through SQLAlchemy
-        result = db.session.execute('SELECT * FROM okte_data LIMIT 5').fetchall()
-        logging.info(f"Raw SQL through SQLAlchemy: {result}")
+        result = db.session.execute(text('SELECT * FROM okte_data LIMIT 5')).fetchall()
+        logger.info(f"Raw SQL through SQLAlchemy: {result}")
         
         # Use the data that works
         data = data1 if data1 else data2 if data2 else []
         
         if not data:
-            logging.warning("No data found in database")
+            logger.warning("No data found in database")
             return render_template('graph.html', data=None)
         
         # Convert data to list of dictionaries for JSON serialization
@@ -144,39 +146,98 @@ def graph():
         
         return render_template('graph.html', data=data_list)
     except Exception as e:
-        logging.error(f"Error in graph route: {str(e)}")
+        logger.error(f"Error in graph route: {str(e)}")
         return render_template('graph.html', data=None)
 
+@main.route('/export')
+def export():
+    """
+    Stream okte_data as CSV (default) or Parquet.
+    Query parameters: start/end (inclusive YYYY-MM-DD), metrics (comma
+    separated), format (csv|parquet) and after (resume after this row id).
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+        metrics = parse_metrics_arg(request.args.get('metrics'))
+        after = int(request.args['after']) if request.args.get('after') else None
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'parquet'):
+        return jsonify({'message': f'Unknown export format: {fmt}'}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'message': 'Parquet export requires the pyarrow package'}), 501
+    if after is not None and db.session.get(EDCData, after) is None:
+        return jsonify({'message': f'Unknown row id for after: {after}'}), 400
+    
+    name = 'okte_data'
+    if start:
+        name += f"_{start.strftime('%Y%m%d')}"
+    if end:
+        name += f"_{(end - timedelta(days=1)).strftime('%Y%m%d')}"
+    logger.info(f"Starting {fmt} export {name} after={after}")
+    
+    if fmt == 'parquet':
+        body = generate_parquet(db.engine, start, end, metrics, after)
+        mimetype = 'application/vnd.apache.parquet'
+    else:
+        body = generate_csv(db.engine, start, end, metrics, after)
+        mimetype = 'text/csv'
+    
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    return response
+
+@main.route('/health')
+def health():
+    """Liveness plus data freshness, read from the maintained table stats."""
+    try:
+        stats = get_stats()
+    except Exception as e:
+        logger.error(f"Health check failed: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    return jsonify({'status': 'ok', 'okte_data': stats})
+
 @main.route('/debug')
 def debug():
+    """
+    Tables with a few sample rows. The okte_data count comes from the
+    maintained stats; other tables are only counted with ?exact=1.
+    """
     try:
-        # Direct SQLite connection
-        conn = sqlite3.connect('okte_data.db')
-        cursor = conn.cursor()
-        
-        # Get table info
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        exact = request.args.get('exact') == '1'
+        stats = get_stats()
+        tables = db.session.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars().all()
         
         result = []
-        for table in tables:
-            table_name = table[0]
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
+        for table_name in tables:
+            if table_name == 'okte_data' and stats is not None and not exact:
+                count = stats['rows']
+            elif exact or table_name == 'okte_data':
+                count = db.session.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            else:
+                count = None
             
             # Get sample data
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-            columns = [description[0] for description in cursor.description]
-            rows = cursor.fetchall()
+            rows = db.session.execute(text(f"SELECT * FROM {table_name} LIMIT 5"))
+            columns = list(rows.keys())
             
-            result.append({
+            entry = {
                 'table': table_name,
                 'count': count,
                 'columns': columns,
-                'sample_data': [dict(zip(columns, row)) for row in rows]
-            })
+                # BLOB columns (the okte_day_stats missing-period bitmap) as hex
+                'sample_data': [
+                    {name: value.hex() if isinstance(value, bytes) else value for name, value in zip(columns, row)}
+                    for row in rows
+                ]
+            }
+            if table_name == 'okte_data':
+                entry['stats'] = stats
+            result.append(entry)
         
-        conn.close()
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -191,35 +252,26 @@ def test_db():
             'sqlalchemy_query': {}
         }
         
-        # Test direct SQL
-        conn = sqlite3.connect('okte_data.db')
-        cursor = conn.cursor()
-        
-        # Get table info
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        result['direct_sql']['tables'] = [table[0] for table in tables]
+        # Test direct SQL on the configured database (not a file in the working directory)
+        tables = db.session.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars().all()
+        result['direct_sql']['tables'] = list(tables)
         
-        # Get okte_data count
-        cursor.execute("SELECT COUNT(*) FROM okte_data")
-        count = cursor.fetchone()[0]
-        result['direct_sql']['okte_data_count'] = count
+        # Get okte_data count (maintained by ingestion, no table scan)
+        stats = get_stats()
+        result['direct_sql']['okte_data_count'] = stats['rows'] if stats else None
         
         # Get sample data
-        cursor.execute("SELECT * FROM okte_data LIMIT 1")
-        row = cursor.fetchone()
+        row = db.session.execute(text("SELECT * FROM okte_data LIMIT 1")).mappings().first()
         if row:
-            result['direct_sql']['sample_row'] = dict(zip([col[0] for col in cursor.description], row))
-        
-        conn.close()
+            result['direct_sql']['sample_row'] = dict(row)
         
         # Test SQLAlchemy
         with db.engine.connect() as conn:
             result['sqlalchemy_query']['connection'] = "Success"
             
             # Try to get count
-            count = db.session.query(EDCData).count()
-            result['sqlalchemy_query']['count'] = count
+            stats = get_stats()
+            result['sqlalchemy_query']['count'] = stats['rows'] if stats else None
             
             # Try to get first record
             first = db.session.query(EDCData).first()
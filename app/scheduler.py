@@ -0,0 +1,168 @@
+"""
+Scheduled daily ingestion of new OKTE days.
+
+At each of the INGEST_TIMES (local time of day) the scheduler scrapes the
+last INGEST_LOOKBACK_DAYS days and today, plus every day of the last
+INGEST_CATCHUP_DAYS that the completeness index reports as missing or
+incomplete. Days that failed with a request error are retried with
+exponential backoff; days OKTE has not published yet are left for the next
+run. Runs missed while the process was down or asleep are coalesced into a
+single catch-up run, which the gap-aware day selection makes sufficient.
+
+    flask --app run edc scheduler          # run until interrupted
+    flask --app run edc ingest             # one run now
+"""
+import logging
+import random
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.events import job_context, log_event, stage
+from app.metrics import INGEST_RUNS
+
+logger = logging.getLogger('app.scheduler')
+
+DEFAULT_TIMES = ('07:00', '19:00')
+
+
+def parse_times(value):
+    """'07:00,19:00' (or a list of 'HH:MM' strings) as sorted datetime.time values."""
+    if isinstance(value, str):
+        value = value.split(',')
+    return sorted(time.fromisoformat(item.strip()) for item in value if item.strip())
+
+
+def next_due(now, times):
+    """First scheduled datetime strictly after `now`."""
+    for when in times:
+        candidate = datetime.combine(now.date(), when)
+        if candidate > now:
+            return candidate
+    return datetime.combine(now.date() + timedelta(days=1), times[0])
+
+
+def last_due(now, times):
+    """Most recent scheduled datetime at or before `now`."""
+    for when in reversed(times):
+        candidate = datetime.combine(now.date(), when)
+        if candidate <= now:
+            return candidate
+    return datetime.combine(now.date() - timedelta(days=1), times[-1])
+
+
+def days_to_ingest(today, lookback, catchup):
+    """The last `lookback` days and today, plus incomplete days of the last `catchup` days."""
+    from app.stats import completeness
+    days = {today - timedelta(days=n) for n in range(lookback + 1)}
+    gaps = completeness(today - timedelta(days=catchup), today)
+    days.update(date.fromisoformat(day) for day in gaps['missing_days'])
+    days.update(date.fromisoformat(item['day']) for item in gaps['incomplete_days'])
+    return sorted(days)
+
+
+def configure_ingest(app):
+    app.config.setdefault('INGEST_TIMES', DEFAULT_TIMES)
+    app.config.setdefault('INGEST_LOOKBACK_DAYS', 1)
+    app.config.setdefault('INGEST_CATCHUP_DAYS', 31)
+    app.config.setdefault('INGEST_RETRIES', 4)
+    app.config.setdefault('INGEST_BACKOFF_S', 30)
+    app.config.setdefault('INGEST_BACKOFF_MAX_S', 900)
+
+
+def run_ingest(app, today=None, stop=None):
+    """
+    One ingestion run with retries. Returns a summary dict; the outcome is
+    'ok', 'partial' (some days still failed after all retries) or 'failed'.
+    """
+    from app.ingest import ingest_days
+
+    configure_ingest(app)
+    config = app.config
+    stop = stop or threading.Event()
+    with app.app_context(), job_context():
+        today = today or date.today()
+        pending = days_to_ingest(today, config['INGEST_LOOKBACK_DAYS'], config['INGEST_CATCHUP_DAYS'])
+        days, statuses, rows, attempts = len(pending), {}, 0, 0
+        try:
+            while pending:
+                attempts += 1
+                with stage('ingest_attempt', attempt=attempts, days=len(pending)):
+                    result, written = ingest_days(pending)
+                statuses.update(result)
+                rows += written
+                pending = [day for day, status in result.items() if status == 'error']
+                if not pending or attempts > config['INGEST_RETRIES']:
+                    break
+                delay = min(config['INGEST_BACKOFF_S'] * 2 ** (attempts - 1), config['INGEST_BACKOFF_MAX_S'])
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Ingest: {len(pending)} days failed, retrying in {delay:.0f} s")
+                if stop.wait(delay):
+                    break
+            outcome = 'partial' if pending else 'ok'
+        except Exception as e:
+            logger.error(f"Ingest run failed: {str(e)}")
+            outcome = 'failed'
+
+        counts = {}
+        for status in statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        INGEST_RUNS.labels(outcome).inc()
+        log_event('ingest_run', status=outcome, days=days, rows=rows, attempts=attempts,
+                  failed=[day.isoformat() for day in pending], statuses=counts)
+        logger.info(f"Ingest run {outcome}: {rows} rows from {days} days in {attempts} attempts")
+        return {'status': outcome, 'days': days, 'rows': rows, 'attempts': attempts,
+                'failed': [day.isoformat() for day in pending], 'statuses': counts}
+
+
+class IngestScheduler:
+    """
+    Runs run_ingest() at the configured times of day, on the calling thread
+    (run_forever) or on a daemon thread (start/stop).
+
+    Config keys: INGEST_TIMES, INGEST_LOOKBACK_DAYS (default 1, i.e.
+    yesterday), INGEST_CATCHUP_DAYS (31), INGEST_RETRIES (4),
+    INGEST_BACKOFF_S (30) and INGEST_BACKOFF_MAX_S (900).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        configure_ingest(app)
+        self.times = parse_times(app.config['INGEST_TIMES'])
+        self.stop_event = threading.Event()
+        self._thread = None
+
+    def missed_run(self, now):
+        """True when a scheduled time passed since the last stored ingest."""
+        from app.stats import get_stats
+        with self.app.app_context():
+            stats = get_stats()
+        last = (stats or {}).get('last_ingest_at')
+        if last is None:
+            return True
+        # last_ingest_at is naive UTC; the schedule is local time
+        due = last_due(now, self.times).astimezone(timezone.utc).replace(tzinfo=None)
+        return datetime.fromisoformat(last) < due
+
+    def run_forever(self):
+        if self.missed_run(datetime.now()):
+            logger.info('Ingest: scheduled runs were missed, catching up once')
+            run_ingest(self.app, stop=self.stop_event)
+        while not self.stop_event.is_set():
+            due = next_due(datetime.now(), self.times)
+            logger.info(f"Ingest: next run at {due:%Y-%m-%d %H:%M}")
+            # Wake up at least every minute so a clock change or a sleep is noticed
+            while not self.stop_event.is_set() and datetime.now() < due:
+                self.stop_event.wait(min(60, max((due - datetime.now()).total_seconds(), 0)))
+            if not self.stop_event.is_set():
+                # However late we wake up, the missed times collapse into this run
+                run_ingest(self.app, stop=self.stop_event)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name='ingest-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -2,6 +2,19 @@ import requests
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from flask import current_app
+from app.events import log_event, stage
+from app.metrics import SCRAPED_DAYS, ROWS_PARSED
+import time
+
+OKTE_URL = "https://okte.sk/sk/edc/zverejnovanie-udajov/aktivovana-agregovana-flexibilita-a-zdielanie-elektriny/"
+
+# Headers to mimic a browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+}
 
 def scrape_edc_data(start_date, end_date):
     """
@@ -10,86 +23,13 @@ def scrape_edc_data(start_date, end_date):
     """
     all_data = []
     current_date = start_date
-    base_url = "https://okte.sk/sk/edc/zverejnovanie-udajov/aktivovana-agregovana-flexibilita-a-zdielanie-elektriny/"
-    
-    # Set up headers to mimic a browser
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-    }
     
     # Create a session to maintain cookies
     session = requests.Session()
     
     while current_date <= end_date:
-        try:
-            # Format date for the form (DD.MM.YYYY format as required by the website)
-            date_str = current_date.strftime('%d.%m.%Y')
-            current_app.logger.info(f"Attempting to scrape data for date: {date_str}")
-            
-            # First, get the initial page to get any necessary cookies/tokens
-            response = session.get(base_url, headers=headers)
-            response.raise_for_status()
-            
-            # Prepare the form data for the date selection
-            form_data = {
-                'date': date_str,
-                'submit': 'Zobraziť'  # The submit button value
-            }
-            
-            print(f"form_data: {form_data}")
-            current_app.logger.info(f"Submitting form with data: {form_data}")
-            
-            # Submit the form with the date
-            response = session.post(base_url, data=form_data, headers=headers)
-            response.raise_for_status()
-            
-            # Parse HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find the data table
-            table = soup.find('table')
-            if not table:
-                current_app.logger.warning(f"No data table found for date {date_str}")
-                current_date += timedelta(days=1)
-                continue
-            
-            # Extract data from table rows
-            rows = table.find_all('tr')[1:]  # Skip header row
-            day_data = []
-            
-            for row in rows:
-                cols = row.find_all('td')
-                if len(cols) >= 4:
-                    try:
-                        zuctovacia_perioda = cols[0].text.strip()
-                        aktivovana_agregovana_flexibilita_kladna = float(cols[1].text.strip().replace(',', '.'))
-                        aktivovana_agregovana_flexibilita_zaporna = float(cols[2].text.strip().replace(',', '.'))
-                        zdielana_elektrina = float(cols[3].text.strip().replace(',', '.'))
-                        
-                        day_data.append({
-                            'datum': current_date,
-                            'zuctovacia_perioda': zuctovacia_perioda,
-                            'aktivovana_agregovana_flexibilita_kladna': aktivovana_agregovana_flexibilita_kladna,
-                            'aktivovana_agregovana_flexibilita_zaporna': aktivovana_agregovana_flexibilita_zaporna,
-                            'zdielana_elektrina': zdielana_elektrina
-                        })
-                    except (ValueError, IndexError) as e:
-                        current_app.logger.error(f"Error parsing row for date {date_str}: {str(e)}")
-                        continue
-            
-            if day_data:
-                all_data.extend(day_data)
-                current_app.logger.info(f"Successfully scraped {len(day_data)} records for {date_str}")
-            else:
-                current_app.logger.warning(f"No valid data found for date {date_str}")
-            
-        except requests.RequestException as e:
-            current_app.logger.error(f"Request error for date {date_str}: {str(e)}")
-        except Exception as e:
-            current_app.logger.error(f"Error scraping data for date {date_str}: {str(e)}")
+        status, day_data = scrape_day(session, current_date)
+        all_data.extend(day_data or [])
         
         # Move to next day
         current_date += timedelta(days=1)
@@ -99,4 +39,107 @@ def scrape_edc_data(start_date, end_date):
     else:
         current_app.logger.info(f"Total records collected: {len(all_data)}")
     
-    return all_data 
\ No newline at end of file
+    return all_data
+
+
+def scrape_day(session, current_date):
+    """
+    Scrape one day (a datetime at midnight) with a requests session.
+    Returns (status, rows): status is 'ok', 'no_table' (nothing published),
+    'no_rows' or 'error' (request or parse failure, worth retrying).
+    """
+    base_url = current_app.config.get('OKTE_URL', OKTE_URL)
+    # Format date for the form (DD.MM.YYYY format as required by the website)
+    date_str = current_date.strftime('%d.%m.%Y')
+    day = current_date.date().isoformat()
+    day_start = time.perf_counter()
+    status, day_data = 'error', None
+    try:
+        current_app.logger.info(f"Attempting to scrape data for date: {date_str}")
+        
+        # First, get the initial page to get any necessary cookies/tokens
+        with stage('http_get', date=day) as timing:
+            response = session.get(base_url, headers=HEADERS)
+            response.raise_for_status()
+            timing['bytes'] = len(response.content)
+        
+        # Prepare the form data for the date selection
+        form_data = {
+            'date': date_str,
+            'submit': 'Zobraziť'  # The submit button value
+        }
+        
+        current_app.logger.debug(f"Submitting form with data: {form_data}")
+        
+        # Submit the form with the date
+        with stage('http_post', date=day) as timing:
+            response = session.post(base_url, data=form_data, headers=HEADERS)
+            response.raise_for_status()
+            timing['bytes'] = len(response.content)
+        
+        with stage('parse', date=day) as timing:
+            day_data = _parse_day(response.text, current_date, date_str)
+            timing['rows'] = 0 if day_data is None else len(day_data)
+        
+        if day_data is None:
+            status = 'no_table'
+            current_app.logger.warning(f"No data table found for date {date_str}")
+        elif day_data:
+            status = 'ok'
+            current_app.logger.info(f"Successfully scraped {len(day_data)} records for {date_str}")
+        else:
+            status = 'no_rows'
+            current_app.logger.warning(f"No valid data found for date {date_str}")
+        
+    except requests.RequestException as e:
+        current_app.logger.error(f"Request error for date {date_str}: {str(e)}")
+    except Exception as e:
+        current_app.logger.error(f"Error scraping data for date {date_str}: {str(e)}")
+    
+    SCRAPED_DAYS.labels(status).inc()
+    ROWS_PARSED.inc(len(day_data or []))
+    log_event(
+        'scrape_day',
+        date=day,
+        status=status,
+        rows=len(day_data or []),
+        duration_ms=round((time.perf_counter() - day_start) * 1000, 3),
+    )
+    return status, day_data
+
+
+def _parse_day(html, current_date, date_str):
+    """Rows of the OKTE table for one day, or None when the page has no table."""
+    # Parse HTML
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Find the data table
+    table = soup.find('table')
+    if not table:
+        return None
+    
+    # Extract data from table rows
+    rows = table.find_all('tr')[1:]  # Skip header row
+    day_data = []
+    
+    for row in rows:
+        cols = row.find_all('td')
+        if len(cols) >= 4:
+            try:
+                zuctovacia_perioda = cols[0].text.strip()
+                aktivovana_agregovana_flexibilita_kladna = float(cols[1].text.strip().replace(',', '.'))
+                aktivovana_agregovana_flexibilita_zaporna = float(cols[2].text.strip().replace(',', '.'))
+                zdielana_elektrina = float(cols[3].text.strip().replace(',', '.'))
+                
+                day_data.append({
+                    'datum': current_date,
+                    'zuctovacia_perioda': zuctovacia_perioda,
+                    'aktivovana_agregovana_flexibilita_kladna': aktivovana_agregovana_flexibilita_kladna,
+                    'aktivovana_agregovana_flexibilita_zaporna': aktivovana_agregovana_flexibilita_zaporna,
+                    'zdielana_elektrina': zdielana_elektrina
+                })
+            except (ValueError, IndexError) as e:
+                current_app.logger.error(f"Error parsing row for date {date_str}: {str(e)}")
+                continue
+    
+    return day_data
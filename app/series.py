@@ -0,0 +1,269 @@
+"""
+Columnar read path for okte_data.
+
+Rows are returned as one timestamp array plus one array per metric instead of
+a list of row dictionaries, which is what the client-side charts and the
+analytics code consume.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from app import db
+from app.models import METRIC_COLUMNS
+
+PERIOD_MINUTES = 15
+PERIOD_MS = PERIOD_MINUTES * 60 * 1000
+PERIODS_PER_DAY = 96
+
+# Numbered periods of the DST change days, by month: (periods before the
+# clock change, wall-clock shift in minutes of the periods after it). Spring
+# skips 02:00-03:00 after period 8; autumn repeats 02:00-03:00 after period 12.
+DST_SHIFTS = {3: (8, 60), 10: (12, -60)}
+
+# SQL equivalent of parse_period() for use in GROUP BY expressions
+PERIOD_INDEX_SQL = (
+    "(CASE WHEN instr(zuctovacia_perioda, ':') > 0 THEN "
+    "(CAST(substr(trim(zuctovacia_perioda), 1, instr(trim(zuctovacia_perioda), ':') - 1) AS INTEGER) * 60 "
+    "+ CAST(substr(trim(zuctovacia_perioda), instr(trim(zuctovacia_perioda), ':') + 1, 2) AS INTEGER)) / 15 + 1 "
+    "ELSE CAST(zuctovacia_perioda AS INTEGER) END)"
+)
+
+# Wall-clock minutes after midnight of a period start, as load_columns() maps
+# it. A last Sunday of March or October is a day 25-31 of the month.
+_DST_DAY_SQL = ("instr(zuctovacia_perioda, ':') = 0 AND substr(datum, 9, 2) >= '25' "
+                "AND strftime('%w', substr(datum, 1, 10)) = '0'")
+PERIOD_MINUTES_SQL = (
+    f"(({PERIOD_INDEX_SQL} - 1) * {PERIOD_MINUTES} + CASE WHEN {_DST_DAY_SQL} THEN CASE "
+    + " ".join(f"WHEN substr(datum, 6, 2) = '{month:02d}' AND {PERIOD_INDEX_SQL} > {before} THEN {shift}"
+               for month, (before, shift) in DST_SHIFTS.items())
+    + " ELSE 0 END ELSE 0 END)"
+)
+
+_period_cache = {}
+
+
+def parse_period(value):
+    """
+    Convert a zuctovacia_perioda value to its 1-based index within the day.
+    Accepts plain numbers ("1".."100") as well as time ranges ("00:15 - 00:30").
+    """
+    try:
+        return _period_cache[value]
+    except KeyError:
+        pass
+    text_value = str(value).strip()
+    if ':' in text_value:
+        hours, minutes = text_value.split('-')[0].strip().split(':')[:2]
+        index = (int(hours) * 60 + int(minutes)) // PERIOD_MINUTES + 1
+    else:
+        index = int(float(text_value.replace(',', '.')))
+    _period_cache[value] = index
+    return index
+
+
+def as_date(value):
+    """Accept a date, datetime or 'YYYY-MM-DD...' string and return a date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _last_sunday(year, month):
+    last = date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() + 1) % 7)
+
+
+def expected_periods(day):
+    """Settlement periods of a day: one hour less or more on the EU DST change days."""
+    day = as_date(day)
+    for month, (_, shift) in DST_SHIFTS.items():
+        if day == _last_sunday(day.year, month):
+            return PERIODS_PER_DAY - shift // PERIOD_MINUTES
+    return PERIODS_PER_DAY
+
+
+def period_numbers(value, day):
+    """
+    Settlement period numbers of `day` that a zuctovacia_perioda value stands
+    for. Time ranges are wall-clock times: on the DST change days the skipped
+    spring hour stands for no period, and the repeated autumn hour, which its
+    label cannot tell apart, for both of its periods.
+    """
+    index = parse_period(value)
+    if ':' not in str(value):
+        return (index,)
+    day = as_date(day)
+    for month, (before, minutes) in DST_SHIFTS.items():
+        if day == _last_sunday(day.year, month):
+            shifted = index - minutes // PERIOD_MINUTES
+            return tuple(p for p, valid in ((index, index <= before), (shifted, shifted > before)) if valid)
+    return (index,)
+
+
+def _dst_shift_ms(day_ms, periods, period_index):
+    """
+    Wall-clock correction of the numbered periods of the DST change days, so
+    that every period of a day maps into that day: the skipped spring hour
+    leaves a gap at 02:00 and the repeated autumn hour shares 02:00-02:45.
+    Periods given as time ranges are wall-clock times already.
+    """
+    shift = np.zeros(len(day_ms), dtype=np.int64)
+    first, last = (np.datetime64(int(ms), 'ms').astype('datetime64[D]').item() for ms in (day_ms.min(), day_ms.max()))
+    for year in range(first.year, last.year + 1):
+        for month, (before, minutes) in DST_SHIFTS.items():
+            change_ms = _to_ms(_last_sunday(year, month))
+            rows = np.flatnonzero((day_ms == change_ms) & (period_index > before))
+            shift[[i for i in rows.tolist() if ':' not in str(periods[i])]] = minutes * 60000
+    return shift
+
+
+def parse_datetime_arg(value, end=False):
+    """
+    Parse a date or datetime query argument.
+    A bare date used as the end of a range includes that whole day.
+    """
+    if value is None or value == '':
+        return None
+    parsed = datetime.fromisoformat(value.strip().replace('Z', ''))
+    if end and len(value.strip()) == 10:
+        parsed += timedelta(days=1)
+    return parsed.replace(tzinfo=None)
+
+
+def parse_metrics_arg(value):
+    if not value:
+        return list(METRIC_COLUMNS)
+    metrics = [m.strip() for m in value.split(',') if m.strip()]
+    unknown = [m for m in metrics if m not in METRIC_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown metric(s): {', '.join(unknown)}")
+    return metrics
+
+
+def data_bounds():
+    """Return (first_day, last_day) stored in okte_data as date strings, or (None, None)."""
+    row = db.session.execute(text(
+        "SELECT substr(MIN(datum), 1, 10), substr(MAX(datum), 1, 10) FROM okte_data"
+    )).fetchone()
+    return row[0], row[1]
+
+
+def closed_horizon(today=None):
+    """
+    First day that may still change: the earlier of today and the newest
+    stored day (which may be only partially ingested). Data strictly before
+    it is considered closed. Returns None when the table is empty.
+    """
+    _, last = data_bounds()
+    if last is None:
+        return None
+    return min(today or date.today(), date.fromisoformat(last))
+
+
+def load_columns(start=None, end=None, metrics=None, day_ranges=None):
+    """
+    Load okte_data between start (inclusive) and end (exclusive) as columns.
+    `day_ranges` optionally restricts the rows further to any of several
+    (first_day, end_day) date ranges, end exclusive, in the same query.
+
+    Returns a dict with 't' holding int64 epoch milliseconds of each period
+    start (local wall-clock time, encoded as UTC; see _dst_shift_ms() for the
+    DST change days) and one float64 array per metric with NaN for missing
+    values. Rows are sorted by time, then period.
+    """
+    metrics = list(metrics or METRIC_COLUMNS)
+    clauses, params = [], {}
+    if start is not None:
+        clauses.append("datum >= :start_day")
+        params['start_day'] = start.strftime('%Y-%m-%d')
+    if end is not None:
+        clauses.append("datum < :end_day")
+        params['end_day'] = (end + timedelta(days=1) if end.time() != datetime.min.time() else end).strftime('%Y-%m-%d')
+    if day_ranges:
+        ranges = []
+        for i, (first_day, end_day) in enumerate(day_ranges):
+            ranges.append(f"(datum >= :range_start_{i} AND datum < :range_end_{i})")
+            params[f'range_start_{i}'] = first_day.isoformat()
+            params[f'range_end_{i}'] = end_day.isoformat()
+        clauses.append(f"({' OR '.join(ranges)})")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = text(
+        f"SELECT substr(datum, 1, 10), zuctovacia_perioda, {', '.join(metrics)} "
+        f"FROM okte_data {where} ORDER BY datum"
+    )
+    rows = db.session.execute(sql, params).fetchall()
+
+    if not rows:
+        columns = {'t': np.empty(0, dtype=np.int64)}
+        columns.update({m: np.empty(0, dtype=np.float64) for m in metrics})
+        return columns
+
+    days, periods, *values = zip(*rows)
+    day_ms = np.array(days, dtype='datetime64[D]').astype('datetime64[ms]').astype(np.int64)
+    period_index = np.fromiter((parse_period(p) for p in periods), dtype=np.int64, count=len(periods))
+    t = day_ms + (period_index - 1) * PERIOD_MS + _dst_shift_ms(day_ms, periods, period_index)
+
+    order = np.lexsort((period_index, t))
+    columns = {'t': t[order]}
+    for name, column in zip(metrics, values):
+        columns[name] = np.array(column, dtype=np.float64)[order]
+
+    # The SQL filter works on whole days; trim to the exact requested window
+    if start is not None or end is not None:
+        lo = _to_ms(start) if start is not None else columns['t'][0]
+        hi = _to_ms(end) if end is not None else columns['t'][-1] + 1
+        mask = (columns['t'] >= lo) & (columns['t'] < hi)
+        if not mask.all():
+            columns = {name: column[mask] for name, column in columns.items()}
+    return columns
+
+
+def downsample_minmax(columns, max_points):
+    """
+    Reduce columns to at most max_points samples.
+
+    The time range is split into max_points // 2 equal buckets and each bucket
+    contributes its minimum and maximum, so peaks survive downsampling.
+    Returns the columns unchanged when they are already small enough.
+    """
+    t = columns['t']
+    if max_points is None or len(t) <= max_points or max_points < 2:
+        return columns
+
+    buckets = max_points // 2
+    span = int(t[-1] - t[0]) + 1
+    bucket = ((t - t[0]) * buckets) // span
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+
+    result = {'t': np.column_stack((t[starts], t[ends])).ravel()}
+    for name, column in columns.items():
+        if name == 't':
+            continue
+        # fmin/fmax ignore NaN unless the whole bucket is missing
+        lows = np.fmin.reduceat(column, starts)
+        highs = np.fmax.reduceat(column, starts)
+        result[name] = np.column_stack((lows, highs)).ravel()
+    return result
+
+
+def columns_to_json(columns):
+    """Convert numpy columns to JSON-ready lists, with NaN mapped to null."""
+    result = {}
+    for name, column in columns.items():
+        if column.dtype.kind == 'f':
+            values = column.tolist()
+            if np.isnan(column).any():
+                values = [None if v != v else v for v in values]
+            result[name] = values
+        else:
+            result[name] = column.tolist()
+    return result
+
+
+def _to_ms(value):
+    return int(np.datetime64(value, 'ms').astype(np.int64))
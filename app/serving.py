@@ -0,0 +1,151 @@
+"""
+Production serving: worker-safe startup and the multi-worker entry point.
+
+Several worker processes may start at once. Schema creation is serialised
+with a lock file (SCHEMA_LOCK_FILE, by default in the instance folder), so
+only the first worker creates tables and indexes and the others find them
+in place. When the app is
+preloaded in a master process and forked, the database pool is discarded in
+each worker (connections must not be shared across processes) and logging
+is restarted by logging_config.
+
+See serve.py for the command line.
+"""
+import logging
+import os
+import weakref
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+
+from app import db
+
+SERVERS = ('auto', 'gunicorn', 'waitress', 'uvicorn', 'werkzeug')
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock shared between processes, held for the block."""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def init_schema(app):
+    """Create missing tables, indexes, table stats and tile pyramid, one process at a time."""
+    lock_file = app.config.get('SCHEMA_LOCK_FILE') or os.path.join(app.instance_path, 'schema.lock')
+    os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+    with _file_lock(lock_file), app.app_context():
+        db.create_all()
+        # create_all skips indexes on tables that already exist
+        from app.models import EDCData
+        for index in EDCData.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        # Databases filled before okte_stats (or its missing-period bitmap)
+        # existed are counted once
+        from app.stats import get_stats, rebuild_stats
+        columns = {c['name'] for c in inspect(db.engine).get_columns('okte_day_stats')}
+        if 'missing' not in columns:
+            db.session.execute(text('ALTER TABLE okte_day_stats ADD COLUMN missing BLOB'))
+            rebuild_stats()
+        elif get_stats() is None:
+            rebuild_stats()
+        # Likewise the pyramid of databases filled before okte_pyramid existed
+        has_rows = db.session.execute(text('SELECT 1 FROM okte_data LIMIT 1')).first() is not None
+        if has_rows and db.session.execute(text('SELECT 1 FROM okte_pyramid LIMIT 1')).first() is None:
+            from app.tiles import rebuild_pyramid
+            rebuild_pyramid()
+
+
+def register_fork_hooks(app):
+    """Discard pooled connections inherited by a forked worker."""
+    if not hasattr(os, 'register_at_fork'):
+        return
+    ref = weakref.ref(app)
+
+    def dispose_inherited_pool():
+        forked = ref()
+        if forked is not None:
+            with forked.app_context():
+                db.engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=dispose_inherited_pool)
+
+
+def _available(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def pick_server(server, workers):
+    """Resolve 'auto' to gunicorn (POSIX, several workers), then waitress, then werkzeug."""
+    if server != 'auto':
+        return server
+    if os.name != 'nt' and _available('gunicorn'):
+        return 'gunicorn'
+    if _available('waitress'):
+        return 'waitress'
+    return 'werkzeug'
+
+
+def serve(app, host='127.0.0.1', port=8000, workers=1, threads=8, server='auto'):
+    """
+    Serve `app` with a production WSGI server. gunicorn runs `workers`
+    preforked processes of `threads` threads each from the already created
+    (preloaded) app; waitress and the threaded Werkzeug fallback run a
+    single process. uvicorn serves the ASGI wrapper (app/asgi.py) in one
+    process with `threads` threads for the read endpoints; for several
+    uvicorn workers use `uvicorn asgi:app --workers N`.
+    """
+    if server not in SERVERS:
+        raise ValueError(f"Server must be one of: {', '.join(SERVERS)}")
+    server = pick_server(server, workers)
+    if server != 'gunicorn' and workers > 1:
+        app.logger.warning(f'{server} runs a single process; ignoring workers={workers}')
+    app.logger.info(f'Serving on {host}:{port} with {server} '
+                    f'({workers if server == "gunicorn" else 1} workers x {threads} threads)')
+
+    if server == 'gunicorn':
+        from gunicorn.app.base import BaseApplication
+
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f'{host}:{port}')
+                self.cfg.set('workers', workers)
+                self.cfg.set('threads', threads)
+                self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+                self.cfg.set('preload_app', True)
+
+            def load(self):
+                return app
+
+        Application().run()
+    elif server == 'uvicorn':
+        import uvicorn
+        from app.asgi import create_asgi_app
+        app.config['ASGI_THREADS'] = threads
+        uvicorn.run(create_asgi_app(app), host=host, port=port, log_level='warning')
+    elif server == 'waitress':
+        import waitress
+        waitress.serve(app, host=host, port=port, threads=threads)
+    else:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        make_server(host, port, app, threaded=threads > 1).serve_forever()
@@ -0,0 +1,161 @@
+"""
+Maintained statistics of okte_data, so that health checks, /debug and
+completeness questions do not have to scan the table.
+
+okte_day_stats holds the number of rows and of distinct settlement periods
+stored for every day, next to the number of periods the day should have (96,
+or 92 and 100 on the DST change days) and a bitmap of the missing ones. It is
+the completeness index: which days of a range are incomplete or absent is
+answered from one row per stored day. okte_stats sums it up in a single row:
+total rows, stored days, incomplete days, first and last day and the time of
+the last ingest. Ingestion refreshes the days it wrote; reading the summary is
+one primary-key lookup.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, text
+
+from app import db
+from app.models import EDCDayStats, EDCStats
+from app.series import as_date, expected_periods, period_numbers
+
+STATS_NAME = 'okte_data'
+
+
+def missing_bitmap(periods, expected):
+    """Bitmap of the periods 1..expected absent from `periods` (bit p - 1 for period p)."""
+    bits = (1 << expected) - 1
+    for period in periods:
+        if 1 <= period <= expected:
+            bits &= ~(1 << (period - 1))
+    return bits.to_bytes((expected + 7) // 8, 'little')
+
+
+def missing_periods(bitmap):
+    """Period numbers whose bit is set in a bitmap from missing_bitmap()."""
+    bits = int.from_bytes(bitmap or b'', 'little')
+    return [i + 1 for i in range(bits.bit_length()) if bits >> i & 1]
+
+
+def _summarize(ingested):
+    """Recompute the okte_stats row from okte_day_stats (one row per stored day)."""
+    rows, days, incomplete, first, last = db.session.execute(text(
+        "SELECT COALESCE(SUM(rows), 0), COUNT(*), COALESCE(SUM(periods < expected), 0), "
+        "MIN(day), MAX(day) FROM okte_day_stats"
+    )).fetchone()
+    summary = db.session.get(EDCStats, STATS_NAME) or EDCStats(name=STATS_NAME)
+    summary.rows, summary.days, summary.incomplete_days = rows, days, incomplete
+    summary.first_day, summary.last_day = first, last
+    summary.updated_at = datetime.utcnow()
+    if ingested:
+        summary.last_ingest_at = summary.updated_at
+    db.session.add(summary)
+
+
+def _present_periods(labels, day):
+    """Period numbers of a day named by its zuctovacia_perioda labels, skipping unparseable ones."""
+    present = set()
+    for label in labels:
+        try:
+            present.update(period_numbers(label, day))
+        except ValueError:
+            continue
+    return present
+
+
+def refresh_stats(start_day, end_day, ingested=True):
+    """
+    Recount the days start_day..end_day (inclusive) and update the summary.
+    Costs one indexed range scan of the refreshed days. Commits the session.
+    """
+    start_day, end_day = as_date(start_day), as_date(end_day)
+    counts = db.session.execute(text(
+        "SELECT substr(datum, 1, 10) AS day, COUNT(*), group_concat(DISTINCT zuctovacia_perioda) "
+        "FROM okte_data WHERE datum >= :start_day AND datum < :end_day GROUP BY day"
+    ), {
+        'start_day': start_day.isoformat(),
+        'end_day': (end_day + timedelta(days=1)).isoformat(),
+    }).fetchall()
+
+    db.session.execute(delete(EDCDayStats).where(
+        EDCDayStats.day >= start_day.isoformat(), EDCDayStats.day <= end_day.isoformat()
+    ))
+    if counts:
+        now = datetime.utcnow()
+        days = []
+        for day, rows, periods in counts:
+            expected = expected_periods(day)
+            missing = missing_bitmap(_present_periods(periods.split(','), day), expected)
+            days.append({
+                'day': day, 'rows': rows, 'expected': expected, 'missing': missing,
+                'periods': expected - len(missing_periods(missing)), 'updated_at': now,
+            })
+        db.session.execute(insert(EDCDayStats), days)
+    _summarize(ingested)
+    db.session.commit()
+
+
+def rebuild_stats():
+    """Recount the whole table, e.g. after a bulk load that bypassed ingestion."""
+    first, last = db.session.execute(text(
+        "SELECT substr(MIN(datum), 1, 10), substr(MAX(datum), 1, 10) FROM okte_data"
+    )).fetchone()
+    db.session.execute(delete(EDCDayStats))
+    if first is None:
+        _summarize(ingested=False)
+        db.session.commit()
+        return
+    refresh_stats(first, last, ingested=False)
+
+
+def get_stats():
+    """The okte_data summary as a dict, or None when it was never built."""
+    summary = db.session.get(EDCStats, STATS_NAME)
+    if summary is None:
+        return None
+    return {
+        'rows': summary.rows,
+        'days': summary.days,
+        'incomplete_days': summary.incomplete_days,
+        'first_day': summary.first_day,
+        'last_day': summary.last_day,
+        'last_ingest_at': summary.last_ingest_at.isoformat() if summary.last_ingest_at else None,
+        'updated_at': summary.updated_at.isoformat(),
+    }
+
+
+def stored_days(start_day, end_day):
+    """Days of start_day..end_day (inclusive) with any stored rows."""
+    return db.session.execute(text(
+        "SELECT day FROM okte_day_stats WHERE day >= :start_day AND day <= :end_day ORDER BY day"
+    ), {'start_day': as_date(start_day).isoformat(), 'end_day': as_date(end_day).isoformat()}).scalars().all()
+
+
+def completeness(start_day, end_day):
+    """
+    Completeness of start_day..end_day (inclusive) from the index: days with
+    no rows at all and stored days lacking periods, with the missing period
+    numbers. Reads one index row per stored day, never okte_data.
+    """
+    start_day, end_day = as_date(start_day), as_date(end_day)
+    if end_day < start_day:
+        raise ValueError('end must not be before start')
+    incomplete, stored = [], set()
+    for day, periods, expected, missing in db.session.execute(text(
+        "SELECT day, periods, expected, missing FROM okte_day_stats "
+        "WHERE day >= :start_day AND day <= :end_day ORDER BY day"
+    ), {'start_day': start_day.isoformat(), 'end_day': end_day.isoformat()}):
+        stored.add(day)
+        if periods < expected:
+            incomplete.append({'day': day, 'periods': periods, 'expected': expected,
+                               'missing': missing_periods(missing)})
+    calendar = [(start_day + timedelta(days=i)).isoformat() for i in range((end_day - start_day).days + 1)]
+    absent = [day for day in calendar if day not in stored]
+    return {
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'days': len(calendar),
+        'complete_days': len(stored) - len(incomplete),
+        'missing_days': absent,
+        'incomplete_days': incomplete,
+    }
@@ -0,0 +1,239 @@
+"""
+Multi-resolution min/max/mean pyramid of okte_data for zoomable charts.
+
+Level L groups 2**L settlement periods (15 minutes each) into one bucket and a
+tile is TILE_SIZE consecutive buckets, so any zoom level needs only about one
+tile per TILE_SIZE pixels of screen width. Levels below STORED_MIN_LEVEL are
+cheap enough to compute from raw rows on request; higher levels are read from
+the okte_pyramid table, which ingestion keeps up to date.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from app import db
+from app.models import EDCPyramid, METRIC_COLUMNS
+from app.series import PERIOD_MS, load_columns, data_bounds, closed_horizon, as_date
+
+TILE_SIZE = 256
+MAX_LEVEL = 16  # 2**16 periods is about 1.9 years per bucket
+STORED_MIN_LEVEL = 2
+
+# Rebuilds work through the range in pieces, so memory stays bounded
+REBUILD_CHUNK_DAYS = 366
+REBUILD_CHUNK_BUCKETS = 1 << 13
+
+
+def bucket_ms(level):
+    return PERIOD_MS << level
+
+
+def tile_span(level, index):
+    """Return the [start, end) epoch milliseconds covered by a tile."""
+    width = bucket_ms(level) * TILE_SIZE
+    return index * width, (index + 1) * width
+
+
+def _ms_to_datetime(ms):
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))
+
+
+def _day_ms(day):
+    return (day - date(1970, 1, 1)).days * 86400000
+
+
+def _empty_parts():
+    return {
+        'bucket': np.empty(0, dtype=np.int64), 'min': np.empty(0), 'max': np.empty(0),
+        'sum': np.empty(0), 'count': np.empty(0, dtype=np.int64),
+    }
+
+
+def _reduce_raw(columns, level):
+    """Group raw columns into buckets of the given level."""
+    buckets = columns['t'] // bucket_ms(level)
+    result = {}
+    if not len(buckets):
+        return result
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    for metric, values in columns.items():
+        if metric == 't':
+            continue
+        present = ~np.isnan(values)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        keep = counts > 0
+        result[metric] = {
+            'bucket': buckets[starts][keep],
+            'min': np.fmin.reduceat(values, starts)[keep],
+            'max': np.fmax.reduceat(values, starts)[keep],
+            'sum': np.add.reduceat(np.where(present, values, 0.0), starts)[keep],
+            'count': counts[keep],
+        }
+    return result
+
+
+def _reduce_level(parts):
+    """Merge pyramid rows of one level into the next level up."""
+    buckets = parts['bucket'] // 2
+    if not len(buckets):
+        return parts
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return {
+        'bucket': buckets[starts],
+        'min': np.fmin.reduceat(parts['min'], starts),
+        'max': np.fmax.reduceat(parts['max'], starts),
+        'sum': np.add.reduceat(parts['sum'], starts),
+        'count': np.add.reduceat(parts['count'], starts),
+    }
+
+
+def _read_level(level, metrics, first_bucket, last_bucket):
+    """Pyramid rows of several metrics in one query, as {metric: parts}."""
+    rows = db.session.query(
+        EDCPyramid.metric, EDCPyramid.bucket, EDCPyramid.min, EDCPyramid.max, EDCPyramid.sum, EDCPyramid.count
+    ).filter(
+        EDCPyramid.level == level,
+        EDCPyramid.metric.in_(metrics),
+        EDCPyramid.bucket.between(first_bucket, last_bucket),
+    ).order_by(EDCPyramid.metric, EDCPyramid.bucket).all()
+    grouped = {metric: [] for metric in metrics}
+    for row in rows:
+        grouped[row[0]].append(row[1:])
+    result = {}
+    for metric, metric_rows in grouped.items():
+        if not metric_rows:
+            result[metric] = _empty_parts()
+            continue
+        bucket, low, high, total, count = zip(*metric_rows)
+        result[metric] = {
+            'bucket': np.array(bucket, dtype=np.int64),
+            'min': np.array(low, dtype=np.float64),
+            'max': np.array(high, dtype=np.float64),
+            'sum': np.array(total, dtype=np.float64),
+            'count': np.array(count, dtype=np.int64),
+        }
+    return result
+
+
+def _write_level(level, first_bucket, last_bucket, per_metric):
+    """Replace the buckets first..last of a level for all metrics in per_metric."""
+    # With the metrics listed the primary key (level, metric, bucket) covers the range
+    EDCPyramid.query.filter(
+        EDCPyramid.level == level,
+        EDCPyramid.metric.in_(list(per_metric)),
+        EDCPyramid.bucket.between(first_bucket, last_bucket),
+    ).delete(synchronize_session=False)
+    rows = [
+        {'level': level, 'metric': metric, 'bucket': b, 'min': lo, 'max': hi, 'sum': s, 'count': c}
+        for metric, parts in per_metric.items()
+        for b, lo, hi, s, c in zip(
+            parts['bucket'].tolist(), parts['min'].tolist(), parts['max'].tolist(),
+            parts['sum'].tolist(), parts['count'].tolist(),
+        )
+    ]
+    if rows:
+        db.session.execute(EDCPyramid.__table__.insert(), rows)
+
+
+def rebuild_pyramid(start_day=None, end_day=None):
+    """
+    Recompute the stored pyramid levels for the days start_day..end_day
+    (inclusive dates). Without arguments the whole table is rebuilt.
+    The lowest stored level is computed from raw rows REBUILD_CHUNK_DAYS
+    days at a time and every higher level from its children, at most
+    REBUILD_CHUNK_BUCKETS buckets at a time. Commits the session.
+    """
+    if start_day is None or end_day is None:
+        first, last = data_bounds()
+        EDCPyramid.query.delete(synchronize_session=False)
+        if first is None:
+            db.session.commit()
+            return
+        start_day = start_day or first
+        end_day = end_day or last
+    start_day, end_day = as_date(start_day), as_date(end_day)
+
+    lo = _day_ms(start_day)
+    hi = _day_ms(end_day) + 86400000
+
+    # Days are whole buckets of the lowest stored level, so chunks of days
+    # never split one
+    width = bucket_ms(STORED_MIN_LEVEL)
+    chunk_ms = REBUILD_CHUNK_DAYS * 86400000
+    for chunk_lo in range(lo, hi, chunk_ms):
+        chunk_hi = min(chunk_lo + chunk_ms, hi)
+        first_bucket, last_bucket = chunk_lo // width, (chunk_hi - 1) // width
+        columns = load_columns(_ms_to_datetime(first_bucket * width), _ms_to_datetime((last_bucket + 1) * width))
+        reduced = _reduce_raw(columns, STORED_MIN_LEVEL)
+        del columns
+        _write_level(STORED_MIN_LEVEL, first_bucket, last_bucket,
+                     {metric: reduced.get(metric) or _empty_parts() for metric in METRIC_COLUMNS})
+
+    # Each higher level is derived from the two child buckets one level below
+    for level in range(STORED_MIN_LEVEL + 1, MAX_LEVEL + 1):
+        width = bucket_ms(level)
+        first_bucket, last_bucket = lo // width, (hi - 1) // width
+        for chunk_first in range(first_bucket, last_bucket + 1, REBUILD_CHUNK_BUCKETS):
+            chunk_last = min(chunk_first + REBUILD_CHUNK_BUCKETS - 1, last_bucket)
+            children = _read_level(level - 1, METRIC_COLUMNS, chunk_first * 2, chunk_last * 2 + 1)
+            _write_level(level, chunk_first, chunk_last,
+                         {metric: _reduce_level(parts) for metric, parts in children.items()})
+
+    db.session.commit()
+
+
+def load_tile(level, index, metrics=None):
+    """
+    Return the buckets of one tile as columnar arrays.
+
+    The result has 't' (bucket start, epoch ms) and for each metric a dict of
+    'min', 'max' and 'mean' lists. Buckets without data are omitted.
+    """
+    if not 0 <= level <= MAX_LEVEL:
+        raise ValueError(f'Level must be between 0 and {MAX_LEVEL}')
+    metrics = list(metrics or METRIC_COLUMNS)
+    start, end = tile_span(level, index)
+    first_bucket, last_bucket = start // bucket_ms(level), end // bucket_ms(level) - 1
+
+    if level < STORED_MIN_LEVEL:
+        reduced = _reduce_raw(load_columns(_ms_to_datetime(start), _ms_to_datetime(end), metrics), level)
+        per_metric = {m: reduced.get(m) or _empty_parts() for m in metrics}
+    else:
+        per_metric = _read_level(level, metrics, first_bucket, last_bucket)
+
+    # Align all metrics on the union of their buckets
+    buckets = np.unique(np.concatenate([p['bucket'] for p in per_metric.values()]))
+    result = {'t': (buckets * bucket_ms(level)).tolist()}
+    for metric, parts in per_metric.items():
+        position = np.searchsorted(buckets, parts['bucket'])
+        aligned = {}
+        for key, values in (('min', parts['min']), ('max', parts['max']),
+                            ('mean', parts['sum'] / np.maximum(parts['count'], 1))):
+            column = np.full(len(buckets), np.nan)
+            column[position] = values
+            aligned[key] = [None if v != v else v for v in column.tolist()]
+        result[metric] = aligned
+    return result
+
+
+def tile_is_closed(level, index, today=None):
+    """
+    A tile is closed, so it will not change, when it ends before
+    closed_horizon() and every day it covers is stored and complete
+    according to okte_day_stats. Tiles over gaps or before the first
+    stored day can still be filled by a backfill.
+    """
+    horizon = closed_horizon(today)
+    if horizon is None:
+        return False
+    start, end = tile_span(level, index)
+    if end > _day_ms(horizon):
+        return False
+    first_day = date(1970, 1, 1) + timedelta(days=start // 86400000)
+    last_day = date(1970, 1, 1) + timedelta(days=(end - 1) // 86400000)
+    complete = db.session.execute(text(
+        "SELECT COUNT(*) FROM okte_day_stats WHERE day >= :first_day AND day <= :last_day "
+        "AND periods >= expected"
+    ), {'first_day': first_day.isoformat(), 'last_day': last_day.isoformat()}).scalar()
+    return complete == (last_day - first_day).days + 1
@@ -0,0 +1,13 @@
+"""
+ASGI module for external servers, e.g. `uvicorn asgi:app --workers 4`.
+Each worker logs to its own logs/app.<pid>.log.
+"""
+import os
+
+from app import create_app
+from app.asgi import create_asgi_app
+
+app = create_asgi_app(create_app({
+    'LOG_FILE': os.path.join('logs', 'app.{pid}.log'),
+    'LOG_EVENTS_FILE': os.path.join('logs', 'events.{pid}.jsonl'),
+}))
@@ -0,0 +1,130 @@
+"""
+Compare SQL-side aggregation against the naive load-everything pandas path.
+
+Fills a temporary SQLite database with synthetic okte_data rows, builds the
+tile pyramid and times aggregate() from the raw table and from the hourly
+rollup against EDCData.query.all() + pandas groupby.
+
+    python benchmarks/bench_aggregate.py --days 730 --json results.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+
+from app import create_app, db
+from app.aggregate import aggregate, INTERVALS
+from app.models import EDCData, METRIC_COLUMNS
+from app.series import expected_periods
+from app.tiles import rebuild_pyramid
+
+PANDAS_FREQ = {'hour': 'h', 'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+
+
+def fill(days):
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    rows = []
+    for day in range(days):
+        datum = (start + timedelta(days=day)).isoformat()
+        # 92 and 100 periods on the DST change days
+        periods = expected_periods(datum)
+        for period in range(1, periods + 1):
+            base = math.sin(period / periods * 2 * math.pi)
+            rows.append({
+                'datum': datum,
+                'zuctovacia_perioda': str(period),
+                'aktivovana_agregovana_flexibilita_kladna': max(base, 0) * 12.5 + rng.random(),
+                'aktivovana_agregovana_flexibilita_zaporna': max(-base, 0) * 8.25 + rng.random(),
+                'zdielana_elektrina': rng.random() * 3.5,
+            })
+    db.session.execute(EDCData.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def naive_pandas(interval):
+    records = EDCData.query.all()
+    df = pd.DataFrame([{
+        'datum': r.datum,
+        'zuctovacia_perioda': r.zuctovacia_perioda,
+        **{m: getattr(r, m) for m in METRIC_COLUMNS},
+    } for r in records])
+    df['t'] = pd.to_datetime(df['datum'].str[:10]) + pd.to_timedelta(
+        (df['zuctovacia_perioda'].astype(int) - 1) * 15, unit='min')
+    grouped = df.set_index('t')[list(METRIC_COLUMNS)].resample(
+        PANDAS_FREQ[interval], label='left', closed='left')
+    return grouped.agg(['sum', 'mean', 'min', 'max', 'count'])
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    best, result = None, None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run(days):
+    workdir = tempfile.mkdtemp(prefix='bench_aggregate_')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    results = []
+    with app.app_context():
+        rows = fill(days)
+        _, build_s = timed(rebuild_pyramid, repeat=1)
+        for interval in INTERVALS:
+            raw, raw_s = timed(aggregate, interval, source='raw')
+            rollup, rollup_s = timed(aggregate, interval, source='rollup')
+            frame, pandas_s = timed(naive_pandas, interval, repeat=1)
+
+            metric = METRIC_COLUMNS[0]
+            expected = frame[(metric, 'sum')].sum()
+            for name, result in (('raw', raw), ('rollup', rollup)):
+                if not math.isclose(sum(result[metric]['sum']), expected, rel_tol=1e-9):
+                    raise AssertionError(f'{name} {interval} sums differ from pandas')
+            if raw['bucket'] != rollup['bucket'] or raw[metric]['count'] != rollup[metric]['count']:
+                raise AssertionError(f'raw and rollup {interval} buckets differ')
+
+            results.append({
+                'interval': interval,
+                'rows': rows,
+                'buckets': len(raw['bucket']),
+                'sql_raw_ms': round(raw_s * 1000, 2),
+                'sql_rollup_ms': round(rollup_s * 1000, 2),
+                'pandas_ms': round(pandas_s * 1000, 2),
+            })
+    return {'benchmark': 'aggregate', 'days': days, 'rows': rows,
+            'pyramid_build_ms': round(build_s * 1000, 2), 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.days)
+    print(f"{report['rows']} rows, pyramid build {report['pyramid_build_ms']} ms")
+    print(f"{'interval':8} {'buckets':>8} {'sql raw ms':>11} {'rollup ms':>10} {'pandas ms':>10}")
+    for r in report['results']:
+        print(f"{r['interval']:8} {r['buckets']:>8} {r['sql_raw_ms']:>11} {r['sql_rollup_ms']:>10} {r['pandas_ms']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Measure size and CPU trade-offs of response compression for okte_data payloads.
+
+Builds CSV and JSON bodies shaped like okte_data exports (96 periods per day)
+and compresses them with every gzip/brotli level the app can be configured
+with, both as one buffer and as a stream of chunks.
+
+    python benchmarks/bench_compression.py --days 365 --json results.json
+"""
+import argparse
+import gzip
+import json
+import math
+import random
+import sys
+import time
+import zlib
+from datetime import date, timedelta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_rows(days):
+    rng = random.Random(42)
+    start = date(2024, 1, 1)
+    rows = []
+    for day in range(days):
+        datum = (start + timedelta(days=day)).isoformat()
+        for period in range(1, 97):
+            base = math.sin(period / 96 * 2 * math.pi)
+            rows.append({
+                'datum': datum,
+                'zuctovacia_perioda': str(period),
+                'aktivovana_agregovana_flexibilita_kladna': round(max(base, 0) * 12.5 + rng.random(), 3),
+                'aktivovana_agregovana_flexibilita_zaporna': round(max(-base, 0) * 8.25 + rng.random(), 3),
+                'zdielana_elektrina': round(rng.random() * 3.5, 3),
+            })
+    return rows
+
+
+def make_payloads(rows):
+    columns = list(rows[0])
+    csv_lines = [','.join(columns)]
+    csv_lines.extend(','.join(str(row[c]) for c in columns) for row in rows)
+    return {
+        'csv': ('\n'.join(csv_lines) + '\n').encode('utf-8'),
+        'json': json.dumps(rows).encode('utf-8'),
+    }
+
+
+def gzip_buffer(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def gzip_stream(data, level, chunk_size):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    out = []
+    for i in range(0, len(data), chunk_size):
+        out.append(compressor.compress(data[i:i + chunk_size]))
+        out.append(compressor.flush(zlib.Z_SYNC_FLUSH))
+    out.append(compressor.flush())
+    return b''.join(out)
+
+
+def brotli_buffer(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def brotli_stream(data, level, chunk_size):
+    compressor = brotli.Compressor(quality=level)
+    out = []
+    for i in range(0, len(data), chunk_size):
+        out.append(compressor.process(data[i:i + chunk_size]))
+        out.append(compressor.flush())
+    out.append(compressor.finish())
+    return b''.join(out)
+
+
+def measure(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run(days, chunk_size):
+    payloads = make_payloads(make_rows(days))
+    cases = [('gzip', level, gzip_buffer, gzip_stream) for level in (1, 6, 9)]
+    if brotli is not None:
+        cases += [('br', level, brotli_buffer, brotli_stream) for level in (1, 4, 6, 9)]
+
+    results = []
+    for name, data in payloads.items():
+        for encoding, level, buffered, streamed in cases:
+            for mode, func, args in (
+                ('buffer', buffered, (data, level)),
+                ('stream', streamed, (data, level, chunk_size)),
+            ):
+                compressed, seconds = measure(func, *args)
+                results.append({
+                    'payload': name,
+                    'encoding': encoding,
+                    'level': level,
+                    'mode': mode,
+                    'raw_bytes': len(data),
+                    'compressed_bytes': len(compressed),
+                    'ratio': round(len(data) / len(compressed), 2),
+                    'ms': round(seconds * 1000, 2),
+                    'mb_per_s': round(len(data) / seconds / 1e6, 1),
+                })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    if brotli is None:
+        print('brotli is not installed, only gzip is measured', file=sys.stderr)
+
+    results = run(args.days, args.chunk_size)
+    print(f"{'payload':8} {'enc':5} {'lvl':>3} {'mode':7} {'raw':>10} {'out':>9} {'ratio':>6} {'ms':>8} {'MB/s':>7}")
+    for r in results:
+        print(f"{r['payload']:8} {r['encoding']:5} {r['level']:>3} {r['mode']:7} "
+              f"{r['raw_bytes']:>10} {r['compressed_bytes']:>9} {r['ratio']:>6} {r['ms']:>8} {r['mb_per_s']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'compression', 'days': args.days, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
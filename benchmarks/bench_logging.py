@@ -0,0 +1,121 @@
+"""
+Logging throughput with the old 10 KB RotatingFileHandler and the current
+rotation subsystem, with and without the queue in front of it.
+
+Each case writes the same number of scraper-like records into a scratch
+directory and reports records/second, caller-side time per record, the
+number of rotations and the bytes left on disk.
+
+    python benchmarks/bench_logging.py --records 200000 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.logging_config import DroppingQueueHandler, RotatingLogFileHandler, _background
+
+FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+
+def _count_rollovers(handler):
+    counter = {'n': 0}
+    original = handler.doRollover
+
+    def counting():
+        counter['n'] += 1
+        original()
+
+    handler.doRollover = counting
+    return counter
+
+
+def run_case(name, make_handler, records, use_queue):
+    workdir = tempfile.mkdtemp(prefix='bench_logging_')
+    path = os.path.join(workdir, 'app.log')
+    handler = make_handler(path)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    rollovers = _count_rollovers(handler)
+
+    logger = logging.getLogger(f'bench.{name}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if use_queue:
+        log_queue = queue.Queue(maxsize=records + 1)
+        logger.addHandler(DroppingQueueHandler(log_queue))
+        listener = QueueListener(log_queue, handler)
+        listener.start()
+    else:
+        logger.addHandler(handler)
+
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for i in range(records):
+        before = clock()
+        logger.info('Successfully scraped %d records for %s', 96, f'{i % 28 + 1:02d}.01.2024')
+        latencies.append(clock() - before)
+    caller_s = clock() - start
+    latencies.sort()
+    if listener is not None:
+        listener.stop()
+    total_s = time.perf_counter() - start
+    handler.close()
+    _background.submit(lambda: None).result()  # wait for pending compression
+
+    files = os.listdir(workdir)
+    size = sum(os.path.getsize(os.path.join(workdir, f)) for f in files)
+    shutil.rmtree(workdir)
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+    return {
+        'case': name,
+        'records': records,
+        'records_per_s': round(records / total_s),
+        'caller_us_per_record': round(caller_s / records * 1e6, 2),
+        'caller_p99_us': round(latencies[int(records * 0.99)] * 1e6, 1),
+        'caller_max_us': round(latencies[-1] * 1e6, 1),
+        'rotations': rollovers['n'],
+        'files_kept': len(files),
+        'bytes_kept': size,
+    }
+
+
+CASES = {
+    'old_rotating_10kb': (lambda p: RotatingFileHandler(p, maxBytes=10240, backupCount=10), False),
+    'new_rotating_10mb': (lambda p: RotatingLogFileHandler(p, max_bytes=10 * 1024 * 1024, backup_count=10), False),
+    'new_rotating_1mb_gzip': (lambda p: RotatingLogFileHandler(p, max_bytes=1024 * 1024, backup_count=10), False),
+    'queued_new_rotating_10mb': (lambda p: RotatingLogFileHandler(p, max_bytes=10 * 1024 * 1024, backup_count=10), True),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = [run_case(name, make, args.records, queued) for name, (make, queued) in CASES.items()]
+    print(f"{'case':26} {'rec/s':>9} {'caller us':>10} {'p99 us':>8} {'max us':>9} "
+          f"{'rotations':>10} {'files':>6} {'bytes kept':>11}")
+    for r in results:
+        print(f"{r['case']:26} {r['records_per_s']:>9} {r['caller_us_per_record']:>10} "
+              f"{r['caller_p99_us']:>8} {r['caller_max_us']:>9} "
+              f"{r['rotations']:>10} {r['files_kept']:>6} {r['bytes_kept']:>11}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'logging', 'records': args.records, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold start of the app factory: interpreter start, imports and create_app().
+
+Every run is a fresh interpreter (what a spawned worker pays) started with
+`python -X importtime` in a scratch directory. The report gives the median
+process, import and create_app times and the packages that took the most
+import time, summed over their modules:
+
+    python benchmarks/bench_startup.py --runs 10 --top 15 --budget-ms 600
+
+With --budget-ms the exit status is 1 when the median process time is over
+the budget, so the check can run in CI.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = """
+import json, os, time
+began = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath('startup.db')})
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - began) * 1000, 'create_ms': (created - imported) * 1000}))
+"""
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """Self time in ms per top-level package from `-X importtime` output."""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            packages[match.group(4).split('.')[0]] += int(match.group(1)) / 1000
+    return packages
+
+
+def run_once():
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    try:
+        began = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=workdir, env=env,
+                              capture_output=True, text=True, check=True)
+        process_ms = (time.perf_counter() - began) * 1000
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = process_ms
+    return timings, parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of packages to list')
+    parser.add_argument('--budget-ms', type=float, help='fail when the median process time exceeds this')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    # One warm-up run so every measured run finds compiled bytecode
+    run_once()
+    runs, packages = [], defaultdict(list)
+    for _ in range(args.runs):
+        timings, imported = run_once()
+        runs.append(timings)
+        for name, ms in imported.items():
+            packages[name].append(ms)
+
+    summary = {key: round(statistics.median(r[key] for r in runs), 1)
+               for key in ('process_ms', 'import_ms', 'create_ms')}
+    heaviest = sorted(((name, statistics.median(ms)) for name, ms in packages.items()),
+                      key=lambda item: -item[1])[:args.top]
+
+    print(f"median of {args.runs} cold starts: process {summary['process_ms']} ms, "
+          f"import {summary['import_ms']} ms, create_app {summary['create_ms']} ms")
+    print(f"{'package':24} {'import ms':>10}")
+    for name, ms in heaviest:
+        print(f"{name:24} {ms:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(summary, benchmark='startup', runs=runs,
+                           packages={name: round(ms, 2) for name, ms in heaviest}), f, indent=2)
+
+    if args.budget_ms is not None and summary['process_ms'] > args.budget_ms:
+        print(f"over budget: {summary['process_ms']} ms > {args.budget_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+HTTP load test for the app's endpoints.
+
+A thread pool of clients sends a weighted mix of requests for a fixed time
+and reports throughput and p50/p95/p99 latency per scenario. By default the
+app is started in-process on a synthetic database (see synthetic.py), served
+by Werkzeug's threaded server, with /scrape pointed at a local OKTE stand-in
+(see okte_server.py). Use --url to load an already running deployment.
+
+    python benchmarks/loadtest.py --days 365 --concurrency 16 --duration 30
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --mix series=5,tiles=5,graph=1
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import requests
+
+from benchmarks.synthetic import START_DAY
+
+# Days /scrape asks for: before the synthetic data, one new day per request
+SCRAPE_FROM = date(2000, 1, 1)
+
+
+def _window(rng, days, length):
+    first = START_DAY + timedelta(days=rng.randrange(max(days - length, 1)))
+    return first.isoformat(), (first + timedelta(days=length - 1)).isoformat()
+
+
+def _series(rng, days):
+    start, end = _window(rng, days, 7)
+    return 'GET', f'/api/series?start={start}&end={end}', None
+
+
+def _tiles(rng, days):
+    level = rng.choice((6, 8, 10))
+    first_tile = ((START_DAY - date(1970, 1, 1)).days * 96 >> level) // 256
+    return 'GET', f'/api/tiles/{level}/{first_tile + rng.randrange(2)}', None
+
+
+def _aggregate(rng, days):
+    start, end = _window(rng, days, 90)
+    return 'GET', f'/api/aggregate?interval=day&start={start}&end={end}', None
+
+
+def _analytics(rng, days):
+    start, end = _window(rng, days, 30)
+    return 'GET', f'/api/analytics/report?start={start}&end={end}', None
+
+
+def _export(rng, days):
+    start, end = _window(rng, days, 7)
+    return 'GET', f'/export?start={start}&end={end}', None
+
+
+_scrape_days = itertools.count()
+
+
+def _scrape(rng, days):
+    day = (SCRAPE_FROM + timedelta(days=next(_scrape_days))).isoformat()
+    return 'POST', '/scrape', {'start_date': day, 'end_date': day}
+
+
+SCENARIOS = {
+    'index': lambda rng, days: ('GET', '/', None),
+    'graph': lambda rng, days: ('GET', '/graph', None),
+    'graph_webgl': lambda rng, days: ('GET', '/graph?mode=webgl', None),
+    'series': _series,
+    'tiles': _tiles,
+    'aggregate': _aggregate,
+    'analytics': _analytics,
+    'export': _export,
+    'scrape': _scrape,
+}
+DEFAULT_MIX = 'index=1,graph=1,graph_webgl=1,series=4,tiles=4,aggregate=2,analytics=2,export=1,scrape=1'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_load(base_url, mix, days, concurrency, duration, seed=0):
+    """Drive the mix for `duration` seconds; returns per-scenario latencies and statuses."""
+    names, weights = list(mix), list(mix.values())
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker):
+        rng = random.Random(f'{seed}:{worker}')
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, form = SCENARIOS[name](rng, days)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, data=form, timeout=120)
+                response.content
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                statuses[name][status] += 1
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    wall = time.perf_counter() - began
+
+    results = []
+    for name in names:
+        samples = np.array(latencies[name]) * 1000
+        if not len(samples):
+            continue
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        results.append({
+            'scenario': name,
+            'requests': len(samples),
+            'rps': round(len(samples) / wall, 1),
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'max_ms': round(samples.max(), 2),
+            'statuses': {str(k): v for k, v in sorted(statuses[name].items(), key=str)},
+        })
+    everything = np.concatenate([np.array(v) for v in latencies.values()]) * 1000 if latencies else np.zeros(1)
+    total = {
+        'requests': int(len(everything)),
+        'rps': round(len(everything) / wall, 1),
+        'p50_ms': round(float(np.percentile(everything, 50)), 2),
+        'p95_ms': round(float(np.percentile(everything, 95)), 2),
+        'p99_ms': round(float(np.percentile(everything, 99)), 2),
+    }
+    return {'wall_s': round(wall, 2), 'total': total, 'results': results}
+
+
+def serve_synthetic(days, workdir, okte_latency_ms):
+    """Start the app on a synthetic database, with /scrape pointed at a local OKTE stand-in."""
+    from werkzeug.serving import make_server
+
+    from app import create_app, db
+    from app.stats import rebuild_stats
+    from app.tiles import rebuild_pyramid
+    from benchmarks.okte_server import start_server
+    from benchmarks.synthetic import bulk_load
+
+    okte = start_server(synthetic=True, latency_ms=okte_latency_ms)
+    path = os.path.join(workdir, 'okte_data.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SCHEMA_LOCK_FILE': os.path.join(workdir, 'schema.lock'),
+        'OKTE_URL': okte.url,
+    })
+    with app.app_context():
+        bulk_load(db.engine, days)
+        rebuild_stats()
+        rebuild_pyramid()
+    # Per-request access log lines would dominate the measured cost
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-app', daemon=True).start()
+    return server, okte
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='load this running server instead of an in-process app')
+    parser.add_argument('--days', type=int, default=365, help='synthetic data size (or the data range at --url)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='scenario=weight,... from: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--okte-latency-ms', type=float, default=50, help='latency of the stand-in OKTE server')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    server = okte = None
+    base_url = args.url
+    if base_url is None:
+        workdir = tempfile.mkdtemp(prefix='loadtest_')
+        server, okte = serve_synthetic(args.days, workdir, args.okte_latency_ms)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        report = run_load(base_url.rstrip('/'), mix, args.days, args.concurrency, args.duration, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+            okte.shutdown()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.concurrency} clients for {report['wall_s']} s against {base_url}")
+    print(f"{'scenario':12} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for r in report['results'] + [dict(report['total'], scenario='total', max_ms='', statuses='')]:
+        print(f"{r['scenario']:12} {r['requests']:>9} {r['rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['max_ms']:>9}  {r['statuses']}")
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(dict(report, benchmark='loadtest', concurrency=args.concurrency, days=args.days,
+                           mix=mix, url=args.url), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Local stand-in for the OKTE publication page, for offline scraper tests.
+
+Replay mode (default) answers the scraper's GET with a form page and its POST
+(date=DD.MM.YYYY) with benchmarks/fixtures/okte_<YYYY-MM-DD>.html. Days
+without a fixture get a generated page with --synthetic, or a page without a
+table, which is what OKTE shows for days with no data. Record mode forwards
+every request to the live site and stores the responses as fixtures.
+
+Latency, server errors and throttling (429 with Retry-After) can be injected.
+Every decision is derived from --seed, the method, the date and how many
+times that date was requested before, so a test run sees the same faults
+regardless of thread scheduling:
+
+    python benchmarks/okte_server.py --port 8765 --latency-ms 200 --jitter-ms 100 \\
+        --error-rate 0.05 --throttle-rps 20 --synthetic
+
+and point the app at it with the OKTE_URL config key, e.g.
+create_app({'OKTE_URL': 'http://127.0.0.1:8765/'}).
+
+GET /__stats returns request counters as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+INDEX_FIXTURE = 'index.html'
+
+EMPTY_PAGE = (
+    '<!DOCTYPE html>\n<html lang="sk"><head><meta charset="utf-8"><title>OKTE</title></head>\n'
+    '<body><form method="post"><input name="date" value="{date}">'
+    '<button name="submit" value="Zobraziť">Zobraziť</button></form>\n'
+    '<p>Pre zvolený dátum nie sú k dispozícii žiadne údaje.</p>\n</body></html>\n'
+)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `rate`."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class OKTEServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures=FIXTURES, record_url=None, synthetic=False,
+                 latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rps=None, seed=0):
+        super().__init__(address, OKTEHandler)
+        self.fixtures = fixtures
+        self.record_url = record_url
+        self.synthetic = synthetic
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(throttle_rps) if throttle_rps else None
+        self.seed = seed
+        self.stats = {'requests': 0, 'replayed': 0, 'recorded': 0, 'synthetic': 0,
+                      'empty': 0, 'errors': 0, 'throttled': 0}
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._session = None
+        if record_url:
+            import requests
+            self._session = requests.Session()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def roll(self, method, day):
+        """Deterministic random source for one request."""
+        with self._lock:
+            attempt = self._attempts.get((method, day), 0)
+            self._attempts[(method, day)] = attempt + 1
+        return random.Random(f'{self.seed}:{method}:{day}:{attempt}')
+
+    def page(self, day):
+        """Body of the result page for a date: the fixture, a generated page or an empty one."""
+        path = os.path.join(self.fixtures, f'okte_{day}.html')
+        if os.path.exists(path):
+            self.count('replayed')
+            with open(path, 'rb') as f:
+                return f.read()
+        when = datetime.strptime(day, '%Y-%m-%d').date()
+        if self.synthetic:
+            from benchmarks.synthetic import generate_columns, okte_html, COLUMNS
+            columns = generate_columns(1, when, self.seed)
+            rows = [dict(zip(COLUMNS, row)) for row in zip(*(columns[n].tolist() for n in COLUMNS))]
+            self.count('synthetic')
+            return okte_html(when, rows).encode('utf-8')
+        self.count('empty')
+        return EMPTY_PAGE.format(date=f'{when:%d.%m.%Y}').encode('utf-8')
+
+    def record(self, method, form, name):
+        response = self._session.request(method, self.record_url, data=form, timeout=60)
+        if response.ok:
+            with open(os.path.join(self.fixtures, name), 'wb') as f:
+                f.write(response.content)
+            self.count('recorded')
+        return response.status_code, response.content
+
+
+class OKTEHandler(BaseHTTPRequestHandler):
+    server_version = 'OKTEStandIn/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/__stats'):
+            return self._send(200, json.dumps(self.server.stats).encode('utf-8'), 'application/json')
+        self._serve('GET', None, None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        try:
+            day = datetime.strptime(form.get('date', ''), '%d.%m.%Y').date().isoformat()
+        except ValueError:
+            return self._send(400, b'Invalid date', 'text/plain')
+        self._serve('POST', form, day)
+
+    def _serve(self, method, form, day):
+        server = self.server
+        server.count('requests')
+        rng = server.roll(method, day)
+
+        if server.bucket is not None and not server.bucket.take():
+            server.count('throttled')
+            return self._send(429, b'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+        delay = server.latency_ms + rng.uniform(-1, 1) * server.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if rng.random() < server.error_rate:
+            server.count('errors')
+            return self._send(503, b'Service Unavailable', 'text/plain')
+
+        if server.record_url:
+            name = f'okte_{day}.html' if method == 'POST' else INDEX_FIXTURE
+            status, body = server.record(method, form, name)
+            return self._send(status, body, 'text/html; charset=utf-8')
+        if method == 'GET':
+            path = os.path.join(server.fixtures, INDEX_FIXTURE)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return self._send(200, f.read(), 'text/html; charset=utf-8')
+            return self._send(200, EMPTY_PAGE.format(date='').encode('utf-8'), 'text/html; charset=utf-8')
+        self._send(200, server.page(day), 'text/html; charset=utf-8')
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start a stand-in server on a background thread; port 0 picks a free port."""
+    server = OKTEServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='okte-server', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--record', metavar='URL', nargs='?', const='default',
+                        help='forward to the live site (or URL) and store the responses as fixtures')
+    parser.add_argument('--synthetic', action='store_true', help='generate pages for days without a fixture')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--throttle-rps', type=float, help='answer 429 above this request rate')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    record_url = args.record
+    if record_url == 'default':
+        from app.scraper import OKTE_URL
+        record_url = OKTE_URL
+    os.makedirs(args.fixtures, exist_ok=True)
+    server = OKTEServer(
+        (args.host, args.port), fixtures=args.fixtures, record_url=record_url, synthetic=args.synthetic,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        throttle_rps=args.throttle_rps, seed=args.seed,
+    )
+    mode = f'recording {record_url}' if record_url else f'replaying {args.fixtures}'
+    print(f'OKTE stand-in on {server.url} ({mode})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark suite for the scrape-to-render pipeline.
+
+For each database size (in days of synthetic data) it measures:
+
+- parse: time to parse one OKTE result page from benchmarks/fixtures
+- ingest: rows/second through the /scrape ORM path and the Core bulk path
+- range query: load_columns() latency for the last day, last 30 days and all data
+- aggregation: aggregate() latency for daily and hourly buckets
+- render: GET /graph, the WebGL page and its first tile request
+
+Results are written as JSON together with the git commit, so runs can be
+compared across commits:
+
+    python benchmarks/run_suite.py --sizes 1,30,365,3650 --json results/HEAD.json
+    python benchmarks/run_suite.py --sizes 365 --compare results/HEAD.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app import create_app, db
+from app.aggregate import aggregate
+from app.logging_config import stop_logging
+from app.models import EDCData
+from app.scraper import _parse_day
+from app.series import load_columns
+from app.tiles import rebuild_pyramid
+from benchmarks.synthetic import START_DAY, generate_columns, insert_columns
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The ORM path adds one object per row; beyond a year it only measures patience
+ORM_MAX_DAYS = 365
+
+# Metrics where a larger value is better; everything else is a duration
+HIGHER_IS_BETTER = ('rows_per_s',)
+
+
+def timed(func, *args, repeat=5, **kwargs):
+    """Median wall time of `repeat` calls in milliseconds, and the last result."""
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 3), result
+
+
+def bench_parse(app):
+    results = {}
+    with app.app_context():
+        for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                html = f.read()
+            name = os.path.splitext(os.path.basename(path))[0]
+            day = datetime.strptime(name.rsplit('_', 1)[-1], '%Y-%m-%d')
+            ms, rows = timed(_parse_day, html, day, day.strftime('%d.%m.%Y'), repeat=20)
+            results[name] = {'parse_ms': ms, 'rows': len(rows or [])}
+    return results
+
+
+def bench_ingest_orm(days):
+    columns = generate_columns(days)
+    names = list(columns)
+    rows = [dict(zip(names, values)) for values in zip(*(columns[n].tolist() for n in names))]
+    for row in rows:
+        # /scrape stores the day as a datetime
+        row['datum'] = datetime.strptime(row['datum'], '%Y-%m-%d')
+    start = time.perf_counter()
+    for row in rows:
+        db.session.add(EDCData(**row))
+    db.session.commit()
+    return round(len(rows) / (time.perf_counter() - start))
+
+
+def run_size(days, workdir):
+    path = os.path.join(workdir, f'bench_{days}.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    result = {'days': days}
+    with app.app_context():
+        columns = generate_columns(days)
+        start = time.perf_counter()
+        rows = insert_columns(db.session, columns)
+        result['rows'] = rows
+        result['ingest_core_rows_per_s'] = round(rows / (time.perf_counter() - start))
+        build_ms, _ = timed(rebuild_pyramid, repeat=1)
+        result['pyramid_build_ms'] = build_ms
+
+        last = START_DAY + timedelta(days=days - 1)
+        for label, first in (('1d', last), ('30d', max(START_DAY, last - timedelta(days=29))), ('all', START_DAY)):
+            result[f'range_query_{label}_ms'], _ = timed(
+                load_columns,
+                datetime.combine(first, datetime.min.time()),
+                datetime.combine(last + timedelta(days=1), datetime.min.time()),
+            )
+        result['aggregate_day_ms'], _ = timed(aggregate, 'day')
+        result['aggregate_hour_30d_ms'], _ = timed(
+            aggregate, 'hour',
+            datetime.combine(max(START_DAY, last - timedelta(days=29)), datetime.min.time()),
+            datetime.combine(last + timedelta(days=1), datetime.min.time()),
+        )
+
+    client = app.test_client()
+    result['render_graph_ms'], _ = timed(client.get, '/graph', repeat=3)
+    result['render_webgl_page_ms'], _ = timed(client.get, '/graph?mode=webgl')
+    info = client.get('/api/tiles').get_json()
+    level = info.get('max_level', 0) if isinstance(info, dict) else 0
+    result['render_first_tile_ms'], _ = timed(client.get, f'/api/tiles/{level}/0')
+
+    if days <= ORM_MAX_DAYS:
+        orm_path = os.path.join(workdir, f'bench_{days}_orm.db')
+        orm_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{orm_path}'})
+        with orm_app.app_context():
+            result['ingest_orm_rows_per_s'] = bench_ingest_orm(days)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print the change of every shared metric and return the regressions."""
+    regressions = []
+    old_sizes = {r['days']: r for r in baseline['sizes']}
+    for new in report['sizes']:
+        old = old_sizes.get(new['days'])
+        if old is None:
+            continue
+        for key, value in new.items():
+            if key in ('days', 'rows') or not isinstance(old.get(key), (int, float)) or not old[key]:
+                continue
+            change = value / old[key] - 1
+            worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+            flag = ' REGRESSION' if worse > tolerance else ''
+            print(f"{new['days']:>6}d {key:28} {old[key]:>12} -> {value:>12} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append((new['days'], key))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1,30,365,3650',
+                        help='comma separated database sizes in days (default 1 day to 10 years)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='compare against an earlier results file')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='relative slowdown reported as a regression (default 0.10)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench_suite_')
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'parse.db')}"})
+        report = {
+            'benchmark': 'suite',
+            'commit': git_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parse': bench_parse(app),
+            'sizes': [run_size(int(days), workdir) for days in args.sizes.split(',')],
+        }
+    finally:
+        stop_logging()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, r in report['parse'].items():
+        print(f"parse {name:32} {r['rows']:>4} rows {r['parse_ms']:>9} ms")
+    for r in report['sizes']:
+        print(f"--- {r['days']} days ({r['rows']} rows)")
+        for key, value in r.items():
+            if key not in ('days', 'rows'):
+                print(f"    {key:28} {value:>12}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"--- compared with {baseline.get('commit')} ({baseline.get('created')})")
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Synthetic okte_data rows and OKTE result pages for benchmarks and load tests.
+
+Rows have the shape of real OKTE data: 96 quarter-hour periods per day, 92
+on the spring and 100 on the autumn DST change day, a daily and a yearly
+profile with seeded noise, and optionally missing days, missing periods and
+revised days (stored a second time with changed values, as a re-scrape
+would). Generation is vectorised and done in chunks of days, so databases of
+100M rows are written with bounded memory:
+
+    python benchmarks/synthetic.py --db /tmp/okte_10m.db --rows 10000000 \\
+        --gap-days 0.01 --missing 0.001 --revisions 0.02 --html-dir /tmp/okte_pages --html-days 31
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from html import escape
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.models import EDCData, METRIC_COLUMNS
+from app.series import DST_SHIFTS, PERIODS_PER_DAY, _last_sunday, expected_periods
+
+START_DAY = date(2020, 1, 1)
+COLUMNS = ('datum', 'zuctovacia_perioda') + METRIC_COLUMNS
+DATUM_FORMATS = {'date': '', 'datetime': ' 00:00:00'}
+CHUNK_DAYS = 10000
+
+
+def periods_per_day(ordinals):
+    """Periods of each day (given as date ordinals), as series.expected_periods() counts them."""
+    first, last = (date.fromordinal(int(o)).year for o in (ordinals.min(), ordinals.max()))
+    counts = np.full(len(ordinals), PERIODS_PER_DAY)
+    for year in range(first, last + 1):
+        for month in DST_SHIFTS:
+            change = _last_sunday(year, month)
+            counts[ordinals == change.toordinal()] = expected_periods(change)
+    return counts
+
+
+def generate_columns(days, start=START_DAY, seed=42, gap_days=0.0, missing=0.0,
+                     revisions=0.0, datum_format='date'):
+    """
+    Columns for `days` consecutive days from `start`: 'datum' and
+    'zuctovacia_perioda' as string arrays and one float array per metric.
+
+    gap_days is the share of days left out entirely, missing the share of
+    single periods left out and revisions the share of days appended a second
+    time with values changed by a few percent.
+    """
+    rng = np.random.default_rng([seed, start.toordinal()])
+    ordinals = np.arange(start.toordinal(), start.toordinal() + days)
+    counts = periods_per_day(ordinals)
+    if gap_days:
+        counts[rng.random(days) < gap_days] = 0
+
+    total = int(counts.sum())
+    day_index = np.repeat(np.arange(days), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    period = np.arange(total) - offsets + 1
+    keep = rng.random(total) >= missing if missing else slice(None)
+    day_index, period = day_index[keep], period[keep]
+    n = len(period)
+
+    # Daily sine over the periods of each day, scaled by a yearly cycle
+    phase = period / counts[day_index] * 2 * np.pi
+    season = 1 + 0.3 * np.cos((ordinals[day_index] % 365.25) / 365.25 * 2 * np.pi)
+    base = np.sin(phase) * season
+    values = {
+        'aktivovana_agregovana_flexibilita_kladna': np.maximum(base, 0) * 12.5 + rng.random(n),
+        'aktivovana_agregovana_flexibilita_zaporna': np.maximum(-base, 0) * 8.25 + rng.random(n),
+        'zdielana_elektrina': rng.random(n) * 3.5 * season,
+    }
+
+    if revisions:
+        revised_days = np.flatnonzero((rng.random(days) < revisions) & (counts > 0))
+        revised = np.flatnonzero(np.isin(day_index, revised_days))
+        day_index = np.concatenate([day_index, day_index[revised]])
+        period = np.concatenate([period, period[revised]])
+        for name, column in values.items():
+            values[name] = np.concatenate([column, column[revised] * rng.uniform(0.95, 1.05, len(revised))])
+
+    day_names = np.array([date.fromordinal(int(o)).isoformat() + DATUM_FORMATS[datum_format]
+                          for o in ordinals])
+    columns = {'datum': day_names[day_index], 'zuctovacia_perioda': period.astype(str)}
+    columns.update(values)
+    return columns
+
+
+def insert_columns(session, columns, chunk=50000):
+    """Insert generated columns through the ORM session with Core executemany, in chunks."""
+    total = len(columns['datum'])
+    for offset in range(0, total, chunk):
+        part = [columns[name][offset:offset + chunk].tolist() for name in COLUMNS]
+        session.execute(EDCData.__table__.insert(), [dict(zip(COLUMNS, row)) for row in zip(*part)])
+    session.commit()
+    return total
+
+
+def bulk_load(engine, days, start=START_DAY, seed=42, chunk_days=CHUNK_DAYS, **shape):
+    """
+    Generate and write `days` days straight through the DBAPI connection,
+    one transaction per chunk. Returns the number of rows written.
+    """
+    statement = (f"INSERT INTO okte_data ({', '.join(COLUMNS)}) "
+                 f"VALUES ({', '.join('?' for _ in COLUMNS)})")
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == 'sqlite':
+            cursor.execute('PRAGMA synchronous = OFF')
+        written = 0
+        for offset in range(0, days, chunk_days):
+            columns = generate_columns(min(chunk_days, days - offset), start + timedelta(days=offset),
+                                       seed, **shape)
+            cursor.executemany(statement, zip(*(columns[name].tolist() for name in COLUMNS)))
+            raw.commit()
+            written += len(columns['datum'])
+        return written
+    finally:
+        raw.close()
+
+
+def okte_html(day, rows):
+    """A result page in the OKTE table layout the scraper parses (decimal commas)."""
+    cells = ''.join(
+        '<tr>' + ''.join(f'<td>{escape(str(value))}</td>' for value in (
+            row['zuctovacia_perioda'],
+            *(f"{row[m]:.3f}".replace('.', ',') for m in METRIC_COLUMNS),
+        )) + '</tr>\n'
+        for row in rows
+    )
+    return (
+        '<!DOCTYPE html>\n<html lang="sk"><head><meta charset="utf-8">'
+        f'<title>Aktivovaná agregovaná flexibilita a zdieľanie elektriny {day:%d.%m.%Y}</title></head>\n'
+        '<body><form method="post"><input name="date" value="' + f'{day:%d.%m.%Y}' + '">'
+        '<button name="submit" value="Zobraziť">Zobraziť</button></form>\n'
+        '<table class="table">\n<tr><th>Zúčtovacia perióda</th>'
+        '<th>Aktivovaná agregovaná flexibilita kladná [MWh]</th>'
+        '<th>Aktivovaná agregovaná flexibilita záporná [MWh]</th>'
+        '<th>Zdieľaná elektrina [MWh]</th></tr>\n'
+        f'{cells}</table>\n</body></html>\n'
+    )
+
+
+def write_html(columns, directory, limit_days=None):
+    """
+    Write one okte_<YYYY-MM-DD>.html page per day present in the columns
+    (the first `limit_days` of them). A revised day shows its latest values,
+    as the live site would.
+    """
+    os.makedirs(directory, exist_ok=True)
+    days = {}
+    periods = columns['zuctovacia_perioda'].tolist()
+    for i, datum in enumerate(columns['datum'].tolist()):
+        days.setdefault(datum[:10], {})[periods[i]] = i
+    written = sorted(days)[:limit_days]
+    for datum in written:
+        periods = days[datum]
+        rows = [{name: columns[name][i] for name in COLUMNS} for i in periods.values()]
+        with open(os.path.join(directory, f'okte_{datum}.html'), 'w', encoding='utf-8') as f:
+            f.write(okte_html(date.fromisoformat(datum), rows))
+    return len(written)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument('--days', type=int)
+    size.add_argument('--rows', type=int, help='approximate number of rows (96 per day)')
+    parser.add_argument('--db', help='SQLite database to fill (created with the app schema)')
+    parser.add_argument('--start', type=date.fromisoformat, default=START_DAY)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--gap-days', type=float, default=0.0)
+    parser.add_argument('--missing', type=float, default=0.0)
+    parser.add_argument('--revisions', type=float, default=0.0)
+    parser.add_argument('--datum-format', choices=DATUM_FORMATS, default='date')
+    parser.add_argument('--pyramid', action='store_true', help='build the tile pyramid afterwards')
+    parser.add_argument('--html-dir', help='also write OKTE pages for the first --html-days days')
+    parser.add_argument('--html-days', type=int, default=31)
+    args = parser.parse_args(argv)
+
+    days = args.days or -(-args.rows // PERIODS_PER_DAY)
+    shape = dict(gap_days=args.gap_days, missing=args.missing, revisions=args.revisions,
+                 datum_format=args.datum_format)
+
+    if args.db:
+        from app import create_app, db
+        from app.logging_config import stop_logging
+        from app.stats import rebuild_stats
+        from app.tiles import rebuild_pyramid
+
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(args.db)}'})
+        with app.app_context():
+            began = time.perf_counter()
+            rows = bulk_load(db.engine, days, args.start, args.seed, **shape)
+            elapsed = time.perf_counter() - began
+            print(f"{rows} rows for {days} days in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s)")
+            rebuild_stats()
+            if args.pyramid:
+                began = time.perf_counter()
+                rebuild_pyramid()
+                print(f"pyramid built in {time.perf_counter() - began:.1f} s")
+        stop_logging()
+
+    if args.html_dir:
+        # Same chunk as the first one bulk_load writes, so the pages match the database
+        columns = generate_columns(min(days, CHUNK_DAYS), args.start, args.seed, **shape)
+        pages = write_html(columns, args.html_dir, args.html_days)
+        print(f"{pages} pages written to {args.html_dir}")
+
+
+if __name__ == '__main__':
+    main()
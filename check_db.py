@@ -1,47 +1,44 @@
-import sqlite3
-import pandas as pd
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.stats import get_stats
 
 def check_database():
-    try:
-        # Connect to database
-        print("Connecting to database...")
-        conn = sqlite3.connect('okte_data.db')
-        cursor = conn.cursor()
-        
-        # Get all tables
-        print("\nListing all tables:")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        for table in tables:
-            table_name = table[0]
-            print(f"\nTable: {table_name}")
+    app = create_app()
+    with app.app_context():
+        try:
+            # Connect to the configured database
+            print(f"Connecting to database {db.engine.url}...")
+            inspector = inspect(db.engine)
             
-            # Get row count
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
-            print(f"Total records: {count}")
+            # Get all tables
+            print("\nListing all tables:")
+            stats = get_stats()
+            for table_name in inspector.get_table_names():
+                print(f"\nTable: {table_name}")
+                
+                # Get row count; okte_data is counted by ingestion (okte_stats)
+                if table_name == 'okte_data' and stats is not None:
+                    count = stats['rows']
+                else:
+                    count = db.session.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+                print(f"Total records: {count}")
+                
+                # Get column info
+                print("\nColumns:")
+                for col in inspector.get_columns(table_name):
+                    print(f"  {col['name']} ({col['type']})")
+                
+                # Get sample data
+                if count > 0:
+                    print("\nSample data (first 5 rows):")
+                    for row in db.session.execute(text(f"SELECT * FROM {table_name} LIMIT 5")):
+                        print(tuple(row))
             
-            # Get column info
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            print("\nColumns:")
-            for col in columns:
-                print(f"  {col[1]} ({col[2]})")
+            print("\nDatabase check completed successfully")
             
-            # Get sample data
-            if count > 0:
-                print("\nSample data (first 5 rows):")
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-                rows = cursor.fetchall()
-                for row in rows:
-                    print(row)
-        
-        conn.close()
-        print("\nDatabase check completed successfully")
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
+        except Exception as e:
+            print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    check_database() 
\ No newline at end of file
+    check_database()
@@ -0,0 +1,38 @@
+"""
+Production entry point: `python serve.py --workers 4 --threads 8`.
+
+Defaults come from the environment: BIND (host:port, default
+127.0.0.1:8000), WEB_CONCURRENCY (workers, default 1) and THREADS (default
+8). With more than one worker every worker logs to its own
+logs/app.<pid>.log and logs/events.<pid>.jsonl.
+
+For the gunicorn command line use `gunicorn --preload -w 4 wsgi:app`, for
+ASGI `uvicorn asgi:app --workers 4` (or --server uvicorn here).
+"""
+import argparse
+import os
+
+from app import create_app
+from app.serving import SERVERS, serve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bind', default=os.environ.get('BIND', '127.0.0.1:8000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 8)))
+    parser.add_argument('--server', choices=SERVERS, default='auto')
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.workers > 1:
+        config['LOG_FILE'] = os.path.join('logs', 'app.{pid}.log')
+        config['LOG_EVENTS_FILE'] = os.path.join('logs', 'events.{pid}.jsonl')
+    app = create_app(config)
+
+    host, _, port = args.bind.rpartition(':')
+    serve(app, host or '0.0.0.0', int(port), args.workers, args.threads, args.server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,649 @@
+"""
+Behaviour tests on a temporary database, with benchmarks/okte_server.py
+serving the recorded OKTE pages in benchmarks/fixtures:
+
+    python -m pytest -q test_app.py
+"""
+import asyncio
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import create_app, db
+from app.aggregate import aggregate, rollup_available
+from app.analytics import rolling_stats
+from app.asgi import build_environ, create_asgi_app
+from app.compression import _compress_stream
+from app.ingest import store_days
+from app import logging_config
+from app.logging_config import DroppingQueueHandler, RotatingLogFileHandler, stop_logging
+from app.metrics import Histogram, Registry
+from app import scheduler
+from app.models import EDCData
+from app.series import PERIOD_MS
+from app.stats import completeness, expected_periods, missing_bitmap, missing_periods, rebuild_stats
+from app.tiles import rebuild_pyramid
+from benchmarks.okte_server import start_server
+
+SPRING, AUTUMN, WINTER = '2024-03-31', '2024-10-27', '2024-01-15'
+
+
+@pytest.fixture(scope='module')
+def okte():
+    server = start_server()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def config(tmp_path, okte):
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'okte_data.db'}",
+        'OKTE_URL': okte.url,
+        'LOG_FILE': str(tmp_path / 'app.log'),
+        'LOG_EVENTS_FILE': str(tmp_path / 'events.jsonl'),
+        'SCHEMA_LOCK_FILE': str(tmp_path / 'schema.lock'),
+    }
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    yield app
+    stop_logging()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def scrape(client, day):
+    return client.post('/scrape', data={'start_date': day, 'end_date': day})
+
+
+def day_rows(day, periods):
+    return [{
+        'datum': f'{day} 00:00:00',
+        'zuctovacia_perioda': str(period),
+        'aktivovana_agregovana_flexibilita_kladna': 1.0,
+        'aktivovana_agregovana_flexibilita_zaporna': 2.0,
+        'zdielana_elektrina': 3.0,
+    } for period in periods]
+
+
+def insert_rows(rows):
+    db.session.execute(EDCData.__table__.insert(), rows)
+    db.session.commit()
+
+
+def test_small_responses_are_not_compressed(app, client):
+    response = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.get_data()) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    assert client.get('/health', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_export_is_compressed_while_streaming(client, encoding):
+    if encoding == 'br':
+        brotli = pytest.importorskip('brotli')
+    scrape(client, WINTER)
+    plain = client.get('/export').get_data()
+    response = client.get('/export', headers={'Accept-Encoding': f'{encoding}, identity;q=0.5'})
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Content-Length' not in response.headers
+    decompress = gzip.decompress if encoding == 'gzip' else brotli.decompress
+    assert decompress(response.get_data()) == plain
+
+
+def test_each_streamed_chunk_is_flushed():
+    # A client can decode every chunk as soon as it arrives
+    stream = _compress_stream(iter(['id,datum\n', '', '1,2024-01-15\n']), 'gzip', 6)
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(next(stream)) == b'id,datum\n'
+    assert decompressor.decompress(next(stream)) == b'1,2024-01-15\n'
+    decompressor.decompress(next(stream))
+    assert decompressor.eof
+
+
+def test_export_resumes_after_a_row(app, client):
+    # Ids run against datum order, so resuming by id alone would skip or repeat rows
+    with app.app_context():
+        insert_rows(day_rows('2024-02-02', range(1, 97)) + day_rows('2024-02-01', range(1, 97)))
+    lines = client.get('/export?metrics=zdielana_elektrina').get_data(as_text=True).splitlines()
+    header, rows = lines[0], lines[1:]
+    assert header == 'id,datum,zuctovacia_perioda,zdielana_elektrina'
+    assert [row.split(',')[1] for row in rows] == ['2024-02-01'] * 96 + ['2024-02-02'] * 96
+    for cut in (0, 95, 96, 150, len(rows) - 1):
+        after = rows[cut].split(',')[0]
+        resumed = client.get(f'/export?metrics=zdielana_elektrina&after={after}').get_data(as_text=True)
+        assert resumed.splitlines() == [header] + rows[cut + 1:]
+    assert client.get('/export?after=999999').status_code == 400
+
+
+def test_expected_periods():
+    assert expected_periods(SPRING) == 92
+    assert expected_periods(AUTUMN) == 100
+    assert expected_periods(WINTER) == 96
+
+
+@pytest.mark.parametrize('day', [SPRING, AUTUMN, WINTER])
+def test_scraped_day_stays_within_its_day(client, day):
+    assert scrape(client, day).status_code == 200
+    series = client.get(f'/api/series?start={day}&end={day}&points=1000').get_json()
+    assert series['rows'] == expected_periods(day)
+
+    # Wall-clock times encoded as UTC epoch milliseconds
+    midnight = datetime.fromisoformat(day)
+    times = [datetime(1970, 1, 1) + timedelta(milliseconds=t) for t in series['t']]
+    assert all(midnight <= t < midnight + timedelta(days=1) for t in times)
+    hours = {t.hour for t in times}
+    if day == SPRING:
+        assert 2 not in hours and 3 in hours
+    else:
+        assert hours == set(range(24))
+
+
+def test_raw_and_rollup_agree_on_dst_days(client):
+    for day in (SPRING, AUTUMN):
+        scrape(client, day)
+    for interval in ('hour', 'day'):
+        raw = client.get(f'/api/aggregate?interval={interval}&source=raw&stats=count').get_json()
+        rollup = client.get(f'/api/aggregate?interval={interval}&source=rollup&stats=count').get_json()
+        assert raw['bucket'] == rollup['bucket']
+        assert raw['zdielana_elektrina'] == rollup['zdielana_elektrina']
+    day = client.get('/api/aggregate?interval=day&stats=count').get_json()
+    assert day['zdielana_elektrina']['count'] == [92, 100]
+
+
+def test_partial_rollup_falls_back_to_raw(app, client):
+    # Rows bulk-loaded before the upgrade have no pyramid, the scraped day does
+    days = [date(2023, 11, 1) + timedelta(days=i) for i in range(60)]
+    with app.app_context():
+        insert_rows([row for day in days for row in day_rows(day, range(1, 97))])
+        rebuild_stats()
+    scrape(client, WINTER)
+    with app.app_context():
+        counts = aggregate('month', metrics=['zdielana_elektrina'], stats=['count'])
+        assert counts['zdielana_elektrina']['count'] == [30 * 96, 30 * 96, 96]
+        # A range the pyramid does cover still reads the rollup
+        assert rollup_available(date(2024, 1, 15), date(2024, 1, 31))
+        assert not rollup_available(date(2023, 12, 1), date(2024, 1, 31))
+        rebuild_pyramid()
+        assert rollup_available()
+
+
+def test_startup_builds_missing_pyramid(app, config):
+    with app.app_context():
+        insert_rows(day_rows('2024-02-01', range(1, 97)))
+        rebuild_stats()
+    stop_logging()
+    restarted = create_app(config)
+    with restarted.app_context():
+        assert rollup_available()
+        counts = aggregate('day', source='rollup', metrics=['zdielana_elektrina'], stats=['count'])
+        assert counts['zdielana_elektrina']['count'] == [96]
+
+
+def test_series_points_are_capped(client):
+    scrape(client, WINTER)
+    for points in (0, 1):
+        series = client.get(f'/api/series?start={WINTER}&end={WINTER}&points={points}').get_json()
+        assert series['resolution'] == 'minmax'
+        assert len(series['t']) <= 2
+
+
+def test_rolling_std_is_stable_far_from_zero():
+    t = np.arange(96 * 365, dtype=np.int64) * PERIOD_MS
+    values = 1e7 + np.where(np.arange(len(t)) % 2, -1.0, 1.0)
+    values[100] = np.nan
+    rolled = rolling_stats({'t': t, 'x': values})
+    np.testing.assert_allclose(rolled['x_std'][200:], 1.0)
+    np.testing.assert_allclose(rolled['x_mean'][200:], 1e7, atol=1.0)
+
+
+def test_ingest_invalidates_overlapping_analytics(app, client):
+    with app.app_context():
+        insert_rows([row for day in ('2024-02-01', '2024-02-02', '2024-02-03') for row in day_rows(day, range(1, 97))])
+        rebuild_stats()
+
+    def percentiles(start, end):
+        return client.get(f'/api/analytics/percentiles?start={start}&end={end}&q=50&metrics=zdielana_elektrina').get_json()
+
+    assert percentiles('2024-02-01', '2024-02-02')['cached'] is False
+    assert percentiles('2024-02-01', '2024-02-02')['cached'] is True
+    assert percentiles('2024-02-01', '2024-02-01')['cached'] is False
+    # The newest stored day may still change and is never cached
+    assert percentiles('2024-02-02', '2024-02-03')['closed'] is False
+
+    revised = [dict(row, zdielana_elektrina=9.0) for row in day_rows('2024-02-02', range(1, 97))]
+    with app.app_context():
+        store_days([(date(2024, 2, 2), 'ok', revised)])
+    overlapping = percentiles('2024-02-01', '2024-02-02')
+    assert overlapping['cached'] is False
+    assert overlapping['zdielana_elektrina'] == [6.0]
+    assert percentiles('2024-02-01', '2024-02-01')['cached'] is True
+
+
+def test_compare_lines_up_windows(app, client):
+    rows = day_rows('2024-02-01', range(1, 97)) + day_rows('2024-02-02', range(1, 97)) + [
+        dict(row, zdielana_elektrina=5.0) for row in day_rows('2023-02-01', range(1, 97))]
+    with app.app_context():
+        insert_rows(rows)
+        rebuild_stats()
+
+    def compare(query):
+        return client.get(f'/api/compare?metrics=zdielana_elektrina&{query}').get_json()
+
+    result = compare('start=2024-02-01&end=2024-02-02&years=2023&resolution=day')
+    assert result['windows'] == [{'start': '2024-02-01', 'end': '2024-02-02'},
+                                 {'start': '2023-02-01', 'end': '2023-02-02'}]
+    assert result['source'] == 'raw'
+    assert result['zdielana_elektrina'] == [[3.0, 3.0], [5.0, None]]
+    assert len(compare('windows=2024-02-01:2024-02-01&resolution=hour')['offset']) == 24
+
+    # 2023-02-01 is a Wednesday: moved a day on to start on Thursday like 2024-02-01
+    aligned = compare('start=2024-02-01&end=2024-02-02&years=2023&resolution=day&align=weekday')
+    assert aligned['windows'][1] == {'start': '2023-02-02', 'end': '2023-02-03'}
+    assert aligned['zdielana_elektrina'][1] == [None, None]
+
+    with app.app_context():
+        rebuild_pyramid()
+    rollup = compare('start=2024-02-01&end=2024-02-02&years=2023&resolution=day')
+    assert rollup['source'] == 'rollup'
+    assert rollup['zdielana_elektrina'] == result['zdielana_elektrina']
+
+    assert client.get('/api/compare?start=2024-02-01').status_code == 400
+    windows = ','.join(['2024-02-01:2024-02-01'] * 21)
+    assert client.get(f'/api/compare?windows={windows}').status_code == 400
+
+
+def log_record(message):
+    return logging.LogRecord('app.test', logging.INFO, __file__, 0, message, None, None)
+
+
+@pytest.mark.parametrize('policy, kept', [('drop_new', ['1', '2']), ('drop_oldest', ['2', '3'])])
+def test_full_log_queue_drops_records(policy, kept):
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue, policy)
+    for message in ('1', '2', '3'):
+        handler.emit(log_record(message))
+    assert handler.dropped == 1
+    assert [log_queue.get_nowait().getMessage() for _ in range(2)] == kept
+    # The loss is reported once there is room again
+    handler.emit(log_record('4'))
+    assert log_queue.get_nowait().getMessage() == '1 log records dropped because the log queue was full'
+    assert log_queue.get_nowait().getMessage() == '4'
+    assert handler.dropped == 0
+    with pytest.raises(ValueError):
+        DroppingQueueHandler(log_queue, 'block')
+
+
+def test_module_loggers_write_through_the_queue(client, tmp_path):
+    logging.getLogger('app.routes').info('routed through the queue')
+    logging.getLogger('werkzeug').info('werkzeug line')
+    client.get('/health')
+    stop_logging()
+    log = (tmp_path / 'app.log').read_text()
+    assert 'routed through the queue' in log and 'werkzeug line' in log
+    # Events go to their own file only
+    events = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+    assert [event['path'] for event in events if event['event'] == 'request'] == ['/health']
+    assert '"event"' not in log
+
+
+def test_log_rotation_compresses_and_prunes(tmp_path):
+    path = tmp_path / 'app.log'
+    handler = RotatingLogFileHandler(str(path), max_bytes=100, backup_count=2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for i in range(5):
+        handler.emit(log_record(f'record {i} ' + 'x' * 80))
+    handler.close()
+    # Compression and pruning run on the background thread, in order
+    logging_config._background.submit(lambda: None).result()
+    assert handler.rotations == 4
+    backups = sorted(p.name for p in tmp_path.iterdir() if p.name != 'app.log')
+    assert len(backups) == 2 and all(name.endswith('.gz') for name in backups)
+    rotated = sorted(gzip.decompress(p.read_bytes()).decode() for p in tmp_path.glob('app.log.*'))
+    assert [line[:8] for line in rotated] == ['record 2', 'record 3']
+    assert path.read_text().startswith('record 4')
+
+
+def test_log_rotation_by_time(tmp_path):
+    handler = RotatingLogFileHandler(str(tmp_path / 'app.log'), when='6H', compress=False)
+    assert handler.rollover_at == pytest.approx(time.time() + 6 * 3600, abs=5)
+    assert not handler.shouldRollover(log_record('early'))
+    handler.rollover_at = time.time() - 1
+    handler.emit(log_record('due'))
+    handler.close()
+    logging_config._background.submit(lambda: None).result()
+    assert handler.rotations == 1
+    assert len(list(tmp_path.glob('app.log.*'))) == 1
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('edc_test_seconds', 'Test.', ['stage'], buckets=(2, 1))
+    for value in (0.5, 1.5, 5):
+        histogram.labels('say "hi"').observe(value)
+    assert histogram.collect() == [
+        '# HELP edc_test_seconds Test.',
+        '# TYPE edc_test_seconds histogram',
+        'edc_test_seconds_bucket{stage="say \\"hi\\"",le="1.0"} 1',
+        'edc_test_seconds_bucket{stage="say \\"hi\\"",le="2.0"} 2',
+        'edc_test_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 3',
+        'edc_test_seconds_sum{stage="say \\"hi\\""} 7.0',
+        'edc_test_seconds_count{stage="say \\"hi\\""} 3',
+    ]
+    with pytest.raises(ValueError):
+        histogram.labels('a', 'b')
+    registry = Registry()
+    registry.counter('edc_test_total', 'Test.')
+    with pytest.raises(ValueError):
+        registry.counter('edc_test_total', 'Test.')
+
+
+def metric_value(client, sample):
+    """Value of one sample line on /metrics (0 when it is not there yet)."""
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        name, _, value = line.rpartition(' ')
+        if name == sample:
+            return float(value)
+    return 0.0
+
+
+def test_metrics_count_scrapes_requests_and_queries(config, client):
+    samples = ('edc_scrape_days_total{status="ok"}', 'edc_rows_inserted_total',
+               'edc_http_request_duration_seconds_count{method="POST",endpoint="main.scrape",status="200"}',
+               'edc_stage_duration_seconds_count{stage="parse"}', 'edc_db_query_seconds_count')
+    before = {sample: metric_value(client, sample) for sample in samples}
+    scrape(client, WINTER)
+    after = {sample: metric_value(client, sample) for sample in samples}
+    assert after['edc_scrape_days_total{status="ok"}'] - before['edc_scrape_days_total{status="ok"}'] == 1
+    assert after['edc_rows_inserted_total'] - before['edc_rows_inserted_total'] == 96
+    assert after[samples[2]] - before[samples[2]] == 1
+    assert after[samples[3]] - before[samples[3]] == 1
+    assert after['edc_db_query_seconds_count'] > before['edc_db_query_seconds_count']
+    assert client.get('/metrics').content_type == 'text/plain; version=0.0.4; charset=utf-8'
+
+    stop_logging()
+    disabled = create_app({**config, 'METRICS_ENABLED': False}).test_client()
+    assert disabled.get('/metrics').status_code == 404
+
+
+def test_ingest_selects_recent_and_incomplete_days(app):
+    with app.app_context():
+        insert_rows(day_rows('2024-02-01', range(1, 97)) + day_rows('2024-02-02', range(1, 90)))
+        rebuild_stats()
+        days = scheduler.days_to_ingest(date(2024, 2, 5), lookback=1, catchup=5)
+    assert [day.isoformat() for day in days] == [
+        '2024-01-31', '2024-02-02', '2024-02-03', '2024-02-04', '2024-02-05']
+
+
+def test_ingest_retries_failed_days(app, monkeypatch):
+    calls, tried = [], set()
+
+    def ingest_days(days):
+        # Every day fails on its first attempt except the newest
+        statuses = {day: 'error' if day not in tried and day != days[-1] else 'ok' for day in days}
+        calls.append(list(days))
+        tried.update(days)
+        return statuses, 96 * list(statuses.values()).count('ok')
+
+    monkeypatch.setattr('app.ingest.ingest_days', ingest_days)
+    app.config.update(INGEST_LOOKBACK_DAYS=2, INGEST_CATCHUP_DAYS=0, INGEST_BACKOFF_S=0, INGEST_RETRIES=1)
+    result = scheduler.run_ingest(app, today=date(2024, 2, 5))
+    assert [len(days) for days in calls] == [3, 2]
+    assert result['status'] == 'ok'
+    assert result['attempts'] == 2 and result['rows'] == 3 * 96
+
+    # Without retries the failed days are reported
+    app.config['INGEST_RETRIES'] = 0
+    calls.clear()
+    tried.clear()
+    result = scheduler.run_ingest(app, today=date(2024, 2, 5))
+    assert result['status'] == 'partial'
+    assert result['failed'] == ['2024-02-03', '2024-02-04']
+    assert [len(days) for days in calls] == [3]
+
+
+def test_scheduler_catches_up_missed_runs_once(app, monkeypatch):
+    runs = []
+    monkeypatch.setattr(scheduler, 'run_ingest', lambda app, stop=None: runs.append(stop))
+    ingest = scheduler.IngestScheduler(app)
+    # Nothing was ever ingested
+    assert ingest.missed_run(datetime.now())
+    ingest.stop_event.set()
+    ingest.run_forever()
+    assert len(runs) == 1
+
+    scrape(app.test_client(), WINTER)
+    assert not ingest.missed_run(datetime.now())
+    assert ingest.missed_run(datetime.now() + timedelta(days=1))
+    ingest.run_forever()
+    assert len(runs) == 1
+
+
+def asgi_request(asgi, method, path, query='', body=b'', headers=(), disconnect_after=None):
+    """
+    Send one HTTP request through the ASGI app and return the messages it
+    sent. With disconnect_after the client goes away after that many messages.
+    """
+    sent = []
+
+    async def run():
+        gone = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if disconnect_after is not None and len(sent) >= disconnect_after:
+                gone.set()
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                 'headers': [(k.encode(), v.encode()) for k, v in headers]}
+        await asgi(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def test_asgi_serves_requests_from_thread_pools(app):
+    threads = []
+    app.before_request(lambda: threads.append(threading.current_thread().name))
+    asgi = create_asgi_app(app)
+
+    sent = asgi_request(asgi, 'POST', '/scrape', body=f'start_date={WINTER}&end_date={WINTER}'.encode(),
+                        headers=[('Content-Type', 'application/x-www-form-urlencoded')])
+    assert sent[0]['status'] == 200
+    sent = asgi_request(asgi, 'GET', '/api/series', query=f'start={WINTER}&end={WINTER}&points=1000')
+    assert sent[0]['status'] == 200
+    assert (b'content-type', b'application/json') in sent[0]['headers']
+    assert json.loads(b''.join(m.get('body', b'') for m in sent[1:]))['rows'] == 96
+    # /scrape runs on its own small pool
+    assert threads[0].startswith('asgi-slow') and not threads[1].startswith('asgi-slow')
+
+
+def test_asgi_streams_and_stops_on_disconnect(app, client):
+    days = [date(2023, 1, 1) + timedelta(days=i) for i in range(250)]
+    with app.app_context():
+        insert_rows([row for day in days for row in day_rows(day, range(1, 97))])
+    asgi = create_asgi_app(app)
+    full = client.get('/export').get_data()
+
+    sent = asgi_request(asgi, 'GET', '/export')
+    chunks = [m['body'] for m in sent[1:]]
+    assert len([chunk for chunk in chunks if chunk]) > 1
+    assert b''.join(chunks) == full
+    assert not sent[-1].get('more_body')
+
+    # The client leaving after the first batch ends the download early
+    sent = asgi_request(asgi, 'GET', '/export', disconnect_after=2)
+    assert 0 < len(b''.join(m['body'] for m in sent[1:])) < len(full)
+    assert not sent[-1].get('more_body')
+
+
+def test_asgi_lifespan_and_environ(app):
+    messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(create_asgi_app(app)({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+    environ = build_environ({
+        'type': 'http', 'method': 'GET', 'path': '/graph/ž', 'query_string': b'a=1',
+        'headers': [(b'accept', b'text/html'), (b'accept', b'*/*'), (b'content-type', b'text/plain')],
+    }, b'body')
+    assert environ['PATH_INFO'].encode('latin-1').decode('utf-8') == '/graph/ž'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+    assert environ['CONTENT_TYPE'] == 'text/plain' and environ['CONTENT_LENGTH'] == '4'
+    assert environ['wsgi.input'].read() == b'body'
+
+
+def test_missing_bitmap_round_trip():
+    bitmap = missing_bitmap({1, 2, 3, 96, 200}, 96)
+    assert len(bitmap) == 12
+    assert missing_periods(bitmap) == list(range(4, 96))
+    assert missing_periods(missing_bitmap(range(1, 101), 100)) == []
+
+
+def test_completeness_reports_missing_periods(app):
+    with app.app_context():
+        insert_rows(day_rows('2024-02-01', range(1, 97)) + day_rows('2024-02-02', [p for p in range(1, 97) if p != 50]))
+        rebuild_stats()
+        gaps = completeness(date(2024, 2, 1), date(2024, 2, 3))
+    assert gaps['complete_days'] == 1
+    assert gaps['missing_days'] == ['2024-02-03']
+    assert gaps['incomplete_days'] == [{'day': '2024-02-02', 'periods': 95, 'expected': 96, 'missing': [50]}]
+
+
+def test_time_range_labels_count_towards_completeness(app):
+    labels = [f'{m // 60:02d}:{m % 60:02d} - {(m + 15) // 60 % 24:02d}:{(m + 15) % 60:02d}' for m in range(0, 1440, 15)]
+    spring = [label for label in labels if not label.startswith('02:')]
+    with app.app_context():
+        insert_rows(day_rows(WINTER, labels) + day_rows(SPRING, spring) + day_rows(AUTUMN, labels[:-1]))
+        rebuild_stats()
+        assert completeness(date(2024, 1, 15), date(2024, 1, 15))['complete_days'] == 1
+        assert completeness(date(2024, 3, 31), date(2024, 3, 31))['complete_days'] == 1
+        # The repeated autumn hour stands for both of its periods
+        assert completeness(date(2024, 10, 27), date(2024, 10, 27))['incomplete_days'] == [
+            {'day': AUTUMN, 'periods': 99, 'expected': 100, 'missing': [100]}]
+
+
+def test_store_days_keeps_or_replaces(app):
+    day = date(2024, 2, 1)
+    with app.app_context():
+        assert store_days([(day, 'ok', day_rows(day, range(1, 91)))]) == ({day: 'ok'}, 90)
+        # A page with fewer periods than stored does not replace the day
+        assert store_days([(day, 'ok', day_rows(day, range(1, 50)))]) == ({day: 'kept'}, 0)
+        # One with at least as many does, without duplicating rows
+        assert store_days([(day, 'ok', day_rows(day, range(1, 97)))]) == ({day: 'ok'}, 96)
+        assert store_days([(day, 'error', None)]) == ({day: 'error'}, 0)
+        assert db.session.execute(db.text('SELECT COUNT(*) FROM okte_data')).scalar() == 96
+
+
+def test_debug_is_json(client):
+    scrape(client, WINTER)
+    response = client.get('/debug')
+    assert response.status_code == 200
+    tables = {entry['table']: entry for entry in response.get_json()}
+    assert tables['okte_data']['count'] == 96
+    assert tables['okte_day_stats']['sample_data'][0]['missing'] == '00' * 12
+
+
+def test_test_db_reads_configured_database(client):
+    scrape(client, WINTER)
+    result = client.get('/test_db').get_json()
+    assert result['direct_sql']['okte_data_count'] == 96
+
+
+def test_request_id_is_sanitised(config, tmp_path):
+    profiles = tmp_path / 'profiles'
+    client = create_app({**config, 'PROFILING_ENABLED': True, 'PROFILE_DIR': str(profiles)}).test_client()
+    response = client.get('/health', headers={'X-Request-ID': '../a/b', 'X-Profile': 'cprofile'})
+    assert response.status_code == 200
+    assert response.headers['X-Request-ID'] != '../a/b'
+    assert [p.name for p in profiles.iterdir()] == [response.headers['X-Profile-File']]
+    assert client.get('/health', headers={'X-Request-ID': 'job-42_a'}).headers['X-Request-ID'] == 'job-42_a'
+    stop_logging()
+
+
+def test_strict_query_budget_fails_the_request(app, client):
+    scrape(client, WINTER)
+    app.config.update(QUERY_BUDGET=3, QUERY_BUDGET_STRICT=True)
+    assert client.get('/graph').status_code == 500
+    app.config.update(QUERY_BUDGET=None)
+    assert client.get('/graph').status_code == 200
+
+
+def test_fix_duplicates_refreshes_rollup(app):
+    with app.app_context():
+        insert_rows(day_rows('2024-02-01', range(1, 97)) * 2)
+        rebuild_stats()
+        rebuild_pyramid()
+    result = app.test_cli_runner().invoke(args=['edc', 'verify', '--fix-duplicates'])
+    assert 'Deleted 96 duplicate rows' in result.output
+    assert result.exit_code == 0
+    with app.app_context():
+        for source in ('raw', 'rollup'):
+            counts = aggregate('day', source=source, metrics=['zdielana_elektrina'], stats=['count'])
+            assert counts['zdielana_elektrina']['count'] == [96]
+
+
+def test_complete_tiles_are_cached_longer(app, client):
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(31) if i != 20]
+    with app.app_context():
+        insert_rows([row for day in days for row in day_rows(day, range(1, 97))])
+        rebuild_stats()
+
+    def tile(day):
+        # Level 0 tiles span 256 periods (64 hours)
+        return client.get(f'/api/tiles/0/{(day - date(1970, 1, 1)).days * 96 // 256}')
+
+    closed = tile(date(2024, 1, 10))
+    assert closed.get_json()['closed'] is True
+    assert closed.cache_control.max_age == 3600
+    # Complete days can still be replaced, so no tile is immutable
+    assert not closed.cache_control.immutable
+    assert client.get(closed.request.path, headers={'If-None-Match': closed.headers['ETag']}).status_code == 304
+    # Over the gap on 2024-01-21, and before the first stored day
+    for response in (tile(date(2024, 1, 21)), client.get('/api/tiles/0/0')):
+        assert response.get_json()['closed'] is False
+        assert response.cache_control.max_age == 60
+
+
+def test_process_backfill_forwards_worker_events(app, tmp_path):
+    from app.backfill import backfill
+    result = backfill(app, date(2024, 1, 14), date(2024, 1, 16), chunk_days=1, processes=2)
+    assert result['statuses'] == {'ok': 1, 'no_table': 2}
+    assert result['rows'] == 96
+    stop_logging()
+    events = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+    job = next(event['job_id'] for event in events if event['event'] == 'backfill')
+    stages = [event['stage'] for event in events if event['event'] == 'stage' and event['job_id'] == job]
+    assert stages.count('http_get') == stages.count('parse') == 3
@@ -1,47 +1,57 @@
+from sqlalchemy import inspect, text
+
 from app import create_app, db
-from app.models import EDCData
-from datetime import datetime
-import sqlite3
+from app.logging_config import stop_logging
+from app.stats import get_stats
 
-def test_database():
-    app = create_app()
+def show_database(app):
+    """Print each table of the app's database with its row count and sample records."""
     with app.app_context():
-        try:
-            # Test database connection
-            print("Testing database connection...")
-            db.engine.connect()
+        # Test database connection
+        print("Testing database connection...")
+        with db.engine.connect():
             print("✓ Database connection successful")
+        
+        # Get all tables in the database
+        print(f"\nListing all tables in {db.engine.url}:")
+        stats = get_stats()
+        tables = inspect(db.engine).get_table_names()
+        for table_name in tables:
+            print(f"\nTable: {table_name}")
             
-            # Get all tables in the database
-            print("\nListing all tables in the database:")
-            conn = sqlite3.connect('okte_data.db')
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            for table in tables:
-                table_name = table[0]
-                print(f"\nTable: {table_name}")
-                
-                # Get row count
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                count = cursor.fetchone()[0]
-                print(f"Total records: {count}")
-                
-                # Get sample records
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-                columns = [description[0] for description in cursor.description]
-                print("\nColumns:", columns)
-                
-                print("\nSample records:")
-                for row in cursor.fetchall():
-                    print(dict(zip(columns, row)))
-                print("-" * 50)
+            # Get row count; okte_data is counted by ingestion (okte_stats)
+            if table_name == 'okte_data' and stats is not None:
+                count = stats['rows']
+            else:
+                count = db.session.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            print(f"Total records: {count}")
             
-            conn.close()
+            # Get sample records
+            result = db.session.execute(text(f"SELECT * FROM {table_name} LIMIT 5"))
+            columns = list(result.keys())
+            print("\nColumns:", columns)
             
-        except Exception as e:
-            print(f"Error: {str(e)}")
+            print("\nSample records:")
+            for row in result:
+                print(dict(zip(columns, row)))
+            print("-" * 50)
+        return tables
+
+def test_database(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'okte_data.db'}",
+        'LOG_FILE': str(tmp_path / 'app.log'),
+        'LOG_EVENTS_FILE': str(tmp_path / 'events.jsonl'),
+        'SCHEMA_LOCK_FILE': str(tmp_path / 'schema.lock'),
+    })
+    try:
+        assert {'okte_data', 'okte_stats', 'okte_day_stats'} <= set(show_database(app))
+    finally:
+        stop_logging()
 
 if __name__ == "__main__":
-    test_database() 
\ No newline at end of file
+    try:
+        show_database(create_app())
+    except Exception as e:
+        print(f"Error: {str(e)}")
@@ -0,0 +1,12 @@
+"""
+WSGI module for external servers, e.g. `gunicorn --preload -w 4 wsgi:app`.
+Each worker logs to its own logs/app.<pid>.log.
+"""
+import os
+
+from app import create_app
+
+app = create_app({
+    'LOG_FILE': os.path.join('logs', 'app.{pid}.log'),
+    'LOG_EVENTS_FILE': os.path.join('logs', 'events.{pid}.jsonl'),
+})